@@ -6,9 +6,16 @@ import { redisClient } from "../libs/redis";
 import { generateSignedUrl } from "../utils/generateSignedUrl";
 
 
-const getPlaylistFromCacheOrGenerate = async (audioId: string, isAdd: boolean = false) => {
+// A segment URL and its duration in seconds
+type PlaylistSegment = { url: string; duration: number };
+
+// Assumed for segments whose duration the media service did not report
+const DEFAULT_SEGMENT_DURATION = 10.0;
+
+const getPlaylistFromCacheOrGenerate = async (audioId: string, isAdd: boolean = false, quality?: string) => {
     
-    const cacheKey = `playlist:${audioId}`;
+    // Entries hold segments with their durations; the "playlist:" keys holding bare URLs expire on their own
+    const cacheKey = `playlist-segments:${audioId}:${quality || 'default'}`;
 
     // Try to get the playlist from Redis
     const cachedPlaylist = await new Promise((resolve, reject) => {
@@ -19,25 +26,32 @@ const getPlaylistFromCacheOrGenerate = async (audioId: string, isAdd: boolean =
     });
 
     if (cachedPlaylist) {
-        return cachedPlaylist;
+        return { segments: cachedPlaylist as PlaylistSegment[], complete: true };
     }
 
     // If not found in cache, generate a new playlist
-    const newPlaylist = await generateSignedUrl(audioId, isAdd, 1200); // Generate signed URL with 20 minutes expiration
+    const { urls, durations, complete } = await generateSignedUrl(audioId, isAdd, 1200, quality); // Generate signed URL with 20 minutes expiration
+    const newPlaylist: PlaylistSegment[] = urls.map((url, index) => ({
+        url,
+        duration: durations[index] ?? DEFAULT_SEGMENT_DURATION,
+    }));
 
     // Cache the playlist in Redis for performance 19 minutes
     // cache minutes must be less than signed url expiration time
-    redisClient.setex(cacheKey, 1140, JSON.stringify(newPlaylist)); // Cache for 19 minutes
+    // A track still being transcoded (fast start) gains segments on every reload, so it is not cached
+    if (newPlaylist.length > 0 && complete) {
+        redisClient.setex(cacheKey, 1140, JSON.stringify(newPlaylist)); // Cache for 19 minutes
+    }
 
-    return newPlaylist;
+    return { segments: newPlaylist, complete };
 };
 
 
 
-const generatePlaylist = async (baseAudioSegments: any[], addAudioSegment: any) => {
-    const playlist: any[] = [];
+const generatePlaylist = async (baseAudioSegments: PlaylistSegment[], addAudioSegment: PlaylistSegment[]) => {
+    const playlist: PlaylistSegment[] = [];
 
-    if (!addAudioSegment) {
+    if (addAudioSegment.length === 0) {
         return baseAudioSegments;
     }
 
@@ -49,7 +63,7 @@ const generatePlaylist = async (baseAudioSegments: any[], addAudioSegment: any)
 
         // Insert ad after every AD_INTERVAL segments
         if ((i + 1) % AD_INTERVAL === 0) {
-            playlist.push(addAudioSegment);
+            playlist.push(...addAudioSegment);
         }
     }
 
@@ -58,14 +72,23 @@ const generatePlaylist = async (baseAudioSegments: any[], addAudioSegment: any)
 
 
 // Helper to build M3U8 content from playlist
-const buildM3U8Content = async (playlist: string[]) => {
-    let m3u8Content = '#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:10\n#EXT-X-MEDIA-SEQUENCE:0\n';
+// An incomplete playlist is served live-style (EVENT, no ENDLIST) so the player keeps reloading it
+const buildM3U8Content = async (playlist: PlaylistSegment[], complete: boolean = true) => {
+    // The target duration must cover the longest segment, rounded up like the media service does
+    const targetDuration = Math.ceil(Math.max(...playlist.map((segment) => segment.duration)));
+    let m3u8Content = `#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:${targetDuration}\n#EXT-X-MEDIA-SEQUENCE:0\n`;
+
+    if (!complete) {
+        m3u8Content += '#EXT-X-PLAYLIST-TYPE:EVENT\n';
+    }
 
-    playlist.forEach((segmentUrl) => {
-        m3u8Content += `#EXTINF:10.0,\n${segmentUrl}\n`;
+    playlist.forEach((segment) => {
+        m3u8Content += `#EXTINF:${segment.duration.toFixed(6)},\n${segment.url}\n`;
     });
 
-    m3u8Content += '#EXT-X-ENDLIST\n';
+    if (complete) {
+        m3u8Content += '#EXT-X-ENDLIST\n';
+    }
     return m3u8Content;
 };
 
@@ -88,7 +111,12 @@ export const streamController = {
             throw new CustomErrors.NotFoundError("Requested song doesn't exist.");
         }
 
-        const baseAudioSegments = await getPlaylistFromCacheOrGenerate(track.id, false);
+        // serve the rendition matching the listener's stream quality ("low" | "medium" | "high")
+        const preference = req.user
+            ? await prisma.userPreference.findUnique({ where: { userId: req.user.id } })
+            : null;
+
+        const { segments: baseAudioSegments, complete } = await getPlaylistFromCacheOrGenerate(track.id, false, preference?.streamQuality || undefined);
 
         if (!baseAudioSegments || baseAudioSegments.length === 0) {
             throw new CustomErrors.NotFoundError("Audio segments not found for the requested song.");
@@ -96,17 +124,17 @@ export const streamController = {
 
 
         // for free users, get ad audio segment
-        let addAudioSegment: string[] = [];
+        let addAudioSegment: PlaylistSegment[] = [];
         if (subscriptionLevel === "free") {
             // add selection must be dynamic based on various factors
-            // addAudioSegment = await getPlaylistFromCacheOrGenerate("ad-audio-segment-id", true);
+            // addAudioSegment = (await getPlaylistFromCacheOrGenerate("ad-audio-segment-id", true)).segments;
         }
 
         // generate playlist with ads if any
         const playlist = await generatePlaylist(baseAudioSegments, addAudioSegment);
 
         // build m3u8 content
-        const m3u8Content = await buildM3U8Content(playlist);
+        const m3u8Content = await buildM3U8Content(playlist, complete);
 
         console.log("Build m3u8Content: ", m3u8Content);
         
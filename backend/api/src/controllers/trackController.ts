@@ -7,7 +7,7 @@ import { uuidSchema, searchSchema, paginationSchema } from '../validators';
 import { uploadImageToCloudinary } from '../libs/cloudinary';
 import { uploadAudioToS3 } from '../libs/s3Client';
 import { addTrackToMeiliIndex } from '../libs/meili';
-import { metadataEmbeddingQueue, sonicEmbeddingQueue } from '../jobs/audioQueue';
+import { HLS_BULK_MUSIC_PRIORITY, hlsTranscodeQueue, metadataEmbeddingQueue, sonicEmbeddingQueue } from '../jobs/audioQueue';
 
 
 
@@ -83,6 +83,14 @@ export const trackController = {
         // TODO: queue sonic, metadata embedding and LUFS tasks with
         await metadataEmbeddingQueue.add('metadata-embedding', { trackId: newTrack.id });
         await sonicEmbeddingQueue.add('sonic-embedding', { trackId: newTrack.id });
+        // Pre-generate HLS so the first play doesn't wait for a transcode
+        // (jobId matches the media service's, so a cold play never queues a duplicate)
+        await hlsTranscodeQueue.add('hls-transcode', { audioId: newTrack.id, isAdd: false }, {
+            jobId: `music-${newTrack.id}`,
+            priority: HLS_BULK_MUSIC_PRIORITY,
+            removeOnComplete: true,
+            removeOnFail: true,
+        });
 
 
         // Return the response
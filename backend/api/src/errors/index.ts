@@ -38,6 +38,12 @@ export class UnauthorizedError extends CustomError {
     }
 }
 
+export class ServiceUnavailableError extends CustomError {
+    constructor(message: string) {
+        super(StatusCodes.SERVICE_UNAVAILABLE, message);
+    }
+}
+
 
 export const CustomErrors = {
     UnauthenticatedError,
@@ -46,4 +52,5 @@ export const CustomErrors = {
     ForbiddenError,
     ConflictError,
     UnauthorizedError,
+    ServiceUnavailableError,
 }
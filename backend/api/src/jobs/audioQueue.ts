@@ -10,3 +10,10 @@ export const audioEmbeddingQueue = createQueue('audio-embedding');
 export const lufsNormalizationQueue = createQueue('lufs-normalization');
 export const metadataEmbeddingQueue = createQueue('metadata-embedding');
 export const sonicEmbeddingQueue = createQueue('sonic-embedding');
+export const hlsTranscodeQueue = createQueue('hls-transcode');
+
+// BullMQ priority of upload-time transcodes, so cold plays go first. Must
+// equal the media service's transcode_priority for the bulk-music lane: its
+// 1-based position in TRANSCODE_LANE_ORDER (config.py). Change both together;
+// the media service's tests/test_transcode_queue.py pins the value
+export const HLS_BULK_MUSIC_PRIORITY = 4;
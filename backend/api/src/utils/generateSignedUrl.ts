@@ -1,17 +1,32 @@
 import { mediaServer } from "../libs/axios";
+import { CustomErrors } from "../errors";
 
 
-export const generateSignedUrl = async (audioId: string, isAdd: boolean = false, expiresInSeconds?: number) => {
+export const generateSignedUrl = async (audioId: string, isAdd: boolean = false, expiresInSeconds?: number, quality?: string) => {
     
     // Generate the presigned URL
+    let response;
     try {
-        const response = await mediaServer.get('/signed_url', { params: { 
+        response = await mediaServer.get('/signed_url', { params: { 
             audio_id: audioId, 
             is_add: isAdd, 
-            expiration: expiresInSeconds } });
-        return response.data?.data || [];
+            expiration: expiresInSeconds,
+            quality } });
     } catch(e) {
         console.error('Error generating signed URL', e);
         throw new Error('Error generating signed URL');
     }
+
+    // 202: the media service has queued the HLS transcode for this track
+    if (response.status === 202) {
+        throw new CustomErrors.ServiceUnavailableError('Audio is still being prepared, please retry shortly.');
+    }
+
+    // complete is false while a fast-start transcode is still publishing segments;
+    // durations holds the seconds of each segment, read from the track's manifest
+    return {
+        urls: (response.data?.data || []) as string[],
+        durations: (response.data?.durations || []) as number[],
+        complete: response.data?.complete !== false,
+    };
 }
@@ -0,0 +1,256 @@
+"""
+Benchmark the media service against a local S3 stand-in (MinIO or moto).
+
+Synthetic tones of the requested lengths are uploaded to the source bucket,
+transcoded with generate_hls and then served through /signed_url/, so every
+run measures the same work. Results are printed (or written) as JSON, meant
+to be diffed between commits.
+
+Point the usual S3_* and Redis settings at the stand-in, then run from the
+media service directory:
+
+    python -m benchmarks.media_bench --durations 30 180 600 --requests 2000 --output bench.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+import httpx
+from prometheus_client import REGISTRY
+from libs.s3_client import get_client
+from config.config import settings
+from utils.generate_hls import HLS_BUCKET_NAME, SOURCE_BUCKET, generate_hls
+from utils.signed_url_cache import invalidate_signed_urls
+
+
+def _percentiles(samples: list[float]) -> dict:
+    # Milliseconds, rounded for readable diffs
+    if len(samples) < 2:
+        value = round(samples[0] * 1000, 3) if samples else None
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+    }
+
+
+def _metric(name: str, labels: dict | None = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def ensure_buckets():
+    """
+    Create the source and HLS buckets on a fresh stand-in.
+    """
+    existing = {bucket["Name"] for bucket in get_client().list_buckets().get("Buckets", [])}
+    for bucket_name in (SOURCE_BUCKET, HLS_BUCKET_NAME):
+        if bucket_name not in existing:
+            get_client().create_bucket(Bucket=bucket_name)
+
+
+def upload_synthetic_track(duration: int, sample_rate: int = 44100) -> str:
+    """
+    Encode a synthetic track of the given length and upload it as a new source track.
+    Args:
+        :param duration: Length of the track in seconds.
+        :param sample_rate: Sample rate of the tone.
+    :return: The audio ID of the uploaded track.
+    """
+    audio_id = str(uuid.uuid4())
+
+    with tempfile.NamedTemporaryFile(suffix=".mp3") as source:
+        # A sweep rather than a constant tone, so the encoder does real work
+        subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-y",
+                "-f", "lavfi", "-i", f"sine=frequency=220:beep_factor=4:sample_rate={sample_rate}:duration={duration}",
+                "-f", "lavfi", "-i", f"anoisesrc=color=pink:amplitude=0.05:sample_rate={sample_rate}:duration={duration}",
+                "-filter_complex", "amix=inputs=2,aformat=channel_layouts=stereo",
+                "-c:a", "libmp3lame", "-b:a", "192k", source.name
+            ],
+            check=True
+        )
+        get_client().upload_file(source.name, SOURCE_BUCKET, f"music/{audio_id}")
+
+    return audio_id
+
+
+def bench_generate_hls(durations: list[int], repeats: int) -> tuple[list[dict], list[str]]:
+    """
+    Time end-to-end transcodes of synthetic tracks.
+    Args:
+        :param durations: Track lengths in seconds.
+        :param repeats: Transcodes per length.
+    :return: One result per length, and the audio IDs of the transcoded tracks.
+    """
+    results = []
+    audio_ids = []
+
+    # Untimed: starts the loudness process pool and the upload threads
+    generate_hls(upload_synthetic_track(5))
+
+    for duration in durations:
+        latencies = []
+        uploaded_bytes = 0.0
+        upload_seconds = 0.0
+
+        for _ in range(repeats):
+            audio_id = upload_synthetic_track(duration)
+            bytes_before = _metric("media_bytes_total", {"direction": "upload"})
+            seconds_before = _metric("media_s3_upload_seconds_sum")
+
+            started = time.perf_counter()
+            result = generate_hls(audio_id)
+            latencies.append(time.perf_counter() - started)
+
+            if result.get("status") != "success":
+                raise RuntimeError(f"generate_hls failed for {audio_id}: {result.get('message')}")
+
+            uploaded_bytes += _metric("media_bytes_total", {"direction": "upload"}) - bytes_before
+            upload_seconds += _metric("media_s3_upload_seconds_sum") - seconds_before
+            audio_ids.append(audio_id)
+
+        results.append({
+            "duration_s": duration,
+            "runs": repeats,
+            "mean_s": round(statistics.mean(latencies), 3),
+            "min_s": round(min(latencies), 3),
+            "max_s": round(max(latencies), 3),
+            "realtime_factor": round(duration / statistics.mean(latencies), 1),
+            "uploaded_bytes": int(uploaded_bytes),
+            # Over the whole transcode, and over the time spent inside uploads
+            "upload_bytes_per_s": round(uploaded_bytes / sum(latencies)),
+            "upload_bytes_per_upload_s": round(uploaded_bytes / upload_seconds) if upload_seconds else None,
+        })
+        print(f"generate_hls {duration}s: {results[-1]}")
+
+    return results, audio_ids
+
+
+async def _load(http: httpx.AsyncClient, audio_ids: list[str], requests: int, concurrency: int) -> dict:
+    latencies = []
+    failures = 0
+    next_request = 0
+
+    async def run():
+        nonlocal failures, next_request
+        while next_request < requests:
+            index = next_request
+            next_request += 1
+            audio_id = audio_ids[index % len(audio_ids)]
+
+            started = time.perf_counter()
+            response = await http.get("/signed_url/", params={"audio_id": audio_id, "expiration": 1200})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "failures": failures,
+        "requests_per_s": round(requests / elapsed, 1),
+        **_percentiles(latencies),
+    }
+
+
+async def bench_signed_url(audio_ids: list[str], requests: int, concurrency: int) -> dict:
+    """
+    Load /signed_url/ in-process (httpx over ASGI, no network server).
+
+    Cold requests run with the signed URL cache disabled, so each one reads the
+    folder manifest and signs every segment; warm requests are served from Redis.
+    Args:
+        :param audio_ids: Transcoded tracks to request, round robin.
+        :param requests: Requests per phase.
+        :param concurrency: Requests in flight at once.
+    :return: Throughput and latency percentiles of both phases.
+    """
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            # Warm connections and imports outside the measurement
+            await http.get("/signed_url/", params={"audio_id": audio_ids[0]})
+
+            cache_enabled = settings.signed_url_cache.signed_url_cache_enabled
+            settings.signed_url_cache.signed_url_cache_enabled = False
+            try:
+                cold = await _load(http, audio_ids, requests, concurrency)
+            finally:
+                settings.signed_url_cache.signed_url_cache_enabled = cache_enabled
+
+            for audio_id in audio_ids:
+                invalidate_signed_urls(audio_id)
+            await _load(http, audio_ids, len(audio_ids), 1)
+            warm = await _load(http, audio_ids, requests, concurrency)
+
+    return {"cold": cold, "warm": warm}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the media service against a local S3 stand-in.")
+    parser.add_argument("--durations", type=int, nargs="+", default=[30, 180], help="Synthetic track lengths in seconds")
+    parser.add_argument("--transcode-repeats", type=int, default=1, help="generate_hls runs per length")
+    parser.add_argument("--requests", type=int, default=1000, help="/signed_url/ requests per phase")
+    parser.add_argument("--concurrency", type=int, default=32, help="/signed_url/ requests in flight")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    ensure_buckets()
+
+    transcodes, audio_ids = bench_generate_hls(args.durations, args.transcode_repeats)
+    signed_url = asyncio.run(bench_signed_url(audio_ids, args.requests, args.concurrency))
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "s3_endpoint": settings.s3_storage.s3_endpoint,
+        "settings": {
+            "hls_source_input": settings.hls.hls_source_input,
+            "hls_adaptive_bitrate": settings.hls.hls_adaptive_bitrate,
+            "hls_single_file": settings.hls.hls_single_file,
+            "loudness_normalization_enabled": settings.loudness.loudness_normalization_enabled,
+            "s3_upload_concurrency": settings.s3_storage.s3_upload_concurrency,
+        },
+        "generate_hls": transcodes,
+        "signed_url": signed_url,
+    }
+
+    content = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(content + "\n")
+        print(f"Benchmark report written to {args.output}")
+    else:
+        print(content)
+
+
+if __name__ == "__main__":
+    main()
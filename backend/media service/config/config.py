@@ -35,12 +35,157 @@ class S3StorageConfig(BaseSettingClass):
     s3_secret_access_key: str = ""
     s3_bucket_name: str = "addis-music"
     hls_bucket_name: str = "hls-playlist"
+    # Size of the shared urllib3 connection pool of the S3 client
+    s3_max_pool_connections: int = 32
+    # Parallel segment uploads per process; keep at or below the pool size
+    s3_upload_concurrency: int = 16
+    # Attempts per object before an upload is reported as failed
+    s3_upload_attempts: int = 3
+    # Seconds an idle keep-alive connection of the async S3 client stays open
+    s3_keepalive_timeout: float = 30.0
+
+
+class SignedUrlCacheConfig(BaseSettingClass):
+    signed_url_cache_enabled: bool = True
+    # Fraction of the URL lifetime a cached entry may be served for, so a
+    # cached URL always keeps at least (1 - ratio) of its validity.
+    signed_url_cache_ttl_ratio: float = 0.5
+    # Requested expirations are rounded up to a multiple of this many seconds
+    # so nearby values share one cache entry.
+    signed_url_cache_bucket_seconds: int = 60
+    # Unsigned playlist templates only change when a folder is regenerated
+    playlist_template_ttl: int = 86400
+
+
+class PlaylistConfig(BaseSettingClass):
+    # Public base URL of the media service, used for lazily signed segment
+    # redirects. Falls back to the request's base URL when empty.
+    media_public_url: str = ""
+
+class HLSConfig(BaseSettingClass):
+    # How ffmpeg reads the source: "url" (presigned GET), "pipe" (stdin) or
+    # "file" (download to a temporary file first)
+    hls_source_input: str = "url"
+    # Seconds between scans for finished segments while ffmpeg is encoding
+    hls_segment_poll_interval: float = 0.5
+    # Encode every rendition below in one ffmpeg pass and write a master playlist
+    hls_adaptive_bitrate: bool = False
+    # Rendition name (matching UserPreference.streamQuality) -> AAC bitrate
+    hls_renditions: dict[str, str] = {"low": "64k", "medium": "128k", "high": "256k"}
+    # Rendition served when the caller does not ask for a quality
+    hls_default_rendition: str = "medium"
+    # Fast start: publish a live-style playlist as soon as this many segments
+    # are uploaded and finalize it as VOD when encoding ends (0 disables)
+    hls_fast_start_segments: int = 2
+    # Write each rendition as one fragmented MP4 addressed by byte ranges
+    # instead of one .ts object per segment, so a track needs a single
+    # upload and a single signed URL. Served through /playlist; disables fast start
+    hls_single_file: bool = False
+    # Store min/max waveform peaks (waveform.dat, audiowaveform format) next
+    # to the segments, computed from the same decode as the HLS encode
+    hls_waveform_enabled: bool = True
+    # Samples (at 22.05 kHz) per peak bucket, and 8 or 16 bits per value
+    hls_waveform_samples_per_pixel: int = 1024
+    hls_waveform_bits: int = 8
+
+
+class TranscodeConfig(BaseSettingClass):
+    # Upper bound on one transcode; the single-flight lock expires after it
+    transcode_lock_timeout: int = 900
+    # Retry-After hint (seconds) returned while a track is still being prepared
+    transcode_retry_after: int = 5
+    # Number of transcode jobs one worker process takes from the queue at
+    # once, highest BullMQ priority (see the lane order) first. They wait in
+    # the scheduler below, which decides what runs
+    transcode_worker_concurrency: int = 8
+    # Transcodes running at once per worker process (0: one per CPU). Not
+    # shared between replicas; each one budgets its own CPUs and disk
+    transcode_cpu_slots: int = 0
+    # Scratch-disk bytes the running transcodes of one worker process may use
+    # together (0: a share of the free space on /tmp at start-up, see the ratio)
+    transcode_scratch_budget_bytes: int = 0
+    transcode_scratch_budget_ratio: float = 0.8
+    # Scratch use assumed for any transcode (playlists, in-flight segments),
+    # and single-file output bytes per source byte
+    transcode_scratch_overhead_bytes: int = 32 * 1024 * 1024
+    transcode_single_file_size_ratio: float = 2.0
+    # Admission order of the priority lanes; cold plays have a listener
+    # waiting. Also the BullMQ priority of their jobs (first lane: 1). The
+    # API hardcodes bulk-music's as HLS_BULK_MUSIC_PRIORITY = 4 (its
+    # jobs/audioQueue.ts): reordering the lanes means changing it too
+    transcode_lane_order: list[str] = ["interactive-add", "interactive-music", "bulk-add", "bulk-music"]
+    # A job waiting longer than this is admitted next whatever its lane
+    transcode_starvation_seconds: float = 600.0
+    # After a transient failure (e.g. an upload error) requests wait this
+    # long before queueing the transcode again
+    transcode_failure_backoff_seconds: int = 60
+    # A missing (404) or undecodable (422) source is reported for this long
+    # before a request may try it again; an upload-time job retries at once
+    transcode_permanent_failure_ttl: int = 3600
+
+
+class LoudnessConfig(BaseSettingClass):
+    # Measure each source (BS.1770) and apply a gain while transcoding
+    loudness_normalization_enabled: bool = True
+    loudness_target_lufs: float = -14.0
+    # Cap on positive gain. 0 only turns loud tracks down; boosting quiet
+    # tracks can clip their peaks
+    loudness_max_gain_db: float = 0.0
+    # Processes measuring loudness in parallel
+    loudness_workers: int = 2
+    # A track published unmeasured by a cold play is transcoded again once
+    # measured, but only when its gain is at least this large
+    loudness_correction_threshold_db: float = 1.0
+
+
+class EvictionConfig(BaseSettingClass):
+    # Play timestamps are buffered per process and written to Redis in one
+    # batch every interval, or sooner once this many folders are pending
+    hls_access_flush_interval: float = 10.0
+    hls_access_flush_max_pending: int = 1000
+    # Seconds between garbage collection passes
+    hls_gc_interval: int = 3600
+    # Folders not played for this long are evicted (0 disables)
+    hls_gc_idle_window: int = 30 * 86400
+    # Least recently played folders are evicted while the bucket holds more
+    # than this many bytes (0 means no budget)
+    hls_gc_storage_budget_bytes: int = 0
+    # Never evict a folder played more recently than this, whatever the budget
+    hls_gc_min_idle: int = 86400
+    # Objects deleted per DeleteObjects call
+    hls_gc_delete_batch: int = 1000
+
+
+class MetricsConfig(BaseSettingClass):
+    # Prometheus metrics: /metrics on the API, a separate port on the worker
+    metrics_enabled: bool = True
+    metrics_worker_port: int = 9101
+
+
+class ServerConfig(BaseSettingClass):
+    # Threads of the executor that runs the few blocking calls left on the
+    # async routes; bounded so bursts queue instead of spawning threads
+    blocking_executor_workers: int = 8
+    # Most tracks one POST /signed_url/batch request may resolve
+    signed_url_batch_max_items: int = 100
+    # /readyz re-checks Redis and S3 at most this often, each check bounded by the timeout
+    readiness_cache_seconds: float = 2.0
+    readiness_timeout: float = 2.0
+
 
 class Settings():
     database: DatabaseConfig = DatabaseConfig()
     redis: RedisConfig = RedisConfig()
     cloudinary: CloudinaryConfig = CloudinaryConfig()
     s3_storage: S3StorageConfig = S3StorageConfig()
+    signed_url_cache: SignedUrlCacheConfig = SignedUrlCacheConfig()
+    playlist: PlaylistConfig = PlaylistConfig()
+    hls: HLSConfig = HLSConfig()
+    transcode: TranscodeConfig = TranscodeConfig()
+    loudness: LoudnessConfig = LoudnessConfig()
+    eviction: EvictionConfig = EvictionConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    server: ServerConfig = ServerConfig()
 
 
 settings = Settings()
@@ -1,9 +1,10 @@
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
 from config.config import settings
 
-print("Connecting to Redis at "
-      f"{settings.redis.host}:{settings.redis.port}, DB: {settings.redis.db}")
-
+# redis-py clients open their first connection on the first command, so
+# creating them here costs nothing at import; connect_redis() does the
+# actual connect (and reports it) during start-up
 redis_connection = Redis(
     settings.redis.host,
     settings.redis.port,
@@ -15,3 +16,22 @@ connection_url = (
     f"redis://:{settings.redis.password}@"
     f"{settings.redis.host}:{settings.redis.port}/{settings.redis.db}"
 )
+
+# Shared by the async routes; connects on first use and is closed by the
+# FastAPI lifespan
+async_redis_connection = AsyncRedis(
+    host=settings.redis.host,
+    port=settings.redis.port,
+    db=settings.redis.db,
+    password=settings.redis.password
+)
+
+
+async def connect_redis():
+    """
+    Open the first async Redis connection, so the first request does not pay for it.
+    :raises redis.exceptions.ConnectionError: If Redis is unreachable.
+    """
+    print("Connecting to Redis at "
+          f"{settings.redis.host}:{settings.redis.port}, DB: {settings.redis.db}")
+    await async_redis_connection.ping()
@@ -1,14 +1,96 @@
+import threading
 import boto3
+from contextlib import AsyncExitStack
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.config import Config
 from config.config import settings
 
-try:
-    client = boto3.client(
+# Created on first use rather than at import: building a boto3 client loads
+# the botocore service model, which dominated the service's import time
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the shared sync S3 client, creating it on first use.
+    :return: The S3 client, or None if it could not be created.
+    """
+    global _client
+
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            try:
+                _client = boto3.client(
+                    's3',
+                    endpoint_url=settings.s3_storage.s3_endpoint,
+                    aws_access_key_id=settings.s3_storage.s3_access_key_id,
+                    aws_secret_access_key=settings.s3_storage.s3_secret_access_key,
+                    region_name=settings.s3_storage.s3_region,
+                    config=Config(
+                        # Shared, bounded keep-alive pool for parallel uploads and signing
+                        max_pool_connections=settings.s3_storage.s3_max_pool_connections,
+                        retries={"mode": "standard"},
+                        # SigV4 presigned URLs, also built in batches by utils.presigner
+                        signature_version="s3v4"
+                    )
+                )
+            except Exception as error:
+                print("Failed to create S3 client: ", error)
+    return _client
+
+
+# Async client used by the request path, opened and closed by the FastAPI lifespan
+_async_client = None
+_async_exit_stack = None
+
+
+async def open_async_client():
+    """
+    Create the shared async S3 client and its keep-alive connection pool.
+    :return: The async S3 client.
+    """
+    global _async_client, _async_exit_stack
+
+    if _async_client is not None:
+        return _async_client
+
+    exit_stack = AsyncExitStack()
+    _async_client = await exit_stack.enter_async_context(get_session().create_client(
         's3',
         endpoint_url=settings.s3_storage.s3_endpoint,
         aws_access_key_id=settings.s3_storage.s3_access_key_id,
         aws_secret_access_key=settings.s3_storage.s3_secret_access_key,
-        region_name=settings.s3_storage.s3_region
-    )
-except Exception as error:
-    print("Failed to create S3 client: ", error)
-    client = None
+        region_name=settings.s3_storage.s3_region,
+        config=AioConfig(
+            max_pool_connections=settings.s3_storage.s3_max_pool_connections,
+            connector_args={"keepalive_timeout": settings.s3_storage.s3_keepalive_timeout},
+            retries={"mode": "standard"},
+            signature_version="s3v4"
+        )
+    ))
+    _async_exit_stack = exit_stack
+    return _async_client
+
+
+async def close_async_client():
+    """
+    Close the shared async S3 client and its connection pool.
+    """
+    global _async_client, _async_exit_stack
+
+    if _async_exit_stack is not None:
+        await _async_exit_stack.aclose()
+    _async_client, _async_exit_stack = None, None
+
+
+async def get_async_client():
+    """
+    Return the shared async S3 client, opening it on first use outside the lifespan.
+    :return: The async S3 client.
+    """
+    return _async_client or await open_async_client()
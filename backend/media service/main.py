@@ -1,28 +1,50 @@
-# from bullmq import Worker
-# import asyncio
-
-# async def process(job):
-#     print("Received job:", job.data)
-#     # Do audio processing, LUFS normalization, etc.
-#     return {"status": "done"}
-
-# worker = Worker(
-#     "audio-tasks",
-#     process,
-#     connection={"host": "localhost", "port": 6379}
-# )
-
-# asyncio.get_event_loop().run_forever()
-
+import time
 
+# Taken before the heavy imports, so start-up timings cover them
+_import_started = time.perf_counter()
 
+import asyncio
+from contextlib import asynccontextmanager
 from typing import Union
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from prometheus_client import make_asgi_app
+from config.config import settings
 from routers.generate_signed_url import router as signed_url_router
-
-
-app = FastAPI()
+from routers.playlist import router as playlist_router
+from routers.transcode import router as transcode_router
+from utils.transcode_queue import TranscodeFailed, TranscodePending, enqueue_transcode
+from utils.executor import shutdown_executor
+from utils.access_tracker import flush_access_async
+from utils.readiness import mark_imported, mark_started, readiness
+from libs.redis import async_redis_connection, connect_redis
+from libs.s3_client import close_async_client, get_client, open_async_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients are created here rather than at import, so the process starts
+    # answering /livez at once and /readyz only passes once they are up
+    try:
+        # One pooled keep-alive async S3 client per process, shared by all requests
+        await open_async_client()
+        await connect_redis()
+        # Building the sync client loads the botocore service model; keep it off the loop
+        await asyncio.to_thread(get_client)
+    except Exception as e:
+        # Keep serving; /readyz reports the failing dependency until it recovers
+        print(f"Error warming up clients: {e}")
+    mark_started(_import_started)
+    yield
+    # Don't lose the play timestamps still buffered in this process
+    await flush_access_async()
+    await close_async_client()
+    await async_redis_connection.aclose()
+    shutdown_executor()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,11 +54,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(TranscodePending)
+async def transcode_pending_handler(request: Request, exc: TranscodePending):
+    # Queue the transcode (deduplicated by job ID) and ask the client to retry
+    try:
+        backoff = await enqueue_transcode(exc.audio_id, exc.is_add)
+    except TranscodeFailed as failed:
+        # The source is missing (404) or undecodable (422); retrying won't help
+        return JSONResponse(
+            status_code=failed.status_code,
+            content={"success": False, "status": "failed", "reason": failed.reason, "message": str(failed)},
+        )
+
+    retry_after = max(exc.retry_after, backoff)
+    return JSONResponse(
+        status_code=202,
+        content={"success": False, "status": "preparing", "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/livez")
+def liveness_check():
+    # The process is up and serving; restart only if this stops answering
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness_check():
+    # Route traffic only once start-up finished and Redis and S3 answer
+    ready, report = await readiness()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not ready", **report},
+    )
+
+if settings.metrics.metrics_enabled:
+    # Served from in-process counters, so scraping never touches S3 or Redis
+    app.mount("/metrics", make_asgi_app())
+
 app.include_router(signed_url_router, prefix="/signed_url", tags=["Signed URL"])
+app.include_router(playlist_router, prefix="/playlist", tags=["Playlist"])
+app.include_router(transcode_router, prefix="/transcode", tags=["Transcode"])
+
+mark_imported(_import_started)
 
 if __name__ == "__main__":
     app.run()
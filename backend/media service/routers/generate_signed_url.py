@@ -1,24 +1,41 @@
-from fastapi import APIRouter, Query
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
 import json
 from pydantic import BaseModel, Field, UUID4
-from utils.generate_signed_url import generate_signed_urls_for_folder
+from config.config import settings
+from utils.generate_signed_url import (
+    generate_signed_urls_for_folder_async,
+    generate_signed_urls_for_folders_async,
+    generate_signed_waveform_url_async,
+)
+from utils.playlist import get_playlist_template_async
+from utils.transcode_queue import TranscodeFailed, enqueue_transcode
 
 router = APIRouter()
 
 class SignResponse(BaseModel):
     success: bool
+    # False while a fast-start transcode is still publishing segments: the
+    # list will grow, so callers should not cache it or mark it ENDLIST
+    complete: bool = True
+    # One URL per segment object; a single-file fMP4 track has just one and is
+    # played through /playlist, which adds its byte ranges
     data: list[str] = Field(..., example=[
         "https://signed-url-example.com/audio/segment_000.ts?signature=abc123",
         "https://signed-url-example.com/audio/segment_001.ts?signature=def456",
         "https://signed-url-example.com/audio/segment_002.ts?signature=ghi789"
     ])
+    # Seconds of audio in each entry of data, from the folder manifest (or the
+    # playlist of legacy folders), for callers building their own #EXTINF lines
+    durations: list[float] = Field([], example=[10.0, 10.0, 4.52])
 
 
 @router.get("/", response_model=SignResponse)
-def get_signed_url(
+async def get_signed_url(
     audio_id: UUID4 = Query(..., example="65614671-2214-4818-b3d1-454e-be39-c82afdd2748e"),
     is_add: bool = Query(False, example=False),
-    expiration: int = Query(1200, example=1200)  # 20 minutes in seconds  
+    expiration: int = Query(1200, example=1200),  # 20 minutes in seconds  
+    quality: str | None = Query(None, example="medium")  # UserPreference.streamQuality
 ):
     """
     Generate a signed URL for the requested object using query parameters.
@@ -26,13 +43,139 @@ def get_signed_url(
 
     audio_id_str = str(audio_id)
 
-    signed_urls = generate_signed_urls_for_folder(
+    template = await get_playlist_template_async(audio_id_str, is_add=is_add, quality=quality)
+    if template is None:
+        return SignResponse(success=True, data=[])
+
+    # Segments of a single-file rendition share one object, which plays for all of them
+    durations = {}
+    for key, duration in template["segments"]:
+        durations[key] = durations.get(key, 0.0) + duration
+
+    # The template already holds the folder's keys, so its manifest is not read again
+    signed_urls, complete = await generate_signed_urls_for_folder_async(
         audio_id_str,
         is_add=is_add,
-        expiration=expiration
+        expiration=expiration,
+        quality=quality,
+        segment_keys=list(durations),
+        complete=template.get("complete", True)
     )
+    signed_keys = [key for key in durations if key in signed_urls]
 
     return SignResponse(
         success=True,
-        data=list(signed_urls.values())
+        complete=complete,
+        data=[signed_urls[key] for key in signed_keys],
+        durations=[round(durations[key], 6) for key in signed_keys]
+    )
+
+
+class WaveformData(BaseModel):
+    url: str
+    # audiowaveform .dat (version 2): header, then min/max per bucket and channel
+    format: str
+    bits: int
+    samples_per_pixel: int
+    size: int
+
+
+class WaveformResponse(BaseModel):
+    success: bool
+    data: WaveformData
+
+
+@router.get("/waveform", response_model=WaveformResponse)
+async def get_signed_waveform_url(
+    audio_id: UUID4 = Query(..., example="65614671-2214-4818-b3d1-454e-be39-c82afdd2748e"),
+    is_add: bool = Query(False, example=False),
+    expiration: int = Query(1200, example=1200)  # 20 minutes in seconds
+):
+    """
+    Generate a signed URL for the precomputed waveform peaks of a track.
+    """
+
+    signed = await generate_signed_waveform_url_async(str(audio_id), is_add=is_add, expiration=expiration)
+    if signed is None:
+        raise HTTPException(status_code=404, detail="Waveform not found")
+
+    url, waveform = signed
+    return WaveformResponse(
+        success=True,
+        data=WaveformData(url=url, **{key: value for key, value in waveform.items() if key != "key"})
     )
+
+
+class BatchSignItem(BaseModel):
+    audio_id: UUID4
+    is_add: bool = False
+
+
+class BatchSignRequest(BaseModel):
+    items: list[BatchSignItem] = Field(
+        ..., min_length=1, max_length=settings.server.signed_url_batch_max_items
+    )
+    expiration: int = Field(1200, example=1200)  # 20 minutes in seconds
+    quality: str | None = Field(None, example="medium")
+
+
+class BatchSignResult(BaseModel):
+    audio_id: str
+    is_add: bool
+    # "ready", "preparing" (transcode queued, retry after retry_after seconds) or "error"
+    status: str
+    complete: bool = True
+    data: list[str] = []
+    retry_after: int | None = None
+    message: str | None = None
+
+
+class BatchSignResponse(BaseModel):
+    success: bool
+    results: list[BatchSignResult]
+
+
+@router.post("/batch", response_model=BatchSignResponse)
+async def get_signed_urls_batch(request: BatchSignRequest):
+    """
+    Generate signed URLs for several tracks at once, e.g. to prefetch a playlist
+    or an autoplay queue. Each track gets its own status; tracks without HLS
+    yet are queued for transcoding instead of failing the whole request.
+    """
+
+    # Repeated tracks are resolved once
+    folders = list(dict.fromkeys((str(item.audio_id), item.is_add) for item in request.items))
+
+    outcomes = await generate_signed_urls_for_folders_async(
+        folders,
+        expiration=request.expiration,
+        quality=request.quality
+    )
+
+    pending = [index for index, outcome in enumerate(outcomes) if outcome["status"] == "preparing"]
+    queued = await asyncio.gather(
+        *(enqueue_transcode(*folders[index]) for index in pending),
+        return_exceptions=True
+    )
+    for index, backoff in zip(pending, queued):
+        if isinstance(backoff, TranscodeFailed):
+            outcomes[index] = {"status": "error", "message": str(backoff)}
+        elif isinstance(backoff, Exception):
+            print(f"Error queueing transcode for {folders[index][0]}: {backoff}")
+        else:
+            outcomes[index]["retry_after"] = max(outcomes[index]["retry_after"], backoff)
+
+    results = [
+        BatchSignResult(
+            audio_id=audio_id,
+            is_add=is_add,
+            status=outcome["status"],
+            complete=outcome.get("complete", True),
+            data=list(outcome.get("urls", {}).values()),
+            retry_after=outcome.get("retry_after"),
+            message=outcome.get("message"),
+        )
+        for (audio_id, is_add), outcome in zip(folders, outcomes)
+    ]
+
+    return BatchSignResponse(success=True, results=results)
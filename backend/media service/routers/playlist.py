@@ -0,0 +1,133 @@
+from urllib.parse import urlencode
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import RedirectResponse, Response
+from pydantic import UUID4
+from config.config import settings
+from utils.generate_signed_url import (
+    HLS_BUCKET_NAME,
+    generate_signed_urls_for_folder_async,
+    normalize_quality,
+    sign_object_keys_async,
+    sign_segment_window_async,
+)
+from utils.playlist import get_playlist_template_async, render_master_playlist, render_playlist
+
+router = APIRouter()
+
+PLAYLIST_MEDIA_TYPE = "application/vnd.apple.mpegurl"
+
+
+def _route_url(request: Request, name: str, params: dict) -> str:
+    path = request.app.url_path_for(name)
+    base_url = settings.playlist.media_public_url or str(request.base_url)
+    query = urlencode({key: value for key, value in params.items() if value is not None})
+    return f"{base_url.rstrip('/')}{path}?{query}"
+
+
+@router.get("/", response_class=Response, name="get_signed_playlist")
+async def get_signed_playlist(
+    request: Request,
+    audio_id: UUID4 = Query(..., example="65614671-2214-4818-b3d1-454e-be39-c82afdd2748e"),
+    is_add: bool = Query(False, example=False),
+    expiration: int = Query(1200, example=1200),  # 20 minutes in seconds
+    window: int | None = Query(None, ge=1, example=6),
+    quality: str | None = Query(None, example="medium")
+):
+    """
+    Return a ready-to-play m3u8 playlist with signed segment URIs.
+
+    When `window` is set only the first `window` segments are signed; the rest
+    point at /playlist/segment, which signs one window at a time on demand.
+    For multi-rendition tracks requested without `quality`, a master playlist
+    pointing back at this endpoint once per rendition is returned instead.
+    Single-file fMP4 renditions are addressed by byte ranges of one object, so
+    one signed URL covers the whole track and `window` is ignored.
+    """
+
+    audio_id_str = str(audio_id)
+    quality = normalize_quality(quality)
+
+    template = await get_playlist_template_async(audio_id_str, is_add=is_add, quality=quality)
+    if template is None:
+        raise HTTPException(status_code=404, detail="Audio segments not found")
+
+    params = {
+        "audio_id": audio_id_str,
+        "is_add": str(is_add).lower(),
+        "expiration": expiration,
+        "window": window,
+    }
+
+    if template["variants"] and quality is None:
+        variant_uris = {
+            name: _route_url(request, "get_signed_playlist", {**params, "quality": name})
+            for name in template["variants"]
+        }
+        return Response(content=render_master_playlist(template, variant_uris), media_type=PLAYLIST_MEDIA_TYPE)
+
+    segment_keys = [key for key, _ in template["segments"]]
+    init = template.get("init")
+    init_uri = None
+
+    if window is None or init:
+        # The template already holds the folder's keys, so its manifest is not read again
+        signed_urls, _ = await generate_signed_urls_for_folder_async(
+            audio_id_str, is_add=is_add, expiration=expiration, quality=quality,
+            segment_keys=segment_keys, complete=template.get("complete", True)
+        )
+        uris = [signed_urls.get(key) for key in segment_keys]
+
+        if init:
+            # The init section normally lives in the same object as the segments
+            init_uri = signed_urls.get(init["key"]) or (
+                await sign_object_keys_async(HLS_BUCKET_NAME, [init["key"]], expiration)
+            ).get(init["key"])
+            if not init_uri:
+                raise HTTPException(status_code=502, detail="Failed to sign audio segments")
+    else:
+        signed_urls = await sign_segment_window_async(
+            audio_id_str, segment_keys, 0, window,
+            is_add=is_add, expiration=expiration, quality=quality, complete=template.get("complete", True)
+        )
+        uris = [signed_urls.get(key) for key in segment_keys[:window]]
+        uris += [
+            _route_url(request, "get_signed_segment", {**params, "quality": quality, "index": index})
+            for index in range(window, len(segment_keys))
+        ]
+
+    if not all(uris):
+        raise HTTPException(status_code=502, detail="Failed to sign audio segments")
+
+    return Response(content=render_playlist(template, uris, init_uri), media_type=PLAYLIST_MEDIA_TYPE)
+
+
+@router.get("/segment", name="get_signed_segment")
+async def get_signed_segment(
+    audio_id: UUID4 = Query(...),
+    index: int = Query(..., ge=0),
+    window: int = Query(..., ge=1),
+    is_add: bool = Query(False),
+    expiration: int = Query(1200),
+    quality: str | None = Query(None)
+):
+    """
+    Redirect to the signed URL of one segment, signing its whole window at once.
+    """
+
+    audio_id_str = str(audio_id)
+
+    template = await get_playlist_template_async(audio_id_str, is_add=is_add, quality=quality)
+    if template is None or index >= len(template["segments"]):
+        raise HTTPException(status_code=404, detail="Audio segment not found")
+
+    segment_keys = [key for key, _ in template["segments"]]
+    signed_urls = await sign_segment_window_async(
+        audio_id_str, segment_keys, index, window,
+        is_add=is_add, expiration=expiration, quality=quality, complete=template.get("complete", True)
+    )
+
+    signed_url = signed_urls.get(segment_keys[index])
+    if not signed_url:
+        raise HTTPException(status_code=502, detail="Failed to sign audio segment")
+
+    return RedirectResponse(signed_url, status_code=302)
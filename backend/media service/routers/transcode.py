@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Query
+from pydantic import BaseModel, UUID4
+from config.config import settings
+from utils.hls_manifest import folder_prefix, list_segment_keys_async, load_manifest_async
+from utils.transcode_queue import READY, get_queue_stats, get_transcode_status_async
+
+router = APIRouter()
+
+HLS_BUCKET_NAME = settings.s3_storage.hls_bucket_name or "hls-playlist"
+
+
+class TranscodeStatus(BaseModel):
+    state: str
+    message: str = ""
+    # With "failed": source_missing, undecodable or transient
+    reason: str = ""
+    updated_at: str | None = None
+
+
+class TranscodeStatusResponse(BaseModel):
+    success: bool
+    data: TranscodeStatus
+
+
+@router.get("/status", response_model=TranscodeStatusResponse)
+async def get_transcode_job_status(
+    audio_id: UUID4 = Query(..., example="65614671-2214-4818-b3d1-454e-be39-c82afdd2748e"),
+    is_add: bool = Query(False, example=False)
+):
+    """
+    Report whether the HLS rendition of a track is queued, processing, ready or failed.
+    """
+
+    audio_id_str = str(audio_id)
+
+    status = await get_transcode_status_async(audio_id_str, is_add)
+    if status is None:
+        # No job on record: folders generated before the queue existed are still ready,
+        # and legacy ones without a manifest are ready once their playlist is listed
+        prefix = folder_prefix(audio_id_str, is_add)
+        ready = await load_manifest_async(HLS_BUCKET_NAME, prefix) is not None \
+            or bool(await list_segment_keys_async(HLS_BUCKET_NAME, prefix))
+        status = {"state": READY if ready else "missing"}
+
+    return TranscodeStatusResponse(success=True, data=TranscodeStatus(**status))
+
+
+class TranscodeQueueStats(BaseModel):
+    counts: dict[str, int]
+    lane_counts: dict[str, int] = {}
+    oldest_wait_seconds: float | None = None
+
+
+class TranscodeQueueResponse(BaseModel):
+    success: bool
+    data: TranscodeQueueStats
+
+
+@router.get("/queue", response_model=TranscodeQueueResponse)
+async def get_transcode_queue_stats():
+    """
+    Report the transcode backlog (job counts by state and by lane, and the
+    oldest waiting job's age), for sizing worker nodes. Per-lane depth and admission wait
+    times are exported by each worker's metrics endpoint.
+    """
+
+    stats = await get_queue_stats()
+    return TranscodeQueueResponse(success=True, data=TranscodeQueueStats(**stats))
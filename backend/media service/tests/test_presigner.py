@@ -0,0 +1,138 @@
+"""
+utils.presigner builds presigned GET URLs itself on the hot path. They must
+stay byte-identical to boto3's, or players get 403s. These tests freeze the
+clock for both and compare URLs across endpoints, regions, addressing
+styles and awkward keys. No network is used: presigning is offline.
+
+Run from the media service directory:
+
+    python -m pytest tests
+"""
+import datetime
+import types
+import boto3
+import botocore.auth
+import pytest
+from botocore.config import Config
+from config.config import settings
+from utils import presigner
+
+ACCESS_KEY = "AKIDEXAMPLE"
+SECRET_KEY = "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY"
+
+FROZEN = [
+    datetime.datetime(2026, 3, 14, 15, 9, 26, tzinfo=datetime.timezone.utc),
+    # Last second of a day: the signing key and scope change at midnight
+    datetime.datetime(2026, 12, 31, 23, 59, 59, tzinfo=datetime.timezone.utc),
+]
+
+ENDPOINTS = [
+    "http://127.0.0.1:9000",           # MinIO
+    "http://localhost:5055/",          # trailing slash
+    "https://s3.example.com",          # default port dropped from the host
+    "https://s3.example.com:443",      # ... even when spelled out
+    "http://MinIO.Internal:9000",      # host is signed lowercase
+    "https://storage.example.com/s3",  # endpoint with a path prefix
+    "http://[::1]:9000",               # IPv6
+]
+
+REGIONS = ["us-east-1", "eu-central-1", "ap-southeast-2"]
+
+KEYS = [
+    "music/65614671-2214-4818-b3d1-454ebe39c82a/segment_000.ts",
+    "music/65614671-2214-4818-b3d1-454ebe39c82a/playlist.m3u8",
+    "add/with space/and+plus.ts",
+    "music/ünïcödé/日本語/🎵.ts",
+    "music/reserved !'()*$&,;=@:[]/x.ts",
+    "music/%2F already-encoded %20.ts",
+    "music/tilde~dash-under_dot.ts",
+    "music//double//slashes/.ts",
+]
+
+
+def _client(endpoint_url, region, addressing_style=None):
+    s3 = {"addressing_style": addressing_style} if addressing_style else None
+    return boto3.client(
+        "s3",
+        endpoint_url=endpoint_url,
+        region_name=region,
+        aws_access_key_id=ACCESS_KEY,
+        aws_secret_access_key=SECRET_KEY,
+        config=Config(signature_version="s3v4", s3=s3),
+    )
+
+
+class _FrozenDatetime(datetime.datetime):
+    frozen = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.frozen if tz else cls.frozen.replace(tzinfo=None)
+
+
+@pytest.fixture
+def use_client(monkeypatch):
+    monkeypatch.setattr(settings.s3_storage, "s3_access_key_id", ACCESS_KEY)
+    monkeypatch.setattr(settings.s3_storage, "s3_secret_access_key", SECRET_KEY)
+
+    def use(client, now):
+        monkeypatch.setattr(presigner, "get_client", lambda: client)
+        # The presigner reads datetime.datetime.now(timezone.utc), botocore get_current_datetime()
+        _FrozenDatetime.frozen = now
+        monkeypatch.setattr(presigner, "datetime", types.SimpleNamespace(datetime=_FrozenDatetime, timezone=datetime.timezone))
+        monkeypatch.setattr(botocore.auth, "get_current_datetime", lambda remove_tzinfo=True: now.replace(tzinfo=None))
+        return client
+
+    return use
+
+
+def _boto3_urls(client, bucket, keys, expiration):
+    return {
+        key: client.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=expiration)
+        for key in keys
+    }
+
+
+@pytest.mark.parametrize("now", FROZEN)
+@pytest.mark.parametrize("region", REGIONS)
+@pytest.mark.parametrize("endpoint_url", ENDPOINTS)
+@pytest.mark.parametrize("addressing_style", [None, "path"])
+def test_local_urls_match_boto3(use_client, endpoint_url, region, addressing_style, now):
+    client = use_client(_client(endpoint_url, region, addressing_style), now)
+    assert presigner.can_presign_locally()
+
+    for expiration in (60, 1200, 604800):
+        local = presigner.presign_get_urls("hls-playlist", KEYS, expiration)
+        assert local == _boto3_urls(client, "hls-playlist", KEYS, expiration)
+        assert list(local) == KEYS
+
+
+@pytest.mark.parametrize("bucket", ["hls-playlist", "addis-music", "bucket.with.dots"])
+def test_bucket_names_match_boto3(use_client, bucket):
+    client = use_client(_client("http://127.0.0.1:9000", "us-east-1", "path"), FROZEN[0])
+    assert presigner.presign_get_urls(bucket, KEYS, 1200) == _boto3_urls(client, bucket, KEYS, 1200)
+
+
+@pytest.mark.parametrize(
+    "endpoint_url, addressing_style",
+    [
+        ("http://127.0.0.1:9000", "virtual"),
+        (None, None),       # AWS itself: virtual-hosted by default
+        (None, "virtual"),
+    ],
+)
+def test_virtual_hosted_style_falls_back_to_boto3(use_client, endpoint_url, addressing_style):
+    client = use_client(_client(endpoint_url, "eu-central-1", addressing_style), FROZEN[0])
+    assert not presigner.can_presign_locally()
+    assert presigner.presign_get_urls("hls-playlist", KEYS, 1200) == _boto3_urls(client, "hls-playlist", KEYS, 1200)
+
+
+def test_aws_endpoint_with_path_style_is_signed_locally(use_client):
+    client = use_client(_client(None, "us-west-2", "path"), FROZEN[0])
+    assert presigner.can_presign_locally()
+    assert presigner.presign_get_urls("hls-playlist", KEYS, 1200) == _boto3_urls(client, "hls-playlist", KEYS, 1200)
+
+
+def test_no_keys(use_client):
+    use_client(_client("http://127.0.0.1:9000", "us-east-1"), FROZEN[0])
+    assert presigner.presign_get_urls("hls-playlist", [], 1200) == {}
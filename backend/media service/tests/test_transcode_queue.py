@@ -0,0 +1,134 @@
+"""
+A cold play must be pulled from Redis ahead of the upload-time backlog,
+including when its track's upload-time job is already waiting there.
+These tests run against a real Redis (the REDIS_* settings) on a
+throw-away queue, and take the jobs with a real BullMQ worker. They are
+skipped when Redis is unreachable.
+
+Run from the media service directory:
+
+    python -m pytest tests
+"""
+import asyncio
+import uuid
+import pytest
+from bullmq import Queue, Worker
+from redis.exceptions import ConnectionError
+from libs.redis import async_redis_connection, connection_url, redis_connection
+from utils import transcode_queue
+from utils.transcode_queue import TRANSCODE_QUEUE_NAME, enqueue_transcode, transcode_job_id, transcode_priority
+
+BULK_MUSIC_PRIORITY = 4
+
+
+@pytest.fixture(autouse=True)
+def queue(monkeypatch):
+    try:
+        redis_connection.ping()
+    except ConnectionError:
+        pytest.skip("Redis is not reachable")
+
+    queue = Queue(f"test-{TRANSCODE_QUEUE_NAME}-{uuid.uuid4()}", {"connection": connection_url})
+    monkeypatch.setattr(transcode_queue, "_queue", queue)
+    yield queue
+
+
+def _run(queue: Queue, scenario):
+    async def main():
+        try:
+            return await scenario()
+        finally:
+            await queue.obliterate(force=True)
+            await queue.close()
+            # The shared client's connections belong to this event loop
+            await async_redis_connection.connection_pool.disconnect()
+
+    return asyncio.run(main())
+
+
+async def _upload(queue: Queue, audio_id: str):
+    # What the API queues after an upload
+    await queue.add(TRANSCODE_QUEUE_NAME, {"audioId": audio_id, "isAdd": False}, {
+        "jobId": transcode_job_id(audio_id),
+        "priority": BULK_MUSIC_PRIORITY,
+        "removeOnComplete": True,
+        "removeOnFail": True,
+    })
+
+
+async def _processing_order(queue: Queue, count: int) -> list[str]:
+    # Take every job with one worker, one at a time
+    order = []
+    done = asyncio.Event()
+
+    async def process(job, token):
+        order.append(job.data["audioId"])
+        if len(order) == count:
+            done.set()
+
+    worker = Worker(queue.name, process, {"connection": connection_url, "concurrency": 1})
+    try:
+        await asyncio.wait_for(done.wait(), 30)
+    finally:
+        await worker.close()
+    return order
+
+
+def _clear_status(audio_ids: list[str]):
+    for audio_id in audio_ids:
+        transcode_queue.clear_transcode_status(audio_id)
+        redis_connection.delete(transcode_queue._interactive_key(audio_id, False))
+
+
+def test_bulk_priority_matches_lane_order():
+    # The API hardcodes the upload-time priority (HLS_BULK_MUSIC_PRIORITY)
+    assert transcode_priority(False, False) == BULK_MUSIC_PRIORITY
+    assert transcode_priority(False, True) < BULK_MUSIC_PRIORITY
+
+
+def test_cold_play_is_taken_before_the_backlog(queue):
+    backlog = [str(uuid.uuid4()) for _ in range(5)]
+    cold = str(uuid.uuid4())
+
+    async def scenario():
+        for audio_id in backlog:
+            await _upload(queue, audio_id)
+        await enqueue_transcode(cold)
+        return await _processing_order(queue, len(backlog) + 1)
+
+    try:
+        order = _run(queue, scenario)
+    finally:
+        _clear_status(backlog + [cold])
+
+    assert order[0] == cold
+    assert order[1:] == backlog
+
+
+def test_waiting_upload_job_is_promoted_once(queue):
+    backlog = [str(uuid.uuid4()) for _ in range(5)]
+    played, later = backlog[3], backlog[1]
+
+    async def scenario():
+        for audio_id in backlog:
+            await _upload(queue, audio_id)
+        await enqueue_transcode(played)
+        await enqueue_transcode(later)
+        # Asking again must not move it behind the other promoted job
+        await enqueue_transcode(played)
+
+        job = await queue.getJob(transcode_job_id(played))
+        promoted = (job.priority, job.data.get("interactive"), await queue.getJobCounts("prioritized"))
+        return promoted, await _processing_order(queue, len(backlog))
+
+    try:
+        (priority, interactive, counts), order = _run(queue, scenario)
+    finally:
+        _clear_status(backlog)
+
+    assert priority == transcode_priority(False, True)
+    assert interactive is True
+    # Promoted, not duplicated
+    assert counts["prioritized"] == len(backlog)
+    assert order[:2] == [played, later]
+    assert order[2:] == [audio_id for audio_id in backlog if audio_id not in (played, later)]
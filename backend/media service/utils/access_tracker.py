@@ -0,0 +1,153 @@
+import threading
+import time
+from libs.redis import async_redis_connection, redis_connection
+from config.config import settings
+
+# Sorted set of HLS folders scored by their last play (unix seconds)
+ACCESS_KEY = "hls:access"
+# Hash of HLS folders and their stored size in bytes
+SIZE_KEY = "hls:size"
+
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def folder_member(audio_id: str, is_add: bool = False) -> str:
+    """
+    Build the member name of an HLS folder in the access and size keys.
+    """
+    return f"{'add' if is_add else 'music'}:{audio_id}"
+
+
+def parse_folder_member(member) -> tuple[str, bool]:
+    """
+    Split a member name back into (audio_id, is_add).
+    """
+    if isinstance(member, bytes):
+        member = member.decode()
+    kind, audio_id = member.split(":", 1)
+    return audio_id, kind == "add"
+
+
+def _take_due() -> dict:
+    # Hand over the buffered timestamps once the flush interval or size is reached
+    global _pending, _last_flush
+
+    with _pending_lock:
+        due = (
+            len(_pending) >= settings.eviction.hls_access_flush_max_pending
+            or time.monotonic() - _last_flush >= settings.eviction.hls_access_flush_interval
+        )
+        if not due or not _pending:
+            return {}
+
+        batch, _pending = _pending, {}
+        _last_flush = time.monotonic()
+        return batch
+
+
+def _take_all() -> dict:
+    global _pending, _last_flush
+
+    with _pending_lock:
+        batch, _pending = _pending, {}
+        _last_flush = time.monotonic()
+        return batch
+
+
+def _buffer(audio_id: str, is_add: bool):
+    with _pending_lock:
+        _pending[folder_member(audio_id, is_add)] = int(time.time())
+
+
+def record_access(audio_id: str, is_add: bool = False):
+    """
+    Note that an HLS folder was played. Timestamps are buffered in memory and
+    written to Redis in one batch every hls_access_flush_interval seconds.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    """
+    _buffer(audio_id, is_add)
+    batch = _take_due()
+    if batch:
+        flush_access(batch)
+
+
+async def record_access_async(audio_id: str, is_add: bool = False):
+    """
+    Async counterpart of record_access.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    """
+    _buffer(audio_id, is_add)
+    batch = _take_due()
+    if batch:
+        await flush_access_async(batch)
+
+
+def flush_access(batch: dict | None = None):
+    """
+    Write buffered access timestamps to Redis.
+    Args:
+        :param batch: Member -> timestamp, defaults to everything buffered.
+    """
+    batch = _take_all() if batch is None else batch
+    if not batch:
+        return
+
+    try:
+        # gt: a slower replica never moves a timestamp backwards
+        redis_connection.zadd(ACCESS_KEY, batch, gt=True)
+    except Exception as e:
+        print(f"Error flushing {len(batch)} HLS access timestamps: {e}")
+
+
+async def flush_access_async(batch: dict | None = None):
+    """
+    Async counterpart of flush_access.
+    Args:
+        :param batch: Member -> timestamp, defaults to everything buffered.
+    """
+    batch = _take_all() if batch is None else batch
+    if not batch:
+        return
+
+    try:
+        await async_redis_connection.zadd(ACCESS_KEY, batch, gt=True)
+    except Exception as e:
+        print(f"Error flushing {len(batch)} HLS access timestamps: {e}")
+
+
+def register_folder(audio_id: str, is_add: bool, size: int):
+    """
+    Track a freshly generated HLS folder, counting its generation as an access.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+        :param size: Bytes stored in the folder.
+    """
+    member = folder_member(audio_id, is_add)
+    try:
+        pipeline = redis_connection.pipeline()
+        pipeline.zadd(ACCESS_KEY, {member: int(time.time())}, gt=True)
+        pipeline.hset(SIZE_KEY, member, size)
+        pipeline.execute()
+    except Exception as e:
+        print(f"Error registering HLS folder {member}: {e}")
+
+
+def forget_folder(audio_id: str, is_add: bool):
+    """
+    Stop tracking an evicted HLS folder.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    """
+    member = folder_member(audio_id, is_add)
+    pipeline = redis_connection.pipeline()
+    pipeline.zrem(ACCESS_KEY, member)
+    pipeline.hdel(SIZE_KEY, member)
+    pipeline.execute()
@@ -0,0 +1,31 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config.config import settings
+
+# Dedicated, bounded pool for blocking calls made from async routes, so they
+# neither stall the event loop nor compete with FastAPI's sync route threads
+blocking_executor = ThreadPoolExecutor(
+    max_workers=settings.server.blocking_executor_workers,
+    thread_name_prefix="media-blocking"
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function on the bounded executor.
+    Args:
+        :param func: The function to call.
+        :param args: Positional arguments for func.
+        :param kwargs: Keyword arguments for func.
+    :return: The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(blocking_executor, functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executor():
+    """
+    Wait for queued blocking calls and stop the executor.
+    """
+    blocking_executor.shutdown(wait=True)
@@ -1,6 +1,23 @@
 import subprocess
 import os
-from libs.s3_client import client
+import threading
+import time
+from libs.s3_client import get_client
+from utils.signed_url_cache import invalidate_signed_urls
+from utils.access_tracker import register_folder
+from utils.hls_manifest import (
+    MANIFEST_NAME,
+    build_manifest,
+    folder_prefix,
+    load_manifest,
+    progress_manifest,
+    published_segment_count,
+    upload_manifest,
+)
+from utils.loudness import resolve_loudness
+from utils.metrics import BYTES_MOVED, FFMPEG_CPU_SECONDS, FFMPEG_WALL_SECONDS, S3_DOWNLOAD_SECONDS, TRANSCODES_IN_FLIGHT
+from utils.s3_uploader import UploadBatch, upload_object
+from utils.waveform import WAVEFORM_NAME, PeaksBuilder, start_peaks_reader, waveform_output_args
 import datetime
 import tempfile
 from config.config import settings
@@ -8,89 +25,500 @@ import shutil
 
 HLS_BUCKET_NAME = settings.s3_storage.hls_bucket_name or "hls-playlist"
 SOURCE_BUCKET = settings.s3_storage.s3_bucket_name
+PLAYLIST_NAME = "master.m3u8"
+VARIANT_PLAYLIST_NAME = "playlist.m3u8"
+# Media object of a single-file fMP4 rendition
+SINGLE_FILE_NAME = "media.mp4"
 
+# Encoding parameters, recorded in each folder's manifest
+FFMPEG_PARAMS = {
+    "codec": "aac",
+    "bitrate": "128k",
+    "hls_time": 10,
+}
 
-def generate_hls(audio_id: str, is_add: bool = False):
+
+def _url_input_args(object_key: str) -> list[str]:
+    # Presigned for as long as a transcode may run
+    source_url = get_client().generate_presigned_url(
+        'get_object',
+        Params={'Bucket': SOURCE_BUCKET, 'Key': object_key},
+        ExpiresIn=settings.transcode.transcode_lock_timeout
+    )
+    return ["-reconnect", "1", "-reconnect_streamed", "1", "-i", source_url]
+
+
+def _feed_stdin(process: subprocess.Popen, object_key: str):
+    # Stream the source object into ffmpeg's stdin chunk by chunk; the timing
+    # includes ffmpeg's back-pressure, i.e. it is download plus decode bound
+    started = time.monotonic()
+    try:
+        body = get_client().get_object(Bucket=SOURCE_BUCKET, Key=object_key)["Body"]
+        for chunk in body.iter_chunks(chunk_size=1024 * 1024):
+            process.stdin.write(chunk)
+            BYTES_MOVED.labels(direction="download").inc(len(chunk))
+        S3_DOWNLOAD_SECONDS.labels(mode="pipe").observe(time.monotonic() - started)
+    except (BrokenPipeError, ValueError):
+        # ffmpeg exited early; its return code reports the failure
+        pass
+    except Exception as e:
+        print(f"Error streaming {object_key} to ffmpeg: {e}")
+    finally:
+        try:
+            process.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+
+def _reap(process: subprocess.Popen):
+    # Reap ffmpeg with wait4 to get its own resource usage; RUSAGE_CHILDREN
+    # would mix in every other transcode running in this process
+    pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+    if pid == 0:
+        return None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return rusage
+
+
+def _renditions():
+    # Rendition name -> audio bitrate, or None for the single 128k rendition
+    if not settings.hls.hls_adaptive_bitrate:
+        return None
+    return dict(settings.hls.hls_renditions)
+
+
+def _gain_args(gain_db: float) -> list[str]:
+    return ["-af", f"volume={gain_db}dB"] if gain_db else []
+
+
+def _hls_output_args(output_dir: str, renditions: dict | None, gain_db: float = 0.0, single_file: bool = False) -> list[str]:
+    # Loudness normalization is applied to every rendition in the encoding pass
+    gain = _gain_args(gain_db)
+
+    common = [
+        "-f", "hls",
+        "-hls_time", str(FFMPEG_PARAMS["hls_time"]),
+        "-hls_list_size", "0",
+    ]
+
+    if single_file:
+        # One fragmented MP4 per rendition, its init section and segments
+        # addressed by EXT-X-MAP / EXT-X-BYTERANGE
+        common += [
+            "-hls_flags", "independent_segments+single_file",
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", "init_%v.mp4" if renditions else "init.mp4",
+        ]
+        segment_name = SINGLE_FILE_NAME
+    else:
+        common += ["-hls_flags", "independent_segments+temp_file"]
+        segment_name = "segment_%03d.ts"
+
+    if not renditions:
+        return [
+            *gain,
+            "-c:a", FFMPEG_PARAMS["codec"], "-b:a", FFMPEG_PARAMS["bitrate"],
+            *common,
+            "-hls_segment_filename", f"{output_dir}/{segment_name}",
+            f"{output_dir}/{PLAYLIST_NAME}"
+        ]
+
+    # One decode feeding one AAC encoder per rendition, written as
+    # {name}/playlist.m3u8 plus a master playlist referencing them all
+    names = list(renditions)
+    args = []
+    for _ in names:
+        args += ["-map", "0:a"]
+    args += [*gain, "-c:a", FFMPEG_PARAMS["codec"]]
+    for index, name in enumerate(names):
+        args += [f"-b:a:{index}", renditions[name]]
+
+    return args + [
+        *common,
+        "-master_pl_name", PLAYLIST_NAME,
+        "-var_stream_map", " ".join(f"a:{index},name:{name}" for index, name in enumerate(names)),
+        "-hls_segment_filename", f"{output_dir}/%v/{segment_name}",
+        f"{output_dir}/%v/{VARIANT_PLAYLIST_NAME}"
+    ]
+
+
+def _submit_finished_segments(output_dir: str, prefix: str, uploaded: dict, batch: UploadBatch, extension: str = ".ts"):
+    # With the temp_file flag ffmpeg renames a segment to .ts only once it is
+    # complete, so every .ts file in the directory is safe to upload. Single-file
+    # renditions (.mp4) are only submitted after ffmpeg exits.
+    for root, _, files in os.walk(output_dir):
+        for file in sorted(files):
+            if not file.endswith(extension):
+                continue
+
+            file_path = os.path.join(root, file)
+            name = os.path.relpath(file_path, output_dir)
+            if name in uploaded:
+                continue
+
+            uploaded[name] = os.path.getsize(file_path)
+
+            # Uploaded in parallel; the local file is removed to free scratch space
+            batch.submit(file_path, f"{prefix}{name}", remove_after=True)
+
+
+def _manifest_layout(renditions: dict | None, loudness: dict | None, single_file: bool = False):
+    # Variant playlists, encoding parameters and default rendition of the manifest
+    ffmpeg_params = dict(FFMPEG_PARAMS)
+    if single_file:
+        ffmpeg_params["segment_type"] = "fmp4"
+    if loudness:
+        ffmpeg_params["loudness"] = {key: loudness[key] for key in ("integrated_lufs", "gain_db", "target_lufs")}
+
+    if not renditions:
+        return {}, ffmpeg_params, None
+
+    ffmpeg_params["renditions"] = renditions
+    variants = {name: f"{name}/{VARIANT_PLAYLIST_NAME}" for name in renditions}
+    return variants, ffmpeg_params, settings.hls.hls_default_rendition
+
+
+def _publish_progress(output_dir: str, prefix: str, uploaded: dict, batch: UploadBatch, layout: tuple, published: int) -> int:
+    # Fast start: once enough leading segments are uploaded, publish a manifest
+    # listing them so the track is playable (as a live-style playlist) while
+    # the rest is still encoding. Returns the number of segments now published.
+    variants, ffmpeg_params, default_variant = layout
+    try:
+        manifest = build_manifest(
+            output_dir, prefix, PLAYLIST_NAME, ffmpeg_params,
+            sizes=uploaded, variants=variants, default_variant=default_variant
+        )
+    except (OSError, ValueError, KeyError):
+        # ffmpeg has not written (every) playlist yet
+        return published
+
+    progress = progress_manifest(manifest, batch.completed_keys())
+    count = published_segment_count(progress)
+    if count <= published or count < settings.hls.hls_fast_start_segments:
+        return published
+
+    upload_manifest(HLS_BUCKET_NAME, prefix, progress)
+    if not published:
+        print(f"Published the first {count} HLS segments of {prefix}")
+    return count
+
+
+def _upload_waveform(output_dir: str, prefix: str, peaks: PeaksBuilder, metadata: dict) -> dict | None:
+    # The waveform is optional: a failure is logged and the folder published without it
+    if peaks.failed:
+        return None
+
+    bits = settings.hls.hls_waveform_bits
+    file_path = os.path.join(output_dir, WAVEFORM_NAME)
+    try:
+        content = peaks.to_bytes(bits)
+        with open(file_path, "wb") as waveform_file:
+            waveform_file.write(content)
+        upload_object(file_path, HLS_BUCKET_NAME, f"{prefix}{WAVEFORM_NAME}", metadata)
+    except Exception as e:
+        print(f"Error storing the waveform of {prefix}: {e}")
+        return None
+
+    return {
+        "key": f"{prefix}{WAVEFORM_NAME}",
+        "format": "audiowaveform",
+        "bits": bits,
+        "samples_per_pixel": peaks.samples_per_pixel,
+        "size": len(content),
+    }
+
+
+def _settle(batch: UploadBatch):
+    # Let in-flight uploads finish before cleaning up after a failure
+    try:
+        batch.wait()
+    except Exception:
+        pass
+
+
+def _delete_uploaded(prefix: str, uploaded: dict, published: int = 0):
+    keys = [{"Key": f"{prefix}{file}"} for file in uploaded]
+    if published:
+        # A fast-start manifest must not outlive the segments it lists
+        keys.insert(0, {"Key": f"{prefix}{MANIFEST_NAME}"})
+    for start in range(0, len(keys), 1000):
+        try:
+            get_client().delete_objects(Bucket=HLS_BUCKET_NAME, Delete={"Objects": keys[start:start + 1000]})
+        except Exception as e:
+            print(f"Error removing partial HLS upload under {prefix}: {e}")
+
+
+def _manifest_object_keys(manifest: dict) -> set:
+    # Every object a manifest references: playlists, init sections, segments, waveform
+    keys = {manifest["playlist"]}
+    renditions = [manifest, *(manifest.get("variants") or {}).values()]
+    for rendition in renditions:
+        keys.add(rendition.get("playlist"))
+        keys.update(segment["key"] for segment in rendition.get("segments", []))
+        if rendition.get("init"):
+            keys.add(rendition["init"]["key"])
+    if manifest.get("waveform"):
+        keys.add(manifest["waveform"]["key"])
+    keys.discard(None)
+    return keys
+
+
+def _delete_replaced(prefix: str, replaced: dict, manifest: dict):
+    # Objects of the rendition a replacing transcode switched the manifest away from
+    keys = [{"Key": key} for key in sorted(_manifest_object_keys(replaced) - _manifest_object_keys(manifest))]
+    for start in range(0, len(keys), 1000):
+        try:
+            get_client().delete_objects(Bucket=HLS_BUCKET_NAME, Delete={"Objects": keys[start:start + 1000]})
+        except Exception as e:
+            print(f"Error removing the replaced HLS rendition under {prefix}: {e}")
+
+
+@TRANSCODES_IN_FLIGHT.track_inprogress()
+def generate_hls(audio_id: str, is_add: bool = False, interactive: bool = False, replace: bool = False):
     """
     Generate HLS for the given audio file from the MinIO source bucket and upload to the target bucket.
+
+    ffmpeg reads the source straight from S3 (a presigned URL or a stdin pipe,
+    see `hls_source_input`) and every finished segment is uploaded while
+    encoding continues. The playlist and manifest are uploaded last.
+    With fast start (`hls_fast_start_segments`) an incomplete manifest is
+    published as soon as the first segments are up, so playback can begin
+    after a roughly constant delay; the final manifest then marks it complete.
+    The source's loudness is measured first (see utils.loudness) and the
+    normalization gain applied in the same encoding pass. An interactive
+    transcode (a listener waiting) skips the measurement when no record
+    exists yet; the result then asks for a bulk `correct_loudness` later.
+    With `hls_waveform_enabled` the same decode also feeds min/max peaks,
+    stored as waveform.dat next to the segments.
+    With `hls_single_file` each rendition is written as one fragmented MP4
+    addressed by byte ranges and uploaded once encoding ends.
+    To replace a folder that is being played, the new rendition is written
+    under a versioned prefix inside it, without fast start; the manifest is
+    switched over once it is complete and only then are the old objects
+    deleted. A failed replacement leaves the live folder untouched.
     Args:
         audio_id (str): The ID of the audio file (used to form the file names and directories).
+        is_add (bool): Whether the audio is an ad creative.
+        interactive (bool): Whether a listener is waiting for the first segments.
+        replace (bool): Whether the folder already holds a complete rendition
+            being played, e.g. when correcting its loudness.
     Returns:
-        dict: Status message.
+        dict: Status message; "loudness_pending" is set when the measurement was skipped.
     """
 
-    # Create a temporary file to store the downloaded audio
-    with tempfile.NamedTemporaryFile(delete=False) as temp_audio_file:
-        input_file = temp_audio_file.name
+    object_key = f"{'add' if is_add else 'music'}/{audio_id}"
+    source_input = settings.hls.hls_source_input
+    input_file = None
 
+    if source_input in ("url", "pipe"):
         try:
-            object_key = f"{'add' if is_add else 'music'}/{audio_id}"
-
-            # Open the temp file for writing
-            with open(input_file, "wb") as f:
-                client.download_fileobj(SOURCE_BUCKET, object_key, f)
+            url_input_args = _url_input_args(object_key)
+        except Exception as e:
+            print(f"Error signing source URL for {object_key}: {e}")
+            return {"status": "error", "message": f"Failed to sign source URL: {e}"}
 
-            print(f"Downloaded {object_key} from MinIO to {input_file}")
+    if source_input == "url":
+        input_args = url_input_args
+    elif source_input == "pipe":
+        input_args = ["-i", "pipe:0"]
+    else:
+        # Legacy mode: download the whole source to a temporary file first
+        with tempfile.NamedTemporaryFile(delete=False) as temp_audio_file:
+            input_file = temp_audio_file.name
 
-        except Exception as e:
-            print(f"Error downloading audio file from MinIO: {e}")
-            return {"status": "error", "message": f"Failed to download audio file: {e}"}
+            try:
+                download_started = time.monotonic()
+                get_client().download_fileobj(SOURCE_BUCKET, object_key, temp_audio_file)
+                S3_DOWNLOAD_SECONDS.labels(mode="download").observe(time.monotonic() - download_started)
+                BYTES_MOVED.labels(direction="download").inc(temp_audio_file.tell())
+                print(f"Downloaded {object_key} from MinIO to {input_file}")
+            except Exception as e:
+                print(f"Error downloading audio file from MinIO: {e}")
+                os.remove(input_file)
+                return {"status": "error", "message": f"Failed to download audio file: {e}"}
+        input_args = ["-i", input_file]
 
     output_dir = f"/tmp/hls/{audio_id}"
     os.makedirs(output_dir, exist_ok=True)
 
+    renditions = _renditions()
+    single_file = settings.hls.hls_single_file
+    # A single-file rendition is only complete, and uploaded, once ffmpeg exits
+    fast_start = not replace and settings.hls.hls_fast_start_segments > 0 and not single_file
+
+    # Measured in a worker process (or reused from an earlier transcode of
+    # the same source); stdin can only be read once, so pipe mode measures
+    # from the presigned URL. A cold play does not wait for the extra decode
+    loudness = resolve_loudness(
+        audio_id, is_add, object_key,
+        url_input_args if source_input == "pipe" else input_args,
+        measure=not interactive
+    )
+    gain_db = loudness["gain_db"] if loudness else 0.0
+    loudness_pending = interactive and loudness is None and settings.loudness.loudness_normalization_enabled
+
     # Generate HLS with FFmpeg
     cmd = [
         "ffmpeg",
-        "-i", input_file,
+        *input_args,
         "-vn",
-        "-c:a", "aac", "-b:a", "128k",
-        "-f", "hls",
-        "-hls_time", "10",  # Use smaller segment size for testing
-        "-hls_flags", "independent_segments",
-        "-hls_list_size", "0",
-        "-hls_segment_filename", f"{output_dir}/segment_%03d.ts",
-        f"{output_dir}/master.m3u8"
+        *_hls_output_args(output_dir, renditions, gain_db, single_file)
     ]
 
+    peaks = None
+    if settings.hls.hls_waveform_enabled:
+        # A second output of the same decode: PCM on stdout for the peaks reader
+        peaks = PeaksBuilder(settings.hls.hls_waveform_samples_per_pixel)
+        cmd += waveform_output_args(_gain_args(gain_db))
+
+    folder = folder_prefix(audio_id, is_add)
+    # Objects of a replacing transcode never share a key with the live ones
+    prefix = f"{folder}{datetime.datetime.utcnow():v%Y%m%d%H%M%S%f}/" if replace else folder
+    metadata = {"last-access": datetime.datetime.utcnow().isoformat()}
+    uploaded = {}
+    batch = UploadBatch(HLS_BUCKET_NAME, metadata)
+    started_at = time.monotonic()
+    first_segment_at = None
+    process = None
+    published = 0
+    switched = False
+    layout = _manifest_layout(renditions, loudness, single_file)
+
     try:
-        subprocess.run(cmd, check=True)
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if source_input == "pipe" else subprocess.DEVNULL,
+            stdout=subprocess.PIPE if peaks is not None else None
+        )
+
+        peaks_reader = None
+        if peaks is not None:
+            peaks_reader = start_peaks_reader(process.stdout, peaks)
+
+        feeder = None
+        if source_input == "pipe":
+            feeder = threading.Thread(target=_feed_stdin, args=(process, object_key), daemon=True)
+            feeder.start()
+
+        # Upload segments while ffmpeg is still encoding
+        while (usage := _reap(process)) is None:
+            _submit_finished_segments(output_dir, prefix, uploaded, batch)
+            if batch.objects and first_segment_at is None:
+                first_segment_at = time.monotonic() - started_at
+                print(f"First HLS segment for {audio_id} available after {first_segment_at:.2f}s")
+            if fast_start:
+                published = _publish_progress(output_dir, prefix, uploaded, batch, layout, published)
+            time.sleep(settings.hls.hls_segment_poll_interval)
+
+        if feeder is not None:
+            feeder.join()
+        if peaks_reader is not None:
+            peaks_reader.join()
+
+        FFMPEG_WALL_SECONDS.observe(time.monotonic() - started_at)
+        FFMPEG_CPU_SECONDS.observe(usage.ru_utime + usage.ru_stime)
+
+        if process.returncode != 0:
+            # Report "ffmpeg" rather than cmd, which may embed the presigned source URL
+            raise subprocess.CalledProcessError(process.returncode, "ffmpeg")
+
         print(f"HLS segments for {audio_id} generated successfully.")
+
+        _submit_finished_segments(output_dir, prefix, uploaded, batch, ".mp4" if single_file else ".ts")
+        upload_stats = batch.wait()
+        print(f"Uploaded HLS segments for {audio_id}: {upload_stats}")
+
+        variants, ffmpeg_params, default_variant = layout
+
+        manifest = build_manifest(
+            output_dir, prefix, PLAYLIST_NAME, ffmpeg_params,
+            sizes=uploaded, variants=variants, default_variant=default_variant
+        )
+
+        if peaks is not None:
+            waveform = _upload_waveform(output_dir, prefix, peaks, metadata)
+            if waveform is not None:
+                manifest["waveform"] = waveform
+                # Removed with the folder on failure, and counted in its size
+                uploaded[WAVEFORM_NAME] = waveform["size"]
+
+        # Playlists go up after every segment they reference, the master last
+        for variant_playlist in variants.values():
+            upload_object(os.path.join(output_dir, variant_playlist), HLS_BUCKET_NAME, f"{prefix}{variant_playlist}", metadata)
+        upload_object(os.path.join(output_dir, PLAYLIST_NAME), HLS_BUCKET_NAME, f"{prefix}{PLAYLIST_NAME}", metadata)
+
+        replaced = load_manifest(HLS_BUCKET_NAME, folder) if replace else None
+
+        # Written last, so a complete manifest means every segment is in place
+        upload_manifest(HLS_BUCKET_NAME, folder, manifest)
+        switched = True
+
+        # Previously signed URL sets point at the replaced objects
+        invalidate_signed_urls(audio_id, is_add)
+
+        if replaced is not None:
+            _delete_replaced(folder, replaced, manifest)
+
+        # Size and first access for the LRU garbage collector
+        register_folder(audio_id, is_add, sum(uploaded.values()))
     except subprocess.CalledProcessError as e:
         print(f"Error generating HLS: {e}")
-        return {"status": "error", "message": f"Failed to generate HLS: {e}"}
-    finally:
-        # Clean up the temporary audio file
-        os.remove(input_file)
-
-    # Upload segments and playlist to MinIO
-    try:
-        for file in os.listdir(output_dir):
-            file_path = os.path.join(output_dir, file)
-            object_name = f"{'add' if is_add else 'music'}/{audio_id}/{file}"
-
-            client.upload_file(
-                Filename=file_path,
-                Bucket=HLS_BUCKET_NAME,
-                Key=object_name,
-                ExtraArgs={
-                    "Metadata": {
-                        "last-access": datetime.datetime.utcnow().isoformat()
-                    }
-                }
-            )
-            print(f"Uploaded {file} to {HLS_BUCKET_NAME}/{object_name}")
+        _settle(batch)
+        _delete_uploaded(prefix, uploaded, published)
+        # The exit code tells a bad source from a killed ffmpeg (negative, a signal)
+        return {"status": "error", "message": f"Failed to generate HLS: {e}", "ffmpeg_exit_code": e.returncode}
     except Exception as e:
         print(f"Error uploading HLS segments to MinIO: {e}")
+        _settle(batch)
+        if not switched:
+            # Once the manifest is written the objects are live, whatever failed after
+            _delete_uploaded(prefix, uploaded, published)
         return {"status": "error", "message": f"Failed to upload HLS segments: {e}"}
     finally:
+        if process is not None and process.poll() is None:
+            process.kill()
+        if input_file:
+            # Clean up the temporary audio file
+            os.remove(input_file)
         # delete output_dir directory and its contents
         try:
             shutil.rmtree(output_dir, ignore_errors=True)
             print(f"Removed temporary HLS directory {output_dir}")
         except Exception as e:
             print(f"Error removing output directory {output_dir}: {e}")
-        
 
+    print(f"HLS for {audio_id} published in {time.monotonic() - started_at:.2f}s")
+    result = {"status": "success", "message": "HLS segments uploaded"}
+    if loudness_pending:
+        result["loudness_pending"] = True
+    return result
+
+
+def correct_loudness(audio_id: str, is_add: bool = False):
+    """
+    Measure the loudness of a track an interactive transcode published without
+    normalization, store it, and transcode the track again with the gain when
+    it is large enough to hear.
+    Args:
+        audio_id (str): The ID of the audio file.
+        is_add (bool): Whether the audio is an ad creative.
+    Returns:
+        dict: Status message.
+    """
+    object_key = f"{'add' if is_add else 'music'}/{audio_id}"
+
+    try:
+        input_args = _url_input_args(object_key)
+    except Exception as e:
+        print(f"Error signing source URL for {object_key}: {e}")
+        return {"status": "error", "message": f"Failed to sign source URL: {e}"}
+
+    loudness = resolve_loudness(audio_id, is_add, object_key, input_args)
+    if loudness is None:
+        return {"status": "error", "message": "Failed to measure loudness"}
+
+    if abs(loudness["gain_db"]) < settings.loudness.loudness_correction_threshold_db:
+        return {"status": "success", "message": f"Gain of {loudness['gain_db']} dB left unapplied"}
 
-    return {"status": "success", "message": "HLS segments uploaded"}
+    # The live folder keeps playing until the corrected one is complete
+    return generate_hls(audio_id, is_add=is_add, replace=True)
@@ -1,5 +1,19 @@
-from libs.s3_client import client
-from utils.generate_hls import generate_hls
+import asyncio
+from libs.s3_client import get_client
+from utils.access_tracker import record_access, record_access_async
+from utils.executor import run_blocking
+from utils.hls_manifest import folder_prefix, get_folder_segments, get_folder_segments_async, load_manifest_async, unique_keys
+from utils.presigner import can_presign_locally, presign_get_urls
+from utils.transcode_queue import TranscodePending
+from utils.signed_url_cache import (
+    expiration_bucket,
+    get_cached_signed_urls,
+    get_cached_signed_urls_async,
+    get_cached_signed_urls_many_async,
+    set_cached_signed_urls,
+    set_cached_signed_urls_async,
+    set_cached_signed_urls_many_async,
+)
 from config.config import settings
 
 
@@ -16,7 +30,7 @@ def generate_signed_url(bucket_name, object_key, expiration=300):
     """
     try:
         # Generate the signed URL
-        signed_url = client.generate_presigned_url(
+        signed_url = get_client().generate_presigned_url(
             'get_object', 
             Params={'Bucket': bucket_name, 'Key': object_key}, 
             ExpiresIn=expiration
@@ -27,7 +41,92 @@ def generate_signed_url(bucket_name, object_key, expiration=300):
         return None
 
 
-def generate_signed_urls_for_folder(audio_id, bucket_name = HLS_BUCKET_NAME,  expiration=300, is_add: bool = False):
+def sign_object_keys(bucket_name, object_keys, expiration=300):
+    """
+    Generate signed URLs for a list of objects, preserving their order.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param object_keys: The keys of the objects to sign.
+        :param expiration: URL expiration time in seconds (default 5 minutes).
+    :return: A dictionary of object keys and their corresponding signed URLs.
+    """
+    # One signing key and canonical request prefix for the whole batch, and
+    # one signature per object even when segments share it (single-file renditions)
+    return presign_get_urls(bucket_name, unique_keys(object_keys), expiration)
+
+
+async def sign_object_keys_async(bucket_name, object_keys, expiration=300):
+    """
+    Async counterpart of sign_object_keys.
+
+    Local batch signing is pure CPU and fast enough to run on the event loop;
+    the much slower boto3 fallback runs on the bounded blocking executor.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param object_keys: The keys of the objects to sign.
+        :param expiration: URL expiration time in seconds (default 5 minutes).
+    :return: A dictionary of object keys and their corresponding signed URLs.
+    """
+    if can_presign_locally():
+        return sign_object_keys(bucket_name, object_keys, expiration)
+    return await run_blocking(sign_object_keys, bucket_name, object_keys, expiration)
+
+
+def normalize_quality(quality: str | None):
+    """
+    Map a requested stream quality to a configured rendition name, or None for the default.
+    """
+    return quality if quality in settings.hls.hls_renditions else None
+
+
+def ensure_folder_segments(audio_id, bucket_name=HLS_BUCKET_NAME, is_add: bool = False, quality: str | None = None):
+    """
+    Resolve the segment keys of an HLS folder that must already exist.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param bucket_name: The name of the S3 bucket.
+        :param is_add: Whether the audio is an ad creative.
+        :param quality: Rendition name for multi-rendition folders.
+    :return: The segment keys in playback order, and whether the folder is
+        complete (False while a fast-start transcode is still publishing segments).
+    :raises TranscodePending: If the folder is empty and has to be transcoded first.
+    """
+    prefix = folder_prefix(audio_id, is_add)
+
+    # Read the segment list from the folder manifest (or list legacy folders)
+    segment_keys, complete = get_folder_segments(bucket_name, prefix, quality)
+
+    # Transcoding runs in the background worker, never in the request path
+    if not segment_keys:
+        print(f"No objects found in the folder: {prefix}")
+        raise TranscodePending(audio_id, is_add, settings.transcode.transcode_retry_after)
+
+    return segment_keys, complete
+
+
+async def ensure_folder_segments_async(audio_id, bucket_name=HLS_BUCKET_NAME, is_add: bool = False, quality: str | None = None):
+    """
+    Async counterpart of ensure_folder_segments.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param bucket_name: The name of the S3 bucket.
+        :param is_add: Whether the audio is an ad creative.
+        :param quality: Rendition name for multi-rendition folders.
+    :return: The segment keys in playback order and whether the folder is complete.
+    :raises TranscodePending: If the folder is empty and has to be transcoded first.
+    """
+    prefix = folder_prefix(audio_id, is_add)
+
+    segment_keys, complete = await get_folder_segments_async(bucket_name, prefix, quality)
+
+    if not segment_keys:
+        print(f"No objects found in the folder: {prefix}")
+        raise TranscodePending(audio_id, is_add, settings.transcode.transcode_retry_after)
+
+    return segment_keys, complete
+
+
+def generate_signed_urls_for_folder(audio_id, bucket_name = HLS_BUCKET_NAME,  expiration=300, is_add: bool = False, quality: str | None = None):
     """
     Generate signed URLs for all objects within a specific folder (prefix) in an S3 bucket.
     Args:
@@ -35,48 +134,210 @@ def generate_signed_urls_for_folder(audio_id, bucket_name = HLS_BUCKET_NAME,  ex
         :param audio_id: The folder prefix (path) within the S3 bucket. This should be the audio ID.
         :param expiration: URL expiration time in seconds (default 5 minutes).
         :param is_add: Boolean flag to indicate whether to add new HLS content if no objects are found.
-    :return: A dictionary of object keys and their corresponding signed URLs.
+        :param quality: Rendition name ("low", "medium", "high") for multi-rendition folders.
+    :return: A dictionary of object keys and their corresponding signed URLs, and
+        whether the folder is complete (False while a fast-start transcode runs).
     """
+    quality = normalize_quality(quality)
+
+    # Serve hot tracks from Redis without touching S3; only complete folders are cached
+    bucket = expiration_bucket(expiration)
+    cached = get_cached_signed_urls(audio_id, is_add, bucket, quality)
+    if cached is not None:
+        # Buffered in memory; feeds the LRU garbage collector without an S3 call
+        record_access(audio_id, is_add)
+        return cached, True
+
     signed_urls = {}
+    complete = True
+
+    try:
+        segment_keys, complete = ensure_folder_segments(audio_id, bucket_name, is_add, quality)
+        record_access(audio_id, is_add)
+        signed_urls = sign_object_keys(bucket_name, segment_keys, bucket)
 
-    folder_prefix = f"{'add' if is_add else 'music'}/{audio_id}/"
+        if complete:
+            set_cached_signed_urls(audio_id, is_add, bucket, signed_urls, quality)
+
+    except TranscodePending:
+        raise
+    except Exception as e:
+        print(f"Error listing objects in folder {folder_prefix(audio_id, is_add)}: {e}")
+
+    return signed_urls, complete
+
+
+async def generate_signed_urls_for_folder_async(
+    audio_id,
+    bucket_name=HLS_BUCKET_NAME,
+    expiration=300,
+    is_add: bool = False,
+    quality: str | None = None,
+    segment_keys: list[str] | None = None,
+    complete: bool = True
+):
+    """
+    Async counterpart of generate_signed_urls_for_folder, using the async Redis
+    and S3 clients so a request never holds a thread while waiting on I/O.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param bucket_name: The name of the S3 bucket.
+        :param expiration: URL expiration time in seconds (default 5 minutes).
+        :param is_add: Whether the audio is an ad creative.
+        :param quality: Rendition name ("low", "medium", "high") for multi-rendition folders.
+        :param segment_keys: The folder's segment keys when the caller already read its
+            manifest (e.g. a playlist template), so it is not fetched again.
+        :param complete: Whether the given segment_keys are final.
+    :return: A dictionary of object keys and their corresponding signed URLs, and
+        whether the folder is complete.
+    """
+    quality = normalize_quality(quality)
+
+    bucket = expiration_bucket(expiration)
+    cached = await get_cached_signed_urls_async(audio_id, is_add, bucket, quality)
+    if cached is not None:
+        await record_access_async(audio_id, is_add)
+        return cached, True
+
+    signed_urls = {}
 
     try:
-        # List objects within the folder (prefix)
-        response = client.list_objects_v2(
-            Bucket=bucket_name,
-            Prefix=folder_prefix
-        )
+        if segment_keys is None:
+            segment_keys, complete = await ensure_folder_segments_async(audio_id, bucket_name, is_add, quality)
+        await record_access_async(audio_id, is_add)
+        signed_urls = await sign_object_keys_async(bucket_name, segment_keys, bucket)
 
-        # Check if the folder has any content
-        if 'Contents' not in response or not response['Contents']:
-            print(f"No objects found in the folder: {folder_prefix}")
-            # Generate HLS content if flag is set
-            print(f"Generating HLS for folder: {folder_prefix}")
-            generate_hls(audio_id=audio_id, is_add=is_add)
-            # List objects again after HLS generation
-            response = client.list_objects_v2(
-                Bucket=bucket_name,
-                Prefix=folder_prefix
-            )
-            if 'Contents' not in response or not response['Contents']:
-                # If no objects are found return an empty dict
-                return signed_urls
-
-        # Iterate over the objects in the folder if they exist
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                object_key = obj['Key']
-
-                # Skip master.m3u8
-                if object_key.endswith("master.m3u8") or object_key.endswith(".m3u8"):
-                    continue
-
-                signed_url = generate_signed_url(bucket_name, object_key, expiration)
-                if signed_url:
-                    signed_urls[object_key] = signed_url
+        if complete:
+            await set_cached_signed_urls_async(audio_id, is_add, bucket, signed_urls, quality)
 
+    except TranscodePending:
+        raise
     except Exception as e:
-        print(f"Error listing objects in folder {folder_prefix}: {e}")
-    
+        print(f"Error listing objects in folder {folder_prefix(audio_id, is_add)}: {e}")
+
+    return signed_urls, complete
+
+
+async def generate_signed_urls_for_folders_async(folders: list[tuple[str, bool]], bucket_name=HLS_BUCKET_NAME, expiration=300, quality: str | None = None) -> list[dict]:
+    """
+    Resolve and sign many HLS folders at once, e.g. a playlist or autoplay queue.
+
+    The work is shared across folders: one Redis MGET for the cached sets,
+    concurrent manifest reads for the misses, a single signing pass over all
+    their segment keys and one pipelined cache write.
+    Args:
+        :param folders: (audio_id, is_add) pairs.
+        :param bucket_name: The name of the S3 bucket.
+        :param expiration: URL expiration time in seconds (default 5 minutes).
+        :param quality: Rendition name ("low", "medium", "high") for multi-rendition folders.
+    :return: One result per folder with "status" ("ready", "preparing" or "error"),
+        and "urls" and "complete" when ready, "retry_after" when preparing or
+        "message" on error.
+    """
+    quality = normalize_quality(quality)
+    bucket = expiration_bucket(expiration)
+    results = [None] * len(folders)
+
+    cached = await get_cached_signed_urls_many_async(folders, bucket, quality)
+    misses = [index for index, urls in enumerate(cached) if urls is None]
+    for index, urls in enumerate(cached):
+        if urls is not None:
+            results[index] = {"status": "ready", "urls": urls, "complete": True}
+
+    resolved = await asyncio.gather(
+        *(ensure_folder_segments_async(folders[index][0], bucket_name, folders[index][1], quality) for index in misses),
+        return_exceptions=True
+    )
+
+    listed = {}
+    for index, outcome in zip(misses, resolved):
+        if isinstance(outcome, TranscodePending):
+            results[index] = {"status": "preparing", "retry_after": outcome.retry_after}
+        elif isinstance(outcome, Exception):
+            audio_id, is_add = folders[index]
+            print(f"Error listing objects in folder {folder_prefix(audio_id, is_add)}: {outcome}")
+            results[index] = {"status": "error", "message": "Failed to resolve audio segments"}
+        else:
+            listed[index] = outcome
+
+    signed_urls = await sign_object_keys_async(
+        bucket_name, [key for segment_keys, _ in listed.values() for key in segment_keys], bucket
+    )
+
+    to_cache = []
+    for index, (segment_keys, complete) in listed.items():
+        audio_id, is_add = folders[index]
+        urls = {key: signed_urls[key] for key in segment_keys if key in signed_urls}
+        results[index] = {"status": "ready", "urls": urls, "complete": complete}
+        if complete:
+            to_cache.append((audio_id, is_add, urls))
+
+    await set_cached_signed_urls_many_async(to_cache, bucket, quality)
+
+    for (audio_id, is_add), result in zip(folders, results):
+        if result["status"] == "ready":
+            await record_access_async(audio_id, is_add)
+
+    return results
+
+
+async def generate_signed_waveform_url_async(audio_id, bucket_name=HLS_BUCKET_NAME, expiration=300, is_add: bool = False):
+    """
+    Sign the waveform peaks file of an HLS folder.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param bucket_name: The name of the S3 bucket.
+        :param expiration: URL expiration time in seconds (default 5 minutes).
+        :param is_add: Whether the audio is an ad creative.
+    :return: The signed URL and the waveform's description from the manifest,
+        or None if the folder was generated without a waveform.
+    :raises TranscodePending: If the folder is empty and has to be transcoded first.
+    """
+    manifest = await load_manifest_async(bucket_name, folder_prefix(audio_id, is_add))
+    if manifest is None:
+        # Legacy folders have no waveform; a missing folder is queued for transcoding
+        await ensure_folder_segments_async(audio_id, bucket_name, is_add)
+        return None
+
+    waveform = manifest.get("waveform")
+    if waveform is None:
+        return None
+
+    signed_urls = await sign_object_keys_async(bucket_name, [waveform["key"]], expiration_bucket(expiration))
+    if waveform["key"] not in signed_urls:
+        return None
+
+    return signed_urls[waveform["key"]], waveform
+
+
+async def sign_segment_window_async(audio_id, segment_keys, index, window, bucket_name=HLS_BUCKET_NAME, expiration=300, is_add: bool = False, quality: str | None = None, complete: bool = True):
+    """
+    Generate signed URLs for the window of segments containing a given index.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param segment_keys: All segment keys of the rendition in playback order.
+        :param index: Index of a segment inside the requested window.
+        :param window: Number of segments per window.
+        :param bucket_name: The name of the S3 bucket.
+        :param expiration: URL expiration time in seconds (default 5 minutes).
+        :param is_add: Whether the audio is an ad creative.
+        :param quality: Rendition name the segment keys belong to.
+        :param complete: Whether segment_keys is final; windows of a folder still
+            being transcoded may grow and are not cached.
+    :return: A dictionary of object keys and their corresponding signed URLs.
+    """
+    quality = normalize_quality(quality)
+    bucket = expiration_bucket(expiration)
+    window_number = index // window
+    scope = f"{quality or 'default'}:w{window}-{window_number}"
+
+    cached = await get_cached_signed_urls_async(audio_id, is_add, bucket, scope)
+    if cached is not None:
+        return cached
+
+    start = window_number * window
+    signed_urls = await sign_object_keys_async(bucket_name, segment_keys[start:start + window], bucket)
+
+    if complete:
+        await set_cached_signed_urls_async(audio_id, is_add, bucket, signed_urls, scope)
     return signed_urls
@@ -0,0 +1,421 @@
+import json
+import os
+import re
+from botocore.exceptions import ClientError
+from libs.s3_client import get_async_client, get_client
+from utils.metrics import S3_REQUEST_SECONDS, observe_seconds
+from utils.waveform import WAVEFORM_NAME
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def folder_prefix(audio_id: str, is_add: bool = False) -> str:
+    """
+    Build the HLS folder prefix for an audio file.
+    Args:
+        :param audio_id: The ID of the audio file.
+        :param is_add: Whether the audio is an ad creative.
+    :return: The folder prefix, ending with a slash.
+    """
+    return f"{'add' if is_add else 'music'}/{audio_id}/"
+
+
+def _segment_sort_key(key: str):
+    # Natural order, so segment_1000.ts sorts after segment_999.ts
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", key)]
+
+
+def _parse_byterange(value: str, offset: int) -> list[int]:
+    # "length[@offset]"; without an offset the range follows the previous one
+    length, _, start = value.partition("@")
+    return [int(length), int(start) if start else offset]
+
+
+def parse_media_playlist_entries(content: str) -> tuple[dict | None, list[tuple]]:
+    """
+    Read the segments of an HLS media playlist, including byte ranges of
+    single-file (EXT-X-BYTERANGE) playlists.
+    Args:
+        :param content: The .m3u8 playlist text.
+    :return: The EXT-X-MAP initialization section as {"uri", "byterange"} (None for
+        MPEG-TS playlists), and (uri, duration, byterange) per segment in playlist
+        order, where byterange is [length, offset] or None.
+    """
+    init = None
+    entries = []
+    duration = None
+    byterange = None
+    next_offset = 0
+
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-MAP:"):
+            attributes = dict(re.findall(r'([A-Z-]+)="([^"]*)"', line))
+            init = {"uri": attributes["URI"], "byterange": None}
+            if "BYTERANGE" in attributes:
+                init["byterange"] = _parse_byterange(attributes["BYTERANGE"], 0)
+        elif line.startswith("#EXTINF:"):
+            duration = float(line[len("#EXTINF:"):].split(",", 1)[0])
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            byterange = _parse_byterange(line[len("#EXT-X-BYTERANGE:"):], next_offset)
+            next_offset = byterange[0] + byterange[1]
+        elif line and not line.startswith("#") and duration is not None:
+            entries.append((line, duration, byterange))
+            duration = None
+            byterange = None
+
+    return init, entries
+
+
+def parse_media_playlist(content: str) -> dict:
+    """
+    Read segment durations from the text of an HLS media playlist.
+    Args:
+        :param content: The .m3u8 playlist text.
+    :return: A dictionary of segment URIs and their durations in seconds, in playlist order.
+    """
+    _, entries = parse_media_playlist_entries(content)
+    return {uri: duration for uri, duration, _ in entries}
+
+
+def _describe_playlist(output_dir: str, prefix: str, playlist_name: str, sizes: dict) -> tuple[list[dict], dict | None]:
+    # Segment URIs are relative to the playlist's own directory
+    base = os.path.dirname(playlist_name)
+    with open(os.path.join(output_dir, playlist_name), "r") as playlist:
+        init, entries = parse_media_playlist_entries(playlist.read())
+
+    def file_name(uri):
+        return f"{base}/{uri}" if base else uri
+
+    segments = []
+    for uri, duration, byterange in entries:
+        name = file_name(uri)
+        segment = {"key": f"{prefix}{name}", "duration": duration}
+
+        if byterange is not None:
+            # Single-file rendition: every segment is a range of one object
+            segment["size"] = byterange[0]
+            segment["byterange"] = byterange
+        else:
+            segment["size"] = sizes[name] if name in sizes else os.path.getsize(os.path.join(output_dir, name))
+        segments.append(segment)
+
+    if init is not None:
+        init = {"key": f"{prefix}{file_name(init['uri'])}", "byterange": init["byterange"]}
+
+    return segments, init
+
+
+def _peak_bandwidth(segments: list[dict]) -> int:
+    # HLS BANDWIDTH is the peak segment bitrate in bits per second
+    return max((int(s["size"] * 8 / s["duration"]) for s in segments if s["duration"] > 0), default=0)
+
+
+def build_manifest(
+    output_dir: str,
+    prefix: str,
+    playlist_name: str,
+    ffmpeg_params: dict,
+    sizes: dict | None = None,
+    variants: dict | None = None,
+    default_variant: str | None = None
+) -> dict:
+    """
+    Describe the segments ffmpeg wrote to output_dir.
+    Args:
+        :param output_dir: Local directory containing the playlist and segments.
+        :param prefix: The folder prefix the files are uploaded under.
+        :param playlist_name: File name of the media (or master) playlist.
+        :param ffmpeg_params: The encoding parameters used to produce the segments.
+        :param sizes: Byte sizes of segments that were already uploaded and removed locally.
+        :param variants: For multi-rendition output, rendition name -> media playlist path.
+        :param default_variant: Rendition whose segments are listed at the top level.
+    :return: The manifest dictionary. Single-file fMP4 renditions also carry an
+        "init" section and a [length, offset] "byterange" per segment.
+    """
+    sizes = sizes or {}
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "playlist": f"{prefix}{playlist_name}",
+        "ffmpeg": ffmpeg_params,
+        "complete": True,
+    }
+
+    if not variants:
+        manifest["segments"], init = _describe_playlist(output_dir, prefix, playlist_name, sizes)
+        if init is not None:
+            manifest["init"] = init
+        return manifest
+
+    manifest["variants"] = {}
+    for name, variant_playlist in variants.items():
+        segments, init = _describe_playlist(output_dir, prefix, variant_playlist, sizes)
+        manifest["variants"][name] = {
+            "playlist": f"{prefix}{variant_playlist}",
+            "bandwidth": _peak_bandwidth(segments),
+            "segments": segments,
+        }
+        if init is not None:
+            manifest["variants"][name]["init"] = init
+
+    # Readers unaware of variants keep working with the default rendition
+    if default_variant not in variants:
+        default_variant = next(iter(variants))
+    manifest["default_variant"] = default_variant
+    manifest["segments"] = manifest["variants"][default_variant]["segments"]
+    if "init" in manifest["variants"][default_variant]:
+        manifest["init"] = manifest["variants"][default_variant]["init"]
+
+    return manifest
+
+
+def progress_manifest(manifest: dict, uploaded_keys: set) -> dict:
+    """
+    Trim the manifest of a transcode in progress to the segments already uploaded.
+    Args:
+        :param manifest: The manifest built from ffmpeg's playlist so far.
+        :param uploaded_keys: Keys of the segments whose upload finished.
+    :return: A copy marked incomplete, listing each rendition's uploaded leading segments.
+    """
+    def uploaded_prefix(segments):
+        count = 0
+        while count < len(segments) and segments[count]["key"] in uploaded_keys:
+            count += 1
+        return segments[:count]
+
+    progress = {**manifest, "complete": False}
+
+    if manifest.get("variants"):
+        progress["variants"] = {
+            name: {**variant, "segments": uploaded_prefix(variant["segments"])}
+            for name, variant in manifest["variants"].items()
+        }
+        progress["segments"] = progress["variants"][manifest["default_variant"]]["segments"]
+    else:
+        progress["segments"] = uploaded_prefix(manifest["segments"])
+
+    return progress
+
+
+def published_segment_count(manifest: dict) -> int:
+    """
+    Number of segments every rendition of a manifest lists.
+    """
+    variants = manifest.get("variants") or {}
+    if variants:
+        return min(len(variant["segments"]) for variant in variants.values())
+    return len(manifest["segments"])
+
+
+def is_complete(manifest: dict) -> bool:
+    """
+    Whether a manifest describes a finished transcode (manifests predating
+    fast start are always complete).
+    """
+    return manifest.get("complete", True)
+
+
+def manifest_segments(manifest: dict, quality: str | None = None) -> list[dict]:
+    """
+    Pick the segments of the rendition matching a stream quality.
+    Args:
+        :param manifest: The manifest dictionary.
+        :param quality: Rendition name, e.g. "low", "medium" or "high".
+    :return: The segment entries; the default rendition when quality is unknown.
+    """
+    variants = manifest.get("variants") or {}
+    if quality in variants:
+        return variants[quality]["segments"]
+    return manifest["segments"]
+
+
+def manifest_init(manifest: dict, quality: str | None = None):
+    """
+    Pick the fMP4 initialization section of the rendition matching a stream quality.
+    Args:
+        :param manifest: The manifest dictionary.
+        :param quality: Rendition name, e.g. "low", "medium" or "high".
+    :return: {"key", "byterange"}, or None for MPEG-TS renditions.
+    """
+    variants = manifest.get("variants") or {}
+    if quality in variants:
+        return variants[quality].get("init")
+    return manifest.get("init")
+
+
+def unique_keys(keys: list[str]) -> list[str]:
+    """
+    Drop repeated keys, keeping playback order. Segments of a single-file
+    rendition all share one key, which needs a single signature.
+    """
+    return list(dict.fromkeys(keys))
+
+
+def upload_manifest(bucket_name: str, prefix: str, manifest: dict):
+    """
+    Upload a manifest next to the segments it describes.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param prefix: The folder prefix of the HLS rendition.
+        :param manifest: The manifest dictionary.
+    """
+    get_client().put_object(
+        Bucket=bucket_name,
+        Key=f"{prefix}{MANIFEST_NAME}",
+        Body=json.dumps(manifest, separators=(",", ":")).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def _is_missing(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404")
+
+
+def load_manifest(bucket_name: str, prefix: str):
+    """
+    Fetch the manifest of an HLS folder.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param prefix: The folder prefix of the HLS rendition.
+    :return: The manifest dictionary, or None if the folder has no manifest.
+    """
+    try:
+        with observe_seconds(S3_REQUEST_SECONDS.labels(operation="get_manifest")):
+            response = get_client().get_object(Bucket=bucket_name, Key=f"{prefix}{MANIFEST_NAME}")
+            body = response["Body"].read()
+    except ClientError as e:
+        if _is_missing(e):
+            return None
+        raise
+
+    return json.loads(body)
+
+
+async def load_manifest_async(bucket_name: str, prefix: str):
+    """
+    Fetch the manifest of an HLS folder with the async S3 client.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param prefix: The folder prefix of the HLS rendition.
+    :return: The manifest dictionary, or None if the folder has no manifest.
+    """
+    s3 = await get_async_client()
+    try:
+        with observe_seconds(S3_REQUEST_SECONDS.labels(operation="get_manifest")):
+            response = await s3.get_object(Bucket=bucket_name, Key=f"{prefix}{MANIFEST_NAME}")
+            async with response["Body"] as body:
+                content = await body.read()
+    except ClientError as e:
+        if _is_missing(e):
+            return None
+        raise
+
+    return json.loads(content)
+
+
+def _segment_keys_from_listing(object_keys: list[str]) -> list[str]:
+    keys = []
+    has_playlist = False
+
+    for object_key in object_keys:
+        # Skip playlists and the manifest itself
+        if object_key.endswith(".m3u8"):
+            has_playlist = True
+            continue
+        if object_key.endswith(MANIFEST_NAME) or object_key.endswith(WAVEFORM_NAME):
+            continue
+        keys.append(object_key)
+
+    # Segments without a playlist belong to an upload still in progress
+    if not has_playlist:
+        return []
+
+    return sorted(keys, key=_segment_sort_key)
+
+
+def list_segment_keys(bucket_name: str, prefix: str) -> list[str]:
+    """
+    List the segment keys of a legacy folder without a manifest.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param prefix: The folder prefix of the HLS rendition.
+    :return: The segment keys in playback order (empty if the folder has no playlist yet).
+    """
+    paginator = get_client().get_paginator("list_objects_v2")
+    with observe_seconds(S3_REQUEST_SECONDS.labels(operation="list_objects")):
+        object_keys = [
+            obj["Key"]
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+            for obj in page.get("Contents", [])
+        ]
+    return _segment_keys_from_listing(object_keys)
+
+
+async def list_segment_keys_async(bucket_name: str, prefix: str) -> list[str]:
+    """
+    List the segment keys of a legacy folder with the async S3 client.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param prefix: The folder prefix of the HLS rendition.
+    :return: The segment keys in playback order (empty if the folder has no playlist yet).
+    """
+    s3 = await get_async_client()
+    paginator = s3.get_paginator("list_objects_v2")
+    object_keys = []
+    with observe_seconds(S3_REQUEST_SECONDS.labels(operation="list_objects")):
+        async for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            object_keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return _segment_keys_from_listing(object_keys)
+
+
+def _object_keys(manifest: dict, quality: str | None) -> list[str]:
+    return unique_keys([segment["key"] for segment in manifest_segments(manifest, quality)])
+
+
+def get_folder_segments(bucket_name: str, prefix: str, quality: str | None = None) -> tuple[list[str], bool]:
+    """
+    Resolve the segment keys of an HLS folder, preferring its manifest.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param prefix: The folder prefix of the HLS rendition.
+        :param quality: Rendition name for multi-rendition folders.
+    :return: The segment keys in playback order (empty if the folder is empty; one
+        key per single-file rendition), and whether the folder is complete rather
+        than a fast-start transcode in progress.
+    """
+    manifest = load_manifest(bucket_name, prefix)
+    if manifest is not None:
+        return _object_keys(manifest, quality), is_complete(manifest)
+
+    # Legacy folders only become visible once their playlist is uploaded
+    return list_segment_keys(bucket_name, prefix), True
+
+
+async def get_folder_segments_async(bucket_name: str, prefix: str, quality: str | None = None) -> tuple[list[str], bool]:
+    """
+    Async counterpart of get_folder_segments.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param prefix: The folder prefix of the HLS rendition.
+        :param quality: Rendition name for multi-rendition folders.
+    :return: The segment keys in playback order and whether the folder is complete.
+    """
+    manifest = await load_manifest_async(bucket_name, prefix)
+    if manifest is not None:
+        return _object_keys(manifest, quality), is_complete(manifest)
+
+    return await list_segment_keys_async(bucket_name, prefix), True
+
+
+def get_segment_keys(bucket_name: str, prefix: str, quality: str | None = None) -> list[str]:
+    """
+    Resolve the segment keys of an HLS folder, preferring its manifest.
+    Args:
+        :param bucket_name: The name of the S3 bucket.
+        :param prefix: The folder prefix of the HLS rendition.
+        :param quality: Rendition name for multi-rendition folders.
+    :return: The segment keys in playback order (empty if the folder is empty).
+    """
+    return get_folder_segments(bucket_name, prefix, quality)[0]
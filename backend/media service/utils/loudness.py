@@ -0,0 +1,287 @@
+import array
+import json
+import multiprocessing
+import struct
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.signal import sosfilt
+from botocore.exceptions import ClientError
+from libs.s3_client import get_client
+from config.config import settings
+
+HLS_BUCKET_NAME = settings.s3_storage.hls_bucket_name or "hls-playlist"
+SOURCE_BUCKET = settings.s3_storage.s3_bucket_name
+LOUDNESS_PREFIX = "loudness"
+
+# Sources are decoded to 48 kHz so the standard filter coefficients apply
+SAMPLE_RATE = 48000
+# ITU-R BS.1770-4 K-weighting at 48 kHz as second-order sections:
+# a high shelf (head effect) followed by a high pass (RLB curve)
+K_WEIGHTING = np.array([
+    [1.53512485958697, -2.69169618940638, 1.19839281085285, 1.0, -1.69065929318241, 0.73248077421585],
+    [1.0, -2.0, 1.0, 1.0, -1.99004745483398, 0.99007225036621],
+])
+# Gating blocks are 400 ms with 75% overlap, i.e. four 100 ms quarters
+QUARTER = SAMPLE_RATE // 10
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+# PCM read from ffmpeg per iteration, in quarters (one second)
+READ_QUARTERS = 10
+
+_pool = None
+
+
+def _channel_weights(channels: int) -> list[float]:
+    # BS.1770 weights: surrounds count +1.5 dB, the LFE of a 5.1 layout is ignored
+    if channels == 6:
+        return [1.0, 1.0, 1.0, 0.0, 1.41, 1.41]
+    return [1.0] * channels
+
+
+def _block_loudness(mean_square):
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(mean_square)
+
+
+class LoudnessMeter:
+    """
+    Streaming BS.1770 integrated loudness meter.
+
+    PCM is fed in arbitrary sized chunks; the K-weighting filter state and the
+    last three 100 ms quarter energies are carried between chunks, so memory
+    holds one chunk plus one float per 100 ms of audio for the final gating.
+    """
+
+    def __init__(self, channels: int):
+        self.channels = channels
+        self._weights = np.array(_channel_weights(channels))
+        self._filter_state = np.zeros((K_WEIGHTING.shape[0], 2, channels))
+        self._pending = np.zeros((0, channels))
+        self._quarters = np.zeros((0, channels))
+        self._blocks = array.array("d")
+
+    def add(self, samples: np.ndarray):
+        """
+        Feed the next chunk of PCM.
+        Args:
+            :param samples: Float samples at 48 kHz, shaped (frames, channels).
+        """
+        filtered, self._filter_state = sosfilt(K_WEIGHTING, samples, axis=0, zi=self._filter_state)
+        if len(self._pending):
+            filtered = np.concatenate([self._pending, filtered])
+
+        whole = len(filtered) // QUARTER * QUARTER
+        self._pending = filtered[whole:].copy()
+        if not whole:
+            return
+
+        energies = np.square(filtered[:whole]).reshape(-1, QUARTER, self.channels).sum(axis=1)
+        quarters = np.concatenate([self._quarters, energies])
+
+        if len(quarters) >= 4:
+            # Each block sums four consecutive quarters
+            blocks = quarters[:-3] + quarters[1:-2] + quarters[2:-1] + quarters[3:]
+            self._blocks.extend((blocks / (4 * QUARTER)) @ self._weights)
+
+        self._quarters = quarters[-3:]
+
+    def integrated_loudness(self):
+        """
+        Gate the blocks seen so far.
+        :return: The integrated loudness in LUFS, or None for silence or audio under 400 ms.
+        """
+        blocks = np.frombuffer(self._blocks, dtype=np.float64)
+        audible = blocks[_block_loudness(blocks) > ABSOLUTE_GATE]
+        if not len(audible):
+            return None
+
+        relative_gate = _block_loudness(audible.mean()) + RELATIVE_GATE
+        gated = audible[_block_loudness(audible) > relative_gate]
+        return float(_block_loudness(gated.mean()))
+
+
+def _read_wav_channels(stream) -> int:
+    # Walk the RIFF chunks up to "data"; sizes are meaningless on a pipe
+    header = stream.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        raise ValueError("ffmpeg did not produce a WAV stream")
+
+    channels = None
+    while True:
+        chunk = stream.read(8)
+        if len(chunk) < 8:
+            raise ValueError("WAV stream ended before its data chunk")
+
+        chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if chunk_id == b"data":
+            if channels is None:
+                raise ValueError("WAV stream has no format chunk")
+            return channels
+
+        body = stream.read(size + size % 2)
+        if chunk_id == b"fmt ":
+            channels = struct.unpack_from("<H", body, 2)[0]
+
+
+def measure_integrated_loudness(input_args: list[str]):
+    """
+    Measure the BS.1770 integrated loudness of a source without loading it.
+
+    ffmpeg decodes the source to 48 kHz float PCM on a pipe, which is metered
+    one second at a time. Runs in the loudness process pool.
+    Args:
+        :param input_args: ffmpeg input arguments, e.g. ["-i", url].
+    :return: The integrated loudness in LUFS, or None for silence.
+    """
+    cmd = [
+        "ffmpeg", "-v", "error",
+        *input_args,
+        "-vn", "-ar", str(SAMPLE_RATE), "-c:a", "pcm_f32le", "-f", "wav", "pipe:1"
+    ]
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+
+    try:
+        channels = _read_wav_channels(process.stdout)
+        meter = LoudnessMeter(channels)
+        frame_size = 4 * channels
+        leftover = b""
+
+        while True:
+            data = process.stdout.read(READ_QUARTERS * QUARTER * frame_size)
+            if not data:
+                break
+
+            data = leftover + data
+            usable = len(data) // frame_size * frame_size
+            leftover = data[usable:]
+            meter.add(np.frombuffer(data[:usable], dtype="<f4").reshape(-1, channels))
+
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, "ffmpeg")
+
+        return meter.integrated_loudness()
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+
+    if _pool is None:
+        # Spawned rather than forked: the parent runs upload threads and an event loop
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.loudness.loudness_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def loudness_gain(integrated_lufs) -> float:
+    """
+    Gain that brings a track to the target loudness.
+    Args:
+        :param integrated_lufs: The measured loudness, None for silence.
+    :return: The gain in dB, capped at loudness_max_gain_db.
+    """
+    if integrated_lufs is None:
+        return 0.0
+
+    gain = settings.loudness.loudness_target_lufs - integrated_lufs
+    return round(min(gain, settings.loudness.loudness_max_gain_db), 2)
+
+
+def _record_key(audio_id: str, is_add: bool) -> str:
+    # Kept outside the HLS folder so it survives the folder being replaced
+    return f"{LOUDNESS_PREFIX}/{'add' if is_add else 'music'}/{audio_id}.json"
+
+
+def load_loudness(audio_id: str, is_add: bool = False):
+    """
+    Fetch the stored loudness measurement of a track.
+    Args:
+        :param audio_id: The ID of the audio file.
+        :param is_add: Whether the audio is an ad creative.
+    :return: The loudness record, or None if the track was never measured.
+    """
+    try:
+        response = get_client().get_object(Bucket=HLS_BUCKET_NAME, Key=_record_key(audio_id, is_add))
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+
+    return json.loads(response["Body"].read())
+
+
+def save_loudness(audio_id: str, is_add: bool, record: dict):
+    """
+    Store the loudness measurement of a track.
+    Args:
+        :param audio_id: The ID of the audio file.
+        :param is_add: Whether the audio is an ad creative.
+        :param record: The loudness record.
+    """
+    get_client().put_object(
+        Bucket=HLS_BUCKET_NAME,
+        Key=_record_key(audio_id, is_add),
+        Body=json.dumps(record).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def resolve_loudness(audio_id: str, is_add: bool, object_key: str, input_args: list[str], measure: bool = True):
+    """
+    Get the loudness and normalization gain of a source, measuring it only
+    when no record exists for the current version of the source.
+    Args:
+        :param audio_id: The ID of the audio file.
+        :param is_add: Whether the audio is an ad creative.
+        :param object_key: Key of the source object in the source bucket.
+        :param input_args: ffmpeg input arguments reading the source.
+        :param measure: Whether to measure a source without a record. The
+            measurement is a full extra decode, too slow for a listener waiting on a cold play.
+    :return: A dictionary with "integrated_lufs", "gain_db" and "target_lufs",
+        or None when normalization is disabled, the measurement failed or was skipped.
+    """
+    if not settings.loudness.loudness_normalization_enabled:
+        return None
+
+    try:
+        source_etag = get_client().head_object(Bucket=SOURCE_BUCKET, Key=object_key)["ETag"]
+        stored = load_loudness(audio_id, is_add)
+    except Exception as e:
+        print(f"Error reading loudness record for {audio_id}: {e}")
+        source_etag, stored = None, None
+
+    if stored is not None and source_etag is not None and stored.get("source_etag") == source_etag:
+        print(f"Reusing loudness of {audio_id}: {stored['integrated_lufs']} LUFS")
+        integrated_lufs = stored["integrated_lufs"]
+    elif not measure:
+        print(f"No loudness record for {audio_id}; transcoding without normalization")
+        return None
+    else:
+        try:
+            integrated_lufs = _get_pool().submit(measure_integrated_loudness, input_args).result()
+        except Exception as e:
+            # The track is still transcoded, just without normalization
+            print(f"Error measuring loudness of {audio_id}: {e}")
+            return None
+        print(f"Measured loudness of {audio_id}: {integrated_lufs} LUFS")
+
+    record = {
+        "source_etag": source_etag,
+        "integrated_lufs": integrated_lufs,
+        "gain_db": loudness_gain(integrated_lufs),
+        "target_lufs": settings.loudness.loudness_target_lufs,
+    }
+
+    if source_etag is not None and record != stored:
+        try:
+            save_loudness(audio_id, is_add, record)
+        except Exception as e:
+            print(f"Error storing loudness record for {audio_id}: {e}")
+
+    return record
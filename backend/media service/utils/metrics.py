@@ -0,0 +1,124 @@
+import time
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from config.config import settings
+
+# Latency buckets (seconds) per kind of stage
+S3_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TRANSCODE_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0, 900.0)
+SIGNING_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3)
+
+S3_DOWNLOAD_SECONDS = Histogram(
+    "media_s3_download_seconds",
+    "Time to read a source object from S3, by source input mode",
+    ["mode"],
+    buckets=TRANSCODE_BUCKETS,
+)
+S3_UPLOAD_SECONDS = Histogram(
+    "media_s3_upload_seconds",
+    "Time to upload one HLS object (segment, playlist or media file)",
+    buckets=S3_BUCKETS,
+)
+S3_REQUEST_SECONDS = Histogram(
+    "media_s3_request_seconds",
+    "Latency of S3 metadata requests on the signing path",
+    ["operation"],
+    buckets=S3_BUCKETS,
+)
+FFMPEG_WALL_SECONDS = Histogram(
+    "media_ffmpeg_wall_seconds",
+    "Wall-clock time of one ffmpeg HLS encode",
+    buckets=TRANSCODE_BUCKETS,
+)
+FFMPEG_CPU_SECONDS = Histogram(
+    "media_ffmpeg_cpu_seconds",
+    "User plus system CPU time of one ffmpeg HLS encode",
+    buckets=TRANSCODE_BUCKETS,
+)
+SIGNING_SECONDS_PER_URL = Histogram(
+    "media_signing_seconds_per_url",
+    "Presigning time divided by the number of URLs in the batch",
+    ["method"],
+    buckets=SIGNING_BUCKETS,
+)
+SIGNED_URLS = Counter(
+    "media_signed_urls_total",
+    "URLs presigned",
+    ["method"],
+)
+CACHE_REQUESTS = Counter(
+    "media_cache_requests_total",
+    "Redis cache lookups by cache and result (hit or miss)",
+    ["cache", "result"],
+)
+TRANSCODES_IN_FLIGHT = Gauge(
+    "media_transcodes_in_flight",
+    "HLS transcodes currently running in this process",
+)
+TRANSCODES = Counter(
+    "media_transcodes_total",
+    "Finished HLS transcodes by status",
+    ["status"],
+)
+TRANSCODE_LANE_DEPTH = Gauge(
+    "media_transcode_lane_depth",
+    "Transcodes waiting for admission in this worker process, by priority lane",
+    ["lane"],
+)
+TRANSCODE_ADMISSION_WAIT_SECONDS = Histogram(
+    "media_transcode_admission_wait_seconds",
+    "Time a transcode waited for a CPU slot and scratch-disk budget, by priority lane",
+    ["lane"],
+    buckets=TRANSCODE_BUCKETS,
+)
+TRANSCODE_SLOTS_BUSY = Gauge(
+    "media_transcode_slots_busy",
+    "CPU slots held by admitted transcodes",
+)
+TRANSCODE_SCRATCH_BYTES_RESERVED = Gauge(
+    "media_transcode_scratch_bytes_reserved",
+    "Scratch-disk bytes reserved by admitted transcodes",
+)
+STARTUP_SECONDS = Gauge(
+    "media_startup_seconds",
+    "Seconds from process import to the end of each start-up phase",
+    ["phase"],
+)
+BYTES_MOVED = Counter(
+    "media_bytes_total",
+    "Bytes moved to and from S3 by direction",
+    ["direction"],
+)
+
+
+@contextmanager
+def observe_seconds(histogram):
+    """
+    Time a block into a histogram (or a labelled child of one).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started)
+
+
+def record_cache_lookup(cache: str, hit: bool, count: int = 1):
+    """
+    Count cache lookups.
+    Args:
+        :param cache: The cache name, e.g. "signed_urls" or "playlist_template".
+        :param hit: Whether the lookups were hits.
+        :param count: Number of lookups with that result.
+    """
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc(count)
+
+
+def start_worker_metrics_server():
+    """
+    Expose the metrics of a worker process, which has no HTTP app of its own,
+    on metrics_worker_port.
+    """
+    if settings.metrics.metrics_enabled and settings.metrics.metrics_worker_port:
+        start_http_server(settings.metrics.metrics_worker_port)
+        print(f"Worker metrics available on port {settings.metrics.metrics_worker_port}")
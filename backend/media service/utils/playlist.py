@@ -0,0 +1,163 @@
+import math
+from botocore.exceptions import ClientError
+from libs.s3_client import get_async_client
+from config.config import settings
+from utils.access_tracker import record_access_async
+from utils.generate_signed_url import ensure_folder_segments_async, normalize_quality
+from utils.hls_manifest import folder_prefix, is_complete, load_manifest_async, manifest_init, manifest_segments, parse_media_playlist
+from utils.signed_url_cache import get_cached_playlist_template_async, set_cached_playlist_template_async
+
+HLS_BUCKET_NAME = settings.s3_storage.hls_bucket_name or "hls-playlist"
+PLAYLIST_NAME = "master.m3u8"
+
+
+async def _build_playlist_template(bucket_name: str, prefix: str, quality: str | None):
+    manifest = await load_manifest_async(bucket_name, prefix)
+    variants = {}
+    complete = True
+    init = None
+    byteranges = None
+
+    if manifest is not None:
+        entries = manifest_segments(manifest, quality)
+        segments = [[segment["key"], segment["duration"]] for segment in entries]
+        variants = {name: variant["bandwidth"] for name, variant in (manifest.get("variants") or {}).items()}
+        complete = is_complete(manifest)
+        init = manifest_init(manifest, quality)
+        if init is not None:
+            byteranges = [segment["byterange"] for segment in entries]
+    else:
+        # Legacy folder: read durations from the uploaded ffmpeg playlist
+        s3 = await get_async_client()
+        try:
+            response = await s3.get_object(Bucket=bucket_name, Key=f"{prefix}{PLAYLIST_NAME}")
+            async with response["Body"] as body:
+                content = await body.read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+
+        durations = parse_media_playlist(content.decode("utf-8"))
+        segments = [[f"{prefix}{name}", duration] for name, duration in durations.items()]
+
+    if not segments:
+        return None
+
+    template = {
+        "target_duration": math.ceil(max(duration for _, duration in segments)),
+        "segments": segments,
+        "variants": variants,
+        "complete": complete,
+    }
+    if init is not None:
+        # Single-file fMP4 rendition
+        template["init"] = init
+        template["byteranges"] = byteranges
+    return template
+
+
+async def get_playlist_template_async(audio_id: str, is_add: bool = False, bucket_name: str = HLS_BUCKET_NAME, quality: str | None = None):
+    """
+    Get the unsigned playlist template of an HLS folder, using the async Redis
+    and S3 clients.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+        :param bucket_name: The name of the S3 bucket.
+        :param quality: Rendition name for multi-rendition folders.
+    :return: A dictionary with "target_duration", ordered [key, duration] "segments",
+        the folder's rendition "variants" (name -> bandwidth, empty for single rendition)
+        and "complete" (False while a fast-start transcode is still publishing segments).
+        Single-file fMP4 renditions add the "init" section and per-segment [length, offset]
+        "byteranges".
+    :raises TranscodePending: If the folder is empty and has to be transcoded first.
+    """
+    quality = normalize_quality(quality)
+
+    template = await get_cached_playlist_template_async(audio_id, is_add, quality)
+    if template is not None:
+        await record_access_async(audio_id, is_add)
+        return template
+
+    prefix = folder_prefix(audio_id, is_add)
+    template = await _build_playlist_template(bucket_name, prefix, quality)
+
+    if template is None:
+        # Queues a transcode via TranscodePending if the folder is still empty
+        await ensure_folder_segments_async(audio_id, bucket_name, is_add, quality)
+        template = await _build_playlist_template(bucket_name, prefix, quality)
+        if template is None:
+            return None
+
+    await record_access_async(audio_id, is_add)
+
+    # A fast-start template grows with every published segment
+    if template["complete"]:
+        await set_cached_playlist_template_async(audio_id, is_add, template, quality)
+    return template
+
+
+def _byterange(byterange: list[int]) -> str:
+    length, offset = byterange
+    return f"{length}@{offset}"
+
+
+def render_playlist(template: dict, uris: list[str], init_uri: str | None = None) -> str:
+    """
+    Render a media playlist from a template and one URI per segment: VOD for
+    complete folders, a growing EVENT playlist (no ENDLIST, so players keep
+    reloading it) while a fast-start transcode is still running.
+    Args:
+        :param template: The playlist template.
+        :param uris: Segment URIs, in the same order as the template segments.
+        :param init_uri: URI of the fMP4 initialization section, for single-file templates.
+    :return: The .m3u8 playlist text.
+    """
+    complete = template.get("complete", True)
+    init = template.get("init")
+
+    lines = [
+        "#EXTM3U",
+        # Byte ranges need version 4, EXT-X-MAP in a media playlist version 6
+        f"#EXT-X-VERSION:{6 if init else 3}",
+        f"#EXT-X-PLAYLIST-TYPE:{'VOD' if complete else 'EVENT'}",
+        f"#EXT-X-TARGETDURATION:{template['target_duration']}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+    ]
+
+    if init:
+        attributes = f'URI="{init_uri}"'
+        if init.get("byterange"):
+            attributes += f',BYTERANGE="{_byterange(init["byterange"])}"'
+        lines.append(f"#EXT-X-MAP:{attributes}")
+
+    byteranges = template.get("byteranges") or [None] * len(uris)
+    for (_, duration), byterange, uri in zip(template["segments"], byteranges, uris):
+        lines.append(f"#EXTINF:{duration:.6f},")
+        if byterange:
+            lines.append(f"#EXT-X-BYTERANGE:{_byterange(byterange)}")
+        lines.append(uri)
+
+    if complete:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def render_master_playlist(template: dict, variant_uris: dict) -> str:
+    """
+    Render a master playlist listing one media playlist per rendition.
+    Args:
+        :param template: The playlist template (its "variants" give each bandwidth).
+        :param variant_uris: Rendition name -> media playlist URI.
+    :return: The .m3u8 playlist text.
+    """
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-INDEPENDENT-SEGMENTS"]
+
+    # Lowest bandwidth first, as players start from the first variant
+    for name, bandwidth in sorted(template["variants"].items(), key=lambda item: item[1]):
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},CODECS="mp4a.40.2"')
+        lines.append(variant_uris[name])
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from libs.redis import async_redis_connection
+from libs.s3_client import get_async_client
+from config.config import settings
+from utils.metrics import STARTUP_SECONDS
+
+HLS_BUCKET_NAME = settings.s3_storage.hls_bucket_name or "hls-playlist"
+
+_state = {
+    "started": False,
+    "import_seconds": None,
+    "ready_seconds": None,
+}
+_last_check = {"at": 0.0, "checks": None}
+_check_lock = asyncio.Lock()
+
+
+def mark_imported(started_at: float):
+    """
+    Record how long importing the app took.
+    Args:
+        :param started_at: perf_counter() value taken before the app's imports.
+    """
+    _state["import_seconds"] = round(time.perf_counter() - started_at, 3)
+    STARTUP_SECONDS.labels(phase="import").set(_state["import_seconds"])
+
+
+def mark_started(started_at: float):
+    """
+    Record that start-up (client warm-up) finished.
+    Args:
+        :param started_at: perf_counter() value taken before the app's imports.
+    """
+    _state["started"] = True
+    _state["ready_seconds"] = round(time.perf_counter() - started_at, 3)
+    STARTUP_SECONDS.labels(phase="ready").set(_state["ready_seconds"])
+    print(f"Media service ready: imported in {_state['import_seconds']}s, ready after {_state['ready_seconds']}s")
+
+
+async def _check(name: str, probe) -> tuple[str, str]:
+    try:
+        await asyncio.wait_for(probe(), timeout=settings.server.readiness_timeout)
+        return name, "ok"
+    except Exception as e:
+        return name, f"error: {e}"
+
+
+async def _check_s3():
+    s3 = await get_async_client()
+    await s3.head_bucket(Bucket=HLS_BUCKET_NAME)
+
+
+async def readiness() -> tuple[bool, dict]:
+    """
+    Check whether the service can take traffic: start-up has finished and
+    Redis and S3 answer. Dependency checks are cached for
+    readiness_cache_seconds, so frequent probes stay cheap.
+    :return: Whether the service is ready, and the report served by /readyz.
+    """
+    report = {**_state, "checks": None}
+    if not _state["started"]:
+        return False, report
+
+    async with _check_lock:
+        if _last_check["checks"] is None or time.monotonic() - _last_check["at"] >= settings.server.readiness_cache_seconds:
+            results = await asyncio.gather(
+                _check("redis", async_redis_connection.ping),
+                _check("s3", _check_s3),
+            )
+            _last_check["checks"] = dict(results)
+            _last_check["at"] = time.monotonic()
+
+    report["checks"] = _last_check["checks"]
+    return all(status == "ok" for status in report["checks"].values()), report
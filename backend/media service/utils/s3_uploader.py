@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from boto3.s3.transfer import TransferConfig
+from libs.s3_client import get_client
+from config.config import settings
+from utils.metrics import BYTES_MOVED, S3_UPLOAD_SECONDS
+
+# Larger files (e.g. single-file renditions) go through s3transfer's multipart upload
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+TRANSFER_CONFIG = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, max_concurrency=4)
+
+# One bounded pool per process, shared by every concurrent transcode
+_executor = ThreadPoolExecutor(
+    max_workers=settings.s3_storage.s3_upload_concurrency,
+    thread_name_prefix="s3-upload"
+)
+
+
+def upload_object(file_path: str, bucket_name: str, object_key: str, metadata: dict) -> float:
+    """
+    Upload one file, retrying it independently of any other upload.
+    Args:
+        :param file_path: Local path of the file.
+        :param bucket_name: The name of the S3 bucket.
+        :param object_key: The destination key.
+        :param metadata: User metadata stored with the object.
+    :return: Seconds spent on the successful attempt.
+    """
+    attempts = max(1, settings.s3_storage.s3_upload_attempts)
+    size = os.path.getsize(file_path)
+
+    for attempt in range(1, attempts + 1):
+        started = time.monotonic()
+        try:
+            if size >= MULTIPART_THRESHOLD:
+                get_client().upload_file(
+                    Filename=file_path,
+                    Bucket=bucket_name,
+                    Key=object_key,
+                    ExtraArgs={"Metadata": metadata},
+                    Config=TRANSFER_CONFIG
+                )
+            else:
+                # A single PUT; avoids building a transfer manager per segment
+                with open(file_path, "rb") as body:
+                    get_client().put_object(Bucket=bucket_name, Key=object_key, Body=body, Metadata=metadata)
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            print(f"Upload of {object_key} failed (attempt {attempt}/{attempts}): {e}")
+            time.sleep(0.2 * 2 ** (attempt - 1))
+            continue
+
+        elapsed = time.monotonic() - started
+        S3_UPLOAD_SECONDS.observe(elapsed)
+        BYTES_MOVED.labels(direction="upload").inc(size)
+        throughput = size / elapsed / 1024 if elapsed > 0 else 0.0
+        print(f"Uploaded {object_key} to {bucket_name} ({size} B in {elapsed:.3f}s, {throughput:.0f} KiB/s)")
+        return elapsed
+
+
+class UploadBatch:
+    """
+    A group of uploads submitted to the shared pool, e.g. the segments of one track.
+    """
+
+    def __init__(self, bucket_name: str, metadata: dict):
+        self.bucket_name = bucket_name
+        self.metadata = metadata
+        self.futures = []
+        self.objects = 0
+        self.bytes = 0
+        self.upload_seconds = 0.0
+        self.completed = set()
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _run(self, file_path: str, object_key: str, size: int, remove_after: bool):
+        elapsed = upload_object(file_path, self.bucket_name, object_key, self.metadata)
+        if remove_after:
+            os.remove(file_path)
+        with self._lock:
+            self.objects += 1
+            self.bytes += size
+            self.upload_seconds += elapsed
+            self.completed.add(object_key)
+
+    def submit(self, file_path: str, object_key: str, remove_after: bool = False):
+        """
+        Queue a file for upload.
+        Args:
+            :param file_path: Local path of the file.
+            :param object_key: The destination key.
+            :param remove_after: Delete the local file once it is uploaded.
+        """
+        size = os.path.getsize(file_path)
+        self.futures.append(_executor.submit(self._run, file_path, object_key, size, remove_after))
+
+    def completed_keys(self) -> set:
+        """
+        Keys of the objects uploaded so far.
+        """
+        with self._lock:
+            return set(self.completed)
+
+    def wait(self) -> dict:
+        """
+        Wait for every submitted upload.
+        :return: Throughput statistics of the batch.
+        :raises Exception: The first upload error, after all uploads have settled.
+        """
+        wait(self.futures)
+        for future in self.futures:
+            future.result()
+        return self.stats()
+
+    def stats(self) -> dict:
+        wall_seconds = time.monotonic() - self.started
+        return {
+            "objects": self.objects,
+            "bytes": self.bytes,
+            "upload_seconds": round(self.upload_seconds, 3),
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_kib_s": round(self.bytes / wall_seconds / 1024, 1) if wall_seconds > 0 else 0.0,
+        }
@@ -0,0 +1,262 @@
+import json
+from libs.redis import async_redis_connection, redis_connection
+from config.config import settings
+from utils.metrics import record_cache_lookup
+
+CACHE_PREFIX = "signed_urls"
+# SigV4 presigned URLs are valid for at most 7 days
+MAX_URL_EXPIRATION = 7 * 24 * 3600
+
+
+def expiration_bucket(expiration: int) -> int:
+    """
+    Round a requested expiration up to the configured bucket size.
+    Args:
+        :param expiration: Requested URL expiration time in seconds.
+    :return: The bucketed expiration in seconds (never below one bucket).
+    """
+    size = max(1, settings.signed_url_cache.signed_url_cache_bucket_seconds)
+    return max(size, -(-int(expiration) // size) * size)
+
+
+def _folder_key(audio_id: str, is_add: bool) -> str:
+    return f"{CACHE_PREFIX}:{'add' if is_add else 'music'}:{audio_id}"
+
+
+def _cache_key(audio_id: str, is_add: bool, bucket: int, scope: str | None = None) -> str:
+    key = f"{_folder_key(audio_id, is_add)}:{bucket}"
+    return f"{key}:{scope}" if scope else key
+
+
+def _index_key(audio_id: str, is_add: bool) -> str:
+    # Set of the folder's cache keys, so invalidation never scans the keyspace
+    return f"{_folder_key(audio_id, is_add)}:keys"
+
+
+def _index_ttl(ttl: int) -> int:
+    # Outlives every entry of the folder, so no indexed key outlives its index
+    ratio = settings.signed_url_cache.signed_url_cache_ttl_ratio
+    return max(ttl, settings.signed_url_cache.playlist_template_ttl, int(MAX_URL_EXPIRATION * ratio))
+
+
+def _queue_set(pipeline, audio_id: str, is_add: bool, key: str, ttl: int, value: dict):
+    # Write an entry and index it, queued on a pipeline (one round trip)
+    index = _index_key(audio_id, is_add)
+    pipeline.setex(key, ttl, json.dumps(value))
+    pipeline.sadd(index, key)
+    pipeline.expire(index, _index_ttl(ttl))
+
+
+def get_cached_signed_urls(audio_id: str, is_add: bool, bucket: int, scope: str | None = None):
+    """
+    Look up a cached set of signed URLs.
+    Args:
+        :param audio_id: The audio ID the URLs belong to.
+        :param is_add: Whether the audio is an ad creative.
+        :param bucket: The bucketed expiration the URLs were signed with.
+        :param scope: Optional sub-set name (e.g. a segment window), None for the whole folder.
+    :return: A dictionary of object keys to signed URLs, or None on a miss.
+    """
+    if not settings.signed_url_cache.signed_url_cache_enabled:
+        return None
+
+    try:
+        cached = redis_connection.get(_cache_key(audio_id, is_add, bucket, scope))
+    except Exception as e:
+        print(f"Error reading signed URL cache for {audio_id}: {e}")
+        return None
+
+    record_cache_lookup("signed_urls", cached is not None)
+    return json.loads(cached) if cached is not None else None
+
+
+def set_cached_signed_urls(audio_id: str, is_add: bool, bucket: int, signed_urls: dict, scope: str | None = None):
+    """
+    Store a set of signed URLs with a TTL safely below their expiry.
+    Args:
+        :param audio_id: The audio ID the URLs belong to.
+        :param is_add: Whether the audio is an ad creative.
+        :param bucket: The bucketed expiration the URLs were signed with.
+        :param signed_urls: A dictionary of object keys to signed URLs.
+        :param scope: Optional sub-set name (e.g. a segment window), None for the whole folder.
+    """
+    if not settings.signed_url_cache.signed_url_cache_enabled or not signed_urls:
+        return
+
+    ttl = int(bucket * settings.signed_url_cache.signed_url_cache_ttl_ratio)
+    if ttl <= 0:
+        return
+
+    try:
+        pipeline = redis_connection.pipeline(transaction=False)
+        _queue_set(pipeline, audio_id, is_add, _cache_key(audio_id, is_add, bucket, scope), ttl, signed_urls)
+        pipeline.execute()
+    except Exception as e:
+        print(f"Error writing signed URL cache for {audio_id}: {e}")
+
+
+async def get_cached_signed_urls_async(audio_id: str, is_add: bool, bucket: int, scope: str | None = None):
+    """
+    Async counterpart of get_cached_signed_urls.
+    Args:
+        :param audio_id: The audio ID the URLs belong to.
+        :param is_add: Whether the audio is an ad creative.
+        :param bucket: The bucketed expiration the URLs were signed with.
+        :param scope: Optional sub-set name (e.g. a segment window), None for the whole folder.
+    :return: A dictionary of object keys to signed URLs, or None on a miss.
+    """
+    if not settings.signed_url_cache.signed_url_cache_enabled:
+        return None
+
+    try:
+        cached = await async_redis_connection.get(_cache_key(audio_id, is_add, bucket, scope))
+    except Exception as e:
+        print(f"Error reading signed URL cache for {audio_id}: {e}")
+        return None
+
+    record_cache_lookup("signed_urls", cached is not None)
+    return json.loads(cached) if cached is not None else None
+
+
+async def set_cached_signed_urls_async(audio_id: str, is_add: bool, bucket: int, signed_urls: dict, scope: str | None = None):
+    """
+    Async counterpart of set_cached_signed_urls.
+    Args:
+        :param audio_id: The audio ID the URLs belong to.
+        :param is_add: Whether the audio is an ad creative.
+        :param bucket: The bucketed expiration the URLs were signed with.
+        :param signed_urls: A dictionary of object keys to signed URLs.
+        :param scope: Optional sub-set name (e.g. a segment window), None for the whole folder.
+    """
+    if not settings.signed_url_cache.signed_url_cache_enabled or not signed_urls:
+        return
+
+    ttl = int(bucket * settings.signed_url_cache.signed_url_cache_ttl_ratio)
+    if ttl <= 0:
+        return
+
+    try:
+        pipeline = async_redis_connection.pipeline(transaction=False)
+        _queue_set(pipeline, audio_id, is_add, _cache_key(audio_id, is_add, bucket, scope), ttl, signed_urls)
+        await pipeline.execute()
+    except Exception as e:
+        print(f"Error writing signed URL cache for {audio_id}: {e}")
+
+
+async def get_cached_signed_urls_many_async(folders: list[tuple[str, bool]], bucket: int, scope: str | None = None) -> list:
+    """
+    Look up the cached URL sets of many folders in one round trip.
+    Args:
+        :param folders: (audio_id, is_add) pairs.
+        :param bucket: The bucketed expiration the URLs were signed with.
+        :param scope: Optional sub-set name, None for whole folders.
+    :return: One dictionary of object keys to signed URLs per folder, None on a miss.
+    """
+    if not settings.signed_url_cache.signed_url_cache_enabled or not folders:
+        return [None] * len(folders)
+
+    try:
+        cached = await async_redis_connection.mget(
+            [_cache_key(audio_id, is_add, bucket, scope) for audio_id, is_add in folders]
+        )
+    except Exception as e:
+        print(f"Error reading signed URL cache for {len(folders)} folders: {e}")
+        return [None] * len(folders)
+
+    hits = sum(value is not None for value in cached)
+    record_cache_lookup("signed_urls", True, hits)
+    record_cache_lookup("signed_urls", False, len(folders) - hits)
+
+    return [json.loads(value) if value is not None else None for value in cached]
+
+
+async def set_cached_signed_urls_many_async(entries: list[tuple[str, bool, dict]], bucket: int, scope: str | None = None):
+    """
+    Store the URL sets of many folders in one pipelined round trip.
+    Args:
+        :param entries: (audio_id, is_add, signed_urls) triples.
+        :param bucket: The bucketed expiration the URLs were signed with.
+        :param scope: Optional sub-set name, None for whole folders.
+    """
+    entries = [entry for entry in entries if entry[2]]
+    if not settings.signed_url_cache.signed_url_cache_enabled or not entries:
+        return
+
+    ttl = int(bucket * settings.signed_url_cache.signed_url_cache_ttl_ratio)
+    if ttl <= 0:
+        return
+
+    try:
+        pipeline = async_redis_connection.pipeline(transaction=False)
+        for audio_id, is_add, signed_urls in entries:
+            _queue_set(pipeline, audio_id, is_add, _cache_key(audio_id, is_add, bucket, scope), ttl, signed_urls)
+        await pipeline.execute()
+    except Exception as e:
+        print(f"Error writing signed URL cache for {len(entries)} folders: {e}")
+
+
+def _template_key(audio_id: str, is_add: bool, quality: str | None) -> str:
+    return f"{_folder_key(audio_id, is_add)}:template:{quality or 'default'}"
+
+
+async def get_cached_playlist_template_async(audio_id: str, is_add: bool, quality: str | None = None):
+    """
+    Look up the cached (unsigned) playlist template of an audio folder.
+    Args:
+        :param audio_id: The audio ID of the folder.
+        :param is_add: Whether the audio is an ad creative.
+        :param quality: Rendition name, None for the default rendition.
+    :return: The template dictionary, or None on a miss.
+    """
+    try:
+        cached = await async_redis_connection.get(_template_key(audio_id, is_add, quality))
+    except Exception as e:
+        print(f"Error reading playlist template cache for {audio_id}: {e}")
+        return None
+
+    record_cache_lookup("playlist_template", cached is not None)
+    return json.loads(cached) if cached is not None else None
+
+
+async def set_cached_playlist_template_async(audio_id: str, is_add: bool, template: dict, quality: str | None = None):
+    """
+    Store the playlist template of an audio folder.
+    Args:
+        :param audio_id: The audio ID of the folder.
+        :param is_add: Whether the audio is an ad creative.
+        :param template: The template dictionary.
+        :param quality: Rendition name, None for the default rendition.
+    """
+    try:
+        pipeline = async_redis_connection.pipeline(transaction=False)
+        _queue_set(
+            pipeline, audio_id, is_add,
+            _template_key(audio_id, is_add, quality),
+            settings.signed_url_cache.playlist_template_ttl,
+            template
+        )
+        await pipeline.execute()
+    except Exception as e:
+        print(f"Error writing playlist template cache for {audio_id}: {e}")
+
+
+def invalidate_signed_urls(audio_id: str, is_add: bool = False):
+    """
+    Drop every cached URL set and playlist template of an audio folder,
+    e.g. after it is re-uploaded. Only the folder's own keys are touched,
+    through its index set.
+    Args:
+        :param audio_id: The audio ID whose cache entries should be removed.
+        :param is_add: Whether the audio is an ad creative.
+    """
+    index = _index_key(audio_id, is_add)
+    try:
+        # Read and drop the index atomically: a key cached meanwhile lands in a fresh index
+        pipeline = redis_connection.pipeline()
+        pipeline.smembers(index)
+        pipeline.delete(index)
+        keys, _ = pipeline.execute()
+        if keys:
+            redis_connection.delete(*keys)
+    except Exception as e:
+        print(f"Error invalidating signed URL cache for {audio_id}: {e}")
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+from redis.exceptions import LockError
+from libs.redis import redis_connection
+from config.config import settings
+
+
+@contextmanager
+def single_flight(audio_id: str, is_add: bool = False, blocking: bool = True):
+    """
+    Hold the distributed transcode lock of an audio folder.
+
+    Only one holder runs at a time across all media-service replicas and
+    workers; other callers block until the holder releases the lock (i.e. the
+    transcode is done) and should re-check the folder before transcoding.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+        :param blocking: Wait for the current holder; when False, fail at once if the lock is held.
+    :raises LockError: If the lock is not acquired within the lock timeout.
+    """
+    lock = redis_connection.lock(
+        f"hls:lock:{'add' if is_add else 'music'}:{audio_id}",
+        timeout=settings.transcode.transcode_lock_timeout,
+        blocking_timeout=settings.transcode.transcode_lock_timeout,
+    )
+
+    if not lock.acquire(blocking=blocking):
+        raise LockError(f"Could not acquire the transcode lock for {audio_id}")
+
+    try:
+        yield
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # The lock expired while we held it; nothing left to release
+            print(f"Transcode lock for {audio_id} expired before release")
@@ -0,0 +1,360 @@
+import datetime
+import math
+import time
+from bullmq import Job, Queue
+from libs.redis import async_redis_connection, redis_connection, connection_url
+from config.config import settings
+from utils.transcode_scheduler import transcode_lane
+
+TRANSCODE_QUEUE_NAME = "hls-transcode"
+STATUS_PREFIX = "hls:status"
+# Marks a track a listener is waiting for, so its transcode runs in an interactive lane
+INTERACTIVE_PREFIX = "hls:interactive"
+STATUS_TTL = 86400
+
+QUEUED = "queued"
+PROCESSING = "processing"
+READY = "ready"
+FAILED = "failed"
+
+# Why a transcode FAILED. A missing or undecodable source fails the same way
+# every time, so requests get an error for it instead of another transcode
+SOURCE_MISSING = "source_missing"
+UNDECODABLE = "undecodable"
+TRANSIENT = "transient"
+FAILURE_STATUS_CODES = {SOURCE_MISSING: 404, UNDECODABLE: 422}
+
+_queue = None
+
+
+class TranscodePending(Exception):
+    """
+    Raised when an HLS folder does not exist yet and has to be transcoded in the background.
+    """
+
+    def __init__(self, audio_id: str, is_add: bool, retry_after: int):
+        super().__init__(f"HLS for {audio_id} is still being prepared")
+        self.audio_id = audio_id
+        self.is_add = is_add
+        self.retry_after = retry_after
+
+
+class TranscodeFailed(Exception):
+    """
+    Raised instead of queueing a transcode when the last one found the source
+    missing or undecodable, which another attempt would not change.
+    """
+
+    def __init__(self, audio_id: str, is_add: bool, reason: str, message: str = ""):
+        super().__init__(message or f"HLS for {audio_id} cannot be generated ({reason})")
+        self.audio_id = audio_id
+        self.is_add = is_add
+        self.reason = reason
+        self.status_code = FAILURE_STATUS_CODES.get(reason, 500)
+
+
+def _status_key(audio_id: str, is_add: bool) -> str:
+    return f"{STATUS_PREFIX}:{'add' if is_add else 'music'}:{audio_id}"
+
+
+def _interactive_key(audio_id: str, is_add: bool) -> str:
+    return f"{INTERACTIVE_PREFIX}:{'add' if is_add else 'music'}:{audio_id}"
+
+
+def is_interactive(audio_id: str, is_add: bool = False) -> bool:
+    """
+    Check whether a listener asked for a track whose transcode is queued.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    :return: True if the track was requested while it was missing.
+    """
+    return bool(redis_connection.exists(_interactive_key(audio_id, is_add)))
+
+
+async def is_interactive_async(audio_id: str, is_add: bool = False) -> bool:
+    """
+    Async counterpart of is_interactive.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    :return: True if the track was requested while it was missing.
+    """
+    return bool(await async_redis_connection.exists(_interactive_key(audio_id, is_add)))
+
+
+def transcode_job_id(audio_id: str, is_add: bool = False) -> str:
+    """
+    Build the BullMQ job ID of a transcode, shared with the API's upload-time jobs
+    so a track is never queued twice.
+    """
+    return f"{'add' if is_add else 'music'}-{audio_id}"
+
+
+def transcode_priority(is_add: bool, interactive: bool) -> int:
+    """
+    Map the lane of a transcode to its BullMQ priority (1 is taken first), so a
+    cold play is pulled from Redis ahead of a bulk backlog, not only reordered
+    among the jobs one worker already holds. Every job needs one: BullMQ hands
+    out jobs without a priority before all prioritized ones.
+    Args:
+        :param is_add: Whether the audio is an ad creative.
+        :param interactive: Whether a listener is waiting for it.
+    :return: The position of the lane in transcode_lane_order, from 1.
+    """
+    order = settings.transcode.transcode_lane_order
+    lane = transcode_lane(is_add, interactive)
+    return order.index(lane) + 1 if lane in order else len(order) + 1
+
+
+async def _promote_job(job_id: str, priority: int) -> bool:
+    """
+    Move a transcode job still waiting in Redis (e.g. the upload-time one)
+    ahead of lower-priority jobs. It is removed and added again with the new
+    priority, through public BullMQ calls only; a job a worker has already
+    taken is put in an interactive lane by is_interactive_async instead.
+    Args:
+        :param job_id: The BullMQ job ID.
+        :param priority: The priority it should have.
+    :return: True if the job now waits with at least that priority.
+    """
+    queue = _get_queue()
+    job = await Job.fromId(queue, job_id)
+    if job is None or await queue.getJobState(job_id) not in ("waiting", "prioritized"):
+        return False
+    if 0 < job.priority <= priority:
+        return True
+
+    try:
+        # Refused if a worker took the job in the meantime
+        await job.remove()
+    except Exception as e:
+        print(f"Transcode job {job_id} not promoted: {e}")
+        return False
+
+    await queue.add(
+        job.name,
+        {**job.data, "interactive": True},
+        {
+            "jobId": job_id,
+            "priority": priority,
+            "removeOnComplete": True,
+            "removeOnFail": True,
+        },
+    )
+    return True
+
+
+def _status_mapping(state: str, message: str, reason: str) -> dict:
+    return {
+        "state": state,
+        "message": message,
+        "reason": reason,
+        "updated_at": datetime.datetime.utcnow().isoformat(),
+    }
+
+
+def _status_ttl(state: str, reason: str) -> int:
+    # A permanent failure is re-checked once it expires, e.g. after a late upload
+    if state == FAILED and reason in FAILURE_STATUS_CODES:
+        return settings.transcode.transcode_permanent_failure_ttl
+    return STATUS_TTL
+
+
+def set_transcode_status(audio_id: str, is_add: bool, state: str, message: str = "", reason: str = ""):
+    """
+    Record the transcode state of an audio folder.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+        :param state: One of QUEUED, PROCESSING, READY or FAILED.
+        :param message: Optional detail, e.g. the failure reason.
+        :param reason: With FAILED, one of SOURCE_MISSING, UNDECODABLE or TRANSIENT.
+    """
+    key = _status_key(audio_id, is_add)
+    try:
+        redis_connection.hset(key, mapping=_status_mapping(state, message, reason))
+        redis_connection.expire(key, _status_ttl(state, reason))
+    except Exception as e:
+        print(f"Error recording transcode status for {audio_id}: {e}")
+
+
+async def set_transcode_status_async(audio_id: str, is_add: bool, state: str, message: str = "", reason: str = ""):
+    """
+    Async counterpart of set_transcode_status.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+        :param state: One of QUEUED, PROCESSING, READY or FAILED.
+        :param message: Optional detail, e.g. the failure reason.
+        :param reason: With FAILED, one of SOURCE_MISSING, UNDECODABLE or TRANSIENT.
+    """
+    key = _status_key(audio_id, is_add)
+    try:
+        await async_redis_connection.hset(key, mapping=_status_mapping(state, message, reason))
+        await async_redis_connection.expire(key, _status_ttl(state, reason))
+    except Exception as e:
+        print(f"Error recording transcode status for {audio_id}: {e}")
+
+
+def clear_transcode_status(audio_id: str, is_add: bool = False):
+    """
+    Forget the transcode state of an audio folder, e.g. after it is evicted.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    """
+    redis_connection.delete(_status_key(audio_id, is_add))
+
+
+def get_transcode_status(audio_id: str, is_add: bool = False):
+    """
+    Read the transcode state of an audio folder.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    :return: A dictionary with "state", "message" and "updated_at", or None if unknown.
+    """
+    raw = redis_connection.hgetall(_status_key(audio_id, is_add))
+    if not raw:
+        return None
+    return {key.decode(): value.decode() for key, value in raw.items()}
+
+
+async def get_transcode_status_async(audio_id: str, is_add: bool = False):
+    """
+    Async counterpart of get_transcode_status.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    :return: A dictionary with "state", "message" and "updated_at", or None if unknown.
+    """
+    raw = await async_redis_connection.hgetall(_status_key(audio_id, is_add))
+    if not raw:
+        return None
+    return {key.decode(): value.decode() for key, value in raw.items()}
+
+
+def _get_queue() -> Queue:
+    global _queue
+
+    if _queue is None:
+        _queue = Queue(TRANSCODE_QUEUE_NAME, {"connection": connection_url})
+    return _queue
+
+
+async def get_queue_stats() -> dict:
+    """
+    Report the backlog of the transcode queue across all workers.
+    :return: Job counts by state and by lane, and the age in seconds of the oldest waiting job.
+    """
+    queue = _get_queue()
+    counts = await queue.getJobCounts("wait", "prioritized", "active", "delayed", "failed")
+
+    lanes = settings.transcode.transcode_lane_order
+    priorities = list(range(1, len(lanes) + 2))
+    priority_counts = await queue.getCountsPerPriority(priorities)
+
+    # BullMQ pushes new jobs to the head of the wait list, so the oldest is
+    # last. Prioritized jobs are ordered by priority, then age, so the oldest
+    # of a priority is the first after the jobs of higher priorities
+    waiting = await queue.getWaiting(-1, -1)
+    offset = 0
+    for priority in priorities:
+        count = priority_counts.get(str(priority), 0)
+        if count:
+            waiting += await queue.getPrioritized(offset, offset)
+        offset += count
+
+    timestamps = [job.timestamp for job in waiting if job.timestamp]
+    oldest_age = None
+    if timestamps:
+        oldest_age = round(max(0.0, time.time() - min(timestamps) / 1000), 1)
+
+    lane_counts = {lane: priority_counts.get(str(i + 1), 0) for i, lane in enumerate(lanes)}
+    return {"counts": counts, "lane_counts": lane_counts, "oldest_wait_seconds": oldest_age}
+
+
+def _failure_backoff(status: dict) -> int:
+    # Seconds left before a transiently failed transcode may be retried
+    try:
+        failed_at = datetime.datetime.fromisoformat(status["updated_at"])
+    except (KeyError, ValueError):
+        return 0
+    age = (datetime.datetime.utcnow() - failed_at).total_seconds()
+    return max(0, math.ceil(settings.transcode.transcode_failure_backoff_seconds - age))
+
+
+async def enqueue_transcode(audio_id: str, is_add: bool = False) -> int:
+    """
+    Queue a background HLS transcode unless one is already queued or running,
+    or the last one failed.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    :return: Seconds before a transiently failed transcode is retried (0 once queued).
+    :raises TranscodeFailed: If the last transcode found the source missing or undecodable.
+    """
+    status = await get_transcode_status_async(audio_id, is_add)
+
+    if status and status["state"] == FAILED:
+        reason = status.get("reason") or TRANSIENT
+        if reason in FAILURE_STATUS_CODES:
+            raise TranscodeFailed(audio_id, is_add, reason, status.get("message", ""))
+        # Without a backoff every client poll would start another failing transcode
+        backoff = _failure_backoff(status)
+        if backoff:
+            return backoff
+
+    # Also puts a bulk job a worker already holds in an interactive lane
+    await async_redis_connection.set(
+        _interactive_key(audio_id, is_add), 1, ex=settings.transcode.transcode_lock_timeout
+    )
+
+    if status and status["state"] == PROCESSING:
+        return 0
+
+    job_id = transcode_job_id(audio_id, is_add)
+    priority = transcode_priority(is_add, True)
+
+    if not status or status["state"] != QUEUED:
+        # Deduplicated by the job ID against a bulk job queued after the upload
+        await _get_queue().add(
+            TRANSCODE_QUEUE_NAME,
+            {"audioId": audio_id, "isAdd": is_add, "interactive": True},
+            {
+                "jobId": job_id,
+                "priority": priority,
+                "removeOnComplete": True,
+                "removeOnFail": True,
+            },
+        )
+        await set_transcode_status_async(audio_id, is_add, QUEUED)
+
+    try:
+        await _promote_job(job_id, priority)
+    except Exception:
+        # Removed but not added back: let the next request queue it again
+        await async_redis_connection.delete(_status_key(audio_id, is_add))
+        raise
+    return 0
+
+
+async def enqueue_loudness_correction(audio_id: str, is_add: bool = False):
+    """
+    Queue a bulk job measuring the loudness of a track an interactive transcode
+    published without it, and re-transcoding the track if the gain is audible.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+    """
+    await _get_queue().add(
+        TRANSCODE_QUEUE_NAME,
+        {"audioId": audio_id, "isAdd": is_add, "loudnessCorrection": True},
+        {
+            "jobId": f"loudness-{transcode_job_id(audio_id, is_add)}",
+            "priority": transcode_priority(is_add, False),
+            "removeOnComplete": True,
+            "removeOnFail": True,
+        },
+    )
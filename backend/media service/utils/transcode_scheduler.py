@@ -0,0 +1,205 @@
+import asyncio
+import os
+import shutil
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from libs.s3_client import get_client
+from config.config import settings
+from utils.metrics import (
+    TRANSCODE_ADMISSION_WAIT_SECONDS,
+    TRANSCODE_LANE_DEPTH,
+    TRANSCODE_SCRATCH_BYTES_RESERVED,
+    TRANSCODE_SLOTS_BUSY,
+)
+
+# Where generate_hls writes its temporary download and HLS output
+SCRATCH_DIR = "/tmp"
+
+
+def transcode_lane(is_add: bool, interactive: bool) -> str:
+    """
+    Name the priority lane of a transcode.
+    Args:
+        :param is_add: Whether the audio is an ad creative.
+        :param interactive: Whether a listener is waiting for it (a cold play),
+            rather than it being pre-generated in bulk after an upload.
+    :return: One of the lanes of transcode_lane_order.
+    """
+    return f"{'interactive' if interactive else 'bulk'}-{'add' if is_add else 'music'}"
+
+
+def estimate_scratch_bytes(audio_id: str, is_add: bool = False) -> int:
+    """
+    Estimate the peak scratch-disk use of transcoding a track, from the size
+    of its source object.
+    Args:
+        :param audio_id: The audio ID of the track.
+        :param is_add: Whether the audio is an ad creative.
+    :return: The estimated bytes.
+    """
+    estimate = settings.transcode.transcode_scratch_overhead_bytes
+
+    try:
+        head = get_client().head_object(
+            Bucket=settings.s3_storage.s3_bucket_name,
+            Key=f"{'add' if is_add else 'music'}/{audio_id}"
+        )
+        source_bytes = head["ContentLength"]
+    except Exception as e:
+        # generate_hls reports a missing source; admit it at the base estimate
+        print(f"Error reading the source size of {audio_id}: {e}")
+        return estimate
+
+    # .ts segments leave the disk as soon as they are uploaded, but a
+    # downloaded source and single-file renditions stay until the end
+    if settings.hls.hls_source_input == "file":
+        estimate += source_bytes
+    if settings.hls.hls_single_file:
+        estimate += int(source_bytes * settings.transcode.transcode_single_file_size_ratio)
+    return estimate
+
+
+@dataclass
+class _Ticket:
+    lane: str
+    scratch_bytes: int
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class TranscodeScheduler:
+    """
+    Admit transcodes against a number of CPU slots and a scratch-disk byte
+    budget, highest priority lane first. A job that waited longer than
+    transcode_starvation_seconds goes first regardless of its lane.
+
+    Runs on the worker's event loop; jobs wait for admission without holding
+    a thread. The slots and the budget are per worker process (a replica
+    sizes them to its own CPUs and /tmp), and the lanes only order the jobs
+    that process already took; which jobs it takes from Redis is decided by
+    their BullMQ priority (see transcode_priority).
+    """
+
+    def __init__(self, cpu_slots: int, scratch_budget_bytes: int, lane_order: list[str], starvation_seconds: float):
+        self.cpu_slots = cpu_slots
+        self.scratch_budget_bytes = scratch_budget_bytes
+        self.lane_order = list(lane_order)
+        self.starvation_seconds = starvation_seconds
+        self._waiting = {lane: deque() for lane in self.lane_order}
+        self._slots_busy = 0
+        self._bytes_reserved = 0
+
+    def depth(self) -> dict:
+        """
+        :return: The number of jobs waiting for admission, per lane.
+        """
+        return {lane: len(waiting) for lane, waiting in self._waiting.items()}
+
+    def _fits(self, ticket: _Ticket) -> bool:
+        if self._slots_busy >= self.cpu_slots:
+            return False
+        if not self.scratch_budget_bytes or not self._bytes_reserved:
+            # A job larger than the whole budget still runs, alone
+            return True
+        return self._bytes_reserved + ticket.scratch_bytes <= self.scratch_budget_bytes
+
+    def _next(self) -> _Ticket | None:
+        heads = [waiting[0] for waiting in self._waiting.values() if waiting]
+        if not heads:
+            return None
+
+        oldest = min(heads, key=lambda ticket: ticket.queued_at)
+        if time.monotonic() - oldest.queued_at >= self.starvation_seconds:
+            return oldest
+
+        for lane in self.lane_order:
+            if self._waiting[lane]:
+                return self._waiting[lane][0]
+
+    def _dispatch(self):
+        # Strictly in order: a big job blocked on disk is not overtaken by
+        # smaller ones, so it cannot be starved
+        while (ticket := self._next()) is not None and self._fits(ticket):
+            self._waiting[ticket.lane].popleft()
+            TRANSCODE_LANE_DEPTH.labels(lane=ticket.lane).dec()
+            self._reserve(ticket.scratch_bytes, 1)
+            ticket.future.set_result(None)
+
+    def _reserve(self, scratch_bytes: int, slots: int):
+        self._slots_busy += slots
+        self._bytes_reserved += scratch_bytes
+        TRANSCODE_SLOTS_BUSY.set(self._slots_busy)
+        TRANSCODE_SCRATCH_BYTES_RESERVED.set(self._bytes_reserved)
+
+    @asynccontextmanager
+    async def admit(self, lane: str, scratch_bytes: int):
+        """
+        Wait until the job may run, and hold its CPU slot and scratch bytes
+        for the duration of the block.
+        Args:
+            :param lane: The job's priority lane (see transcode_lane).
+            :param scratch_bytes: The job's estimated scratch-disk use.
+        """
+        if lane not in self._waiting:
+            # Unknown lanes go last
+            self.lane_order.append(lane)
+            self._waiting[lane] = deque()
+
+        ticket = _Ticket(lane, scratch_bytes, asyncio.get_running_loop().create_future())
+        self._waiting[lane].append(ticket)
+        TRANSCODE_LANE_DEPTH.labels(lane=lane).inc()
+        self._dispatch()
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Admitted just as the job was cancelled
+                self._reserve(-ticket.scratch_bytes, -1)
+            else:
+                self._waiting[lane].remove(ticket)
+                TRANSCODE_LANE_DEPTH.labels(lane=lane).dec()
+            self._dispatch()
+            raise
+
+        waited = time.monotonic() - ticket.queued_at
+        TRANSCODE_ADMISSION_WAIT_SECONDS.labels(lane=lane).observe(waited)
+        if waited >= 1:
+            print(f"Transcode admitted from lane {lane} after {waited:.1f}s")
+
+        try:
+            yield
+        finally:
+            self._reserve(-ticket.scratch_bytes, -1)
+            self._dispatch()
+
+
+_scheduler = None
+
+
+def get_scheduler() -> TranscodeScheduler:
+    """
+    Return the transcode scheduler of this worker process, sized from the
+    settings on first use.
+    :return: The scheduler.
+    """
+    global _scheduler
+
+    if _scheduler is None:
+        budget = settings.transcode.transcode_scratch_budget_bytes
+        if not budget:
+            # Default to a share of what is free on the scratch disk at start-up
+            os.makedirs(SCRATCH_DIR, exist_ok=True)
+            budget = int(shutil.disk_usage(SCRATCH_DIR).free * settings.transcode.transcode_scratch_budget_ratio)
+
+        _scheduler = TranscodeScheduler(
+            cpu_slots=settings.transcode.transcode_cpu_slots or os.cpu_count() or 1,
+            scratch_budget_bytes=budget,
+            lane_order=settings.transcode.transcode_lane_order,
+            starvation_seconds=settings.transcode.transcode_starvation_seconds,
+        )
+        print(f"Transcode scheduler: {_scheduler.cpu_slots} CPU slots, "
+              f"{budget / 1024 ** 3:.1f} GiB scratch budget, lanes {_scheduler.lane_order}")
+    return _scheduler
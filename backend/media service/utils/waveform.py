@@ -0,0 +1,146 @@
+import struct
+import threading
+import numpy as np
+
+# Stored next to the segments of each HLS folder
+WAVEFORM_NAME = "waveform.dat"
+# PCM handed to the peaks reader by ffmpeg's extra output: 16-bit stereo at
+# half the CD rate, plenty for min/max peaks and half the pipe traffic
+WAVEFORM_SAMPLE_RATE = 22050
+WAVEFORM_CHANNELS = 2
+# audiowaveform (BBC) binary format version 2, which also carries the channel count
+FORMAT_VERSION = 2
+FLAG_8_BIT = 0x1
+
+
+def waveform_output_args(gain: list[str] | None = None) -> list[str]:
+    """
+    Build the ffmpeg arguments of the raw PCM output that feeds the peaks
+    reader, added to the HLS encode so the source is decoded only once.
+    Args:
+        :param gain: The loudness normalization filter of the HLS outputs, if any.
+    :return: The output arguments, writing to stdout.
+    """
+    return [
+        "-map", "0:a",
+        *(gain or []),
+        "-ac", str(WAVEFORM_CHANNELS),
+        "-ar", str(WAVEFORM_SAMPLE_RATE),
+        "-c:a", "pcm_s16le",
+        "-f", "s16le",
+        "pipe:1"
+    ]
+
+
+class PeaksBuilder:
+    """
+    Reduce streamed 16-bit interleaved PCM to min/max peaks per fixed-size
+    bucket and channel.
+
+    Chunks of any size are accepted; memory holds one bucket of leftover
+    samples plus two values per bucket and channel.
+    """
+
+    def __init__(self, samples_per_pixel: int, channels: int = WAVEFORM_CHANNELS):
+        self.samples_per_pixel = samples_per_pixel
+        self.channels = channels
+        self._frame_bytes = 2 * channels
+        self._leftover = b""
+        self._mins = []
+        self._maxs = []
+        # Set when the PCM could not be read; no waveform is stored then
+        self.failed = False
+
+    def _add_frames(self, frames: np.ndarray):
+        buckets = frames.reshape(-1, self.samples_per_pixel, self.channels)
+        self._mins.append(buckets.min(axis=1))
+        self._maxs.append(buckets.max(axis=1))
+
+    def add(self, data: bytes):
+        """
+        Feed the next chunk of PCM.
+        Args:
+            :param data: Little-endian signed 16-bit samples, channels interleaved.
+        """
+        data = self._leftover + data
+        bucket_bytes = self.samples_per_pixel * self._frame_bytes
+        whole = len(data) // bucket_bytes * bucket_bytes
+        self._leftover = data[whole:]
+        if whole:
+            self._add_frames(np.frombuffer(data[:whole], dtype="<i2").reshape(-1, self.channels))
+
+    def finish(self):
+        """
+        Close the last, partial bucket.
+        """
+        frames = len(self._leftover) // self._frame_bytes
+        if frames:
+            samples = np.frombuffer(self._leftover[:frames * self._frame_bytes], dtype="<i2").reshape(-1, self.channels)
+            self._mins.append(samples.min(axis=0, keepdims=True))
+            self._maxs.append(samples.max(axis=0, keepdims=True))
+        self._leftover = b""
+
+    def to_bytes(self, bits: int = 8) -> bytes:
+        """
+        Serialize the peaks in the audiowaveform .dat format (version 2): a
+        24-byte header followed by min, max pairs per bucket and channel.
+        Args:
+            :param bits: 8 or 16 bits per value; 8-bit values are the top byte of the 16-bit peaks.
+        :return: The file content.
+        """
+        if self._mins:
+            mins = np.concatenate(self._mins)
+            maxs = np.concatenate(self._maxs)
+        else:
+            mins = maxs = np.zeros((0, self.channels), dtype=np.int16)
+
+        # Bucket-major, then channel, then (min, max)
+        peaks = np.stack([mins, maxs], axis=-1)
+        if bits == 8:
+            # Arithmetic shift floors, so negative peaks keep their magnitude
+            data = (peaks >> 8).astype(np.int8).tobytes()
+        else:
+            data = peaks.astype("<i2").tobytes()
+
+        header = struct.pack(
+            "<iIiiIi",
+            FORMAT_VERSION,
+            FLAG_8_BIT if bits == 8 else 0,
+            WAVEFORM_SAMPLE_RATE,
+            self.samples_per_pixel,
+            len(peaks),
+            self.channels,
+        )
+        return header + data
+
+
+def start_peaks_reader(stream, builder: PeaksBuilder) -> threading.Thread:
+    """
+    Drain an ffmpeg PCM output into a PeaksBuilder on a background thread.
+    ffmpeg blocks once the pipe is full, so the reader must run for the whole encode.
+    Args:
+        :param stream: ffmpeg's stdout.
+        :param builder: The builder the PCM is fed to.
+    :return: The started thread; join it after ffmpeg exits.
+    """
+    def read():
+        try:
+            while chunk := stream.read(256 * 1024):
+                if builder.failed:
+                    # Keep draining: a stalled pipe would stall the HLS encode too
+                    continue
+                try:
+                    builder.add(chunk)
+                except Exception as e:
+                    print(f"Error computing waveform peaks: {e}")
+                    builder.failed = True
+            builder.finish()
+        except Exception as e:
+            print(f"Error reading waveform PCM from ffmpeg: {e}")
+            builder.failed = True
+        finally:
+            stream.close()
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    return reader
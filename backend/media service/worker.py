@@ -0,0 +1,20 @@
+import asyncio
+from libs.redis import connect_redis
+from libs.s3_client import get_client
+from utils.metrics import start_worker_metrics_server
+from workers.gc_worker import gc_worker
+from workers.transcode_worker import transcode_worker
+
+
+async def main():
+    start_worker_metrics_server()
+    # Connect before taking jobs, so the first transcode does not pay for it
+    await connect_redis()
+    await asyncio.to_thread(get_client)
+    await asyncio.gather(transcode_worker(), gc_worker())
+
+
+if __name__ == "__main__":
+    # Runs separately from the API (e.g. `python worker.py`), so ffmpeg never
+    # competes with request handling for threadpool slots
+    asyncio.run(main())
@@ -0,0 +1,193 @@
+import asyncio
+import time
+from collections import defaultdict
+from redis.exceptions import LockError
+from libs.redis import redis_connection
+from libs.s3_client import get_client
+from config.config import settings
+from utils.access_tracker import ACCESS_KEY, SIZE_KEY, folder_member, forget_folder, parse_folder_member
+from utils.generate_hls import HLS_BUCKET_NAME
+from utils.hls_manifest import MANIFEST_NAME, folder_prefix
+from utils.signed_url_cache import invalidate_signed_urls
+from utils.single_flight import single_flight
+from utils.transcode_queue import clear_transcode_status
+
+GC_LOCK_KEY = "hls:gc:lock"
+BACKFILL_KEY = "hls:gc:backfilled"
+# Top-level prefixes holding HLS folders; loudness/ records are kept on purpose
+FOLDER_KINDS = ("music", "add")
+
+
+def _backfill_access():
+    # Folders generated before access tracking existed only have their upload
+    # time, which is also what their "last-access" metadata holds. One LIST of
+    # the bucket seeds both keys without a HEAD per object.
+    if redis_connection.exists(BACKFILL_KEY):
+        return
+
+    sizes = defaultdict(int)
+    last_modified = {}
+
+    paginator = get_client().get_paginator("list_objects_v2")
+    for kind in FOLDER_KINDS:
+        for page in paginator.paginate(Bucket=HLS_BUCKET_NAME, Prefix=f"{kind}/"):
+            for item in page.get("Contents", []):
+                parts = item["Key"].split("/", 2)
+                if len(parts) < 3 or not parts[1]:
+                    continue
+
+                member = folder_member(parts[1], kind == "add")
+                sizes[member] += item["Size"]
+                modified = int(item["LastModified"].timestamp())
+                last_modified[member] = max(last_modified.get(member, 0), modified)
+
+    pipeline = redis_connection.pipeline()
+    for member, modified in last_modified.items():
+        # nx: never overwrite a real play timestamp
+        pipeline.zadd(ACCESS_KEY, {member: modified}, nx=True)
+        pipeline.hsetnx(SIZE_KEY, member, sizes[member])
+    pipeline.set(BACKFILL_KEY, int(time.time()))
+    pipeline.execute()
+
+    print(f"Backfilled access times of {len(last_modified)} HLS folders")
+
+
+def _eviction_candidates(now: int) -> list[tuple[bytes, float]]:
+    idle_window = settings.eviction.hls_gc_idle_window
+    budget = settings.eviction.hls_gc_storage_budget_bytes
+
+    sizes = {member: int(size) for member, size in redis_connection.hgetall(SIZE_KEY).items()}
+    total = sum(sizes.values())
+
+    # Least recently played first, never anything played within the minimum idle time
+    entries = redis_connection.zrangebyscore(
+        ACCESS_KEY, "-inf", now - settings.eviction.hls_gc_min_idle, withscores=True
+    )
+
+    candidates = []
+    for member, last_access in entries:
+        idle = idle_window > 0 and last_access <= now - idle_window
+        over_budget = budget > 0 and total > budget
+        if not idle and not over_budget:
+            # Later entries were played even more recently
+            break
+
+        candidates.append((member, last_access))
+        total -= sizes.get(member, 0)
+
+    return candidates
+
+
+def _delete_prefix(prefix: str) -> int:
+    batch_size = settings.eviction.hls_gc_delete_batch
+
+    client = get_client()
+
+    # The manifest goes first so no reader resolves segments that are being deleted
+    client.delete_object(Bucket=HLS_BUCKET_NAME, Key=f"{prefix}{MANIFEST_NAME}")
+
+    deleted = 0
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=HLS_BUCKET_NAME, Prefix=prefix):
+        keys = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+        for start in range(0, len(keys), batch_size):
+            client.delete_objects(Bucket=HLS_BUCKET_NAME, Delete={"Objects": keys[start:start + batch_size], "Quiet": True})
+        deleted += len(keys)
+
+    return deleted
+
+
+def evict_folder(audio_id: str, is_add: bool, last_access: float | None = None) -> bool:
+    """
+    Delete the HLS folder of a track. The next play finds it empty and queues
+    a fresh transcode, so eviction is invisible to clients besides one 202.
+    Args:
+        :param audio_id: The audio ID of the HLS folder.
+        :param is_add: Whether the audio is an ad creative.
+        :param last_access: The access time the folder was selected with; the
+            eviction is skipped if it was played since.
+    :return: Whether the folder was evicted.
+    """
+    member = folder_member(audio_id, is_add)
+
+    try:
+        # Never races a transcode of the same track; a busy folder waits for the next pass
+        with single_flight(audio_id, is_add, blocking=False):
+            current = redis_connection.zscore(ACCESS_KEY, member)
+            if last_access is not None and current is not None and current > last_access:
+                return False
+
+            deleted = _delete_prefix(folder_prefix(audio_id, is_add))
+            invalidate_signed_urls(audio_id, is_add)
+            forget_folder(audio_id, is_add)
+            clear_transcode_status(audio_id, is_add)
+    except LockError:
+        print(f"Skipping eviction of {member}: a transcode holds its lock")
+        return False
+
+    print(f"Evicted HLS folder {member} ({deleted} objects)")
+    return True
+
+
+def collect_garbage() -> dict:
+    """
+    Run one garbage collection pass: evict folders idle for longer than
+    hls_gc_idle_window, then the least recently played ones while the bucket
+    is over hls_gc_storage_budget_bytes. Only one replica runs a pass at a time.
+    :return: Pass statistics.
+    """
+    stats = {"candidates": 0, "evicted": 0, "freed_bytes": 0}
+
+    if not settings.eviction.hls_gc_idle_window and not settings.eviction.hls_gc_storage_budget_bytes:
+        return stats
+
+    lock = redis_connection.lock(GC_LOCK_KEY, timeout=settings.eviction.hls_gc_interval)
+    if not lock.acquire(blocking=False):
+        print("Another HLS garbage collection pass is running")
+        return stats
+
+    try:
+        _backfill_access()
+
+        now = int(time.time())
+        candidates = _eviction_candidates(now)
+        stats["candidates"] = len(candidates)
+
+        for member, last_access in candidates:
+            size = int(redis_connection.hget(SIZE_KEY, member) or 0)
+            audio_id, is_add = parse_folder_member(member)
+            try:
+                if evict_folder(audio_id, is_add, last_access):
+                    stats["evicted"] += 1
+                    stats["freed_bytes"] += size
+            except Exception as e:
+                print(f"Error evicting HLS folder {audio_id}: {e}")
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            print("HLS garbage collection lock expired before release")
+
+    return stats
+
+
+async def gc_worker():
+    print("HLS garbage collector started...")
+
+    # Graceful shutdown mechanism
+    shutdown_event = asyncio.Event()
+    try:
+        while not shutdown_event.is_set():
+            try:
+                # S3 listing and deletes block, so keep them off the event loop
+                stats = await asyncio.to_thread(collect_garbage)
+                print(f"HLS garbage collection pass finished: {stats}")
+            except Exception as e:
+                print(f"Error collecting HLS garbage: {e}")
+
+            try:
+                await asyncio.wait_for(shutdown_event.wait(), timeout=settings.eviction.hls_gc_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        print("HLS garbage collector shut down.")
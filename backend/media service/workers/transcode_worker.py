@@ -0,0 +1,181 @@
+import asyncio
+import logging
+from botocore.exceptions import ClientError
+from bullmq import Worker
+from libs.redis import connection_url
+from libs.s3_client import get_client
+from config.config import settings
+from utils.generate_hls import correct_loudness, generate_hls, HLS_BUCKET_NAME, SOURCE_BUCKET
+from utils.hls_manifest import folder_prefix, get_folder_segments
+from utils.metrics import TRANSCODES
+from utils.single_flight import single_flight
+from utils.transcode_queue import (
+    TRANSCODE_QUEUE_NAME,
+    PROCESSING,
+    READY,
+    FAILED,
+    SOURCE_MISSING,
+    TRANSIENT,
+    UNDECODABLE,
+    enqueue_loudness_correction,
+    is_interactive_async,
+    set_transcode_status_async,
+)
+from utils.transcode_scheduler import estimate_scratch_bytes, get_scheduler, transcode_lane
+
+
+def transcode(audio_id: str, is_add: bool = False, interactive: bool = False):
+    """
+    Generate the HLS folder of a track unless another worker already did.
+    Args:
+        :param audio_id: The ID of the audio file.
+        :param is_add: Whether the audio is an ad creative.
+        :param interactive: Whether a listener is waiting for the track.
+    Returns:
+        dict: Status message.
+    """
+    prefix = folder_prefix(audio_id, is_add)
+
+    with single_flight(audio_id, is_add):
+        # A fast-start folder left incomplete by a crashed worker is redone
+        segment_keys, complete = get_folder_segments(HLS_BUCKET_NAME, prefix)
+        if segment_keys and complete:
+            return {"status": "success", "message": "HLS segments already exist"}
+
+        return generate_hls(audio_id, is_add=is_add, interactive=interactive)
+
+
+def loudness_correction(audio_id: str, is_add: bool = False):
+    """
+    Normalize a track an interactive transcode published without a loudness measurement.
+    Args:
+        :param audio_id: The ID of the audio file.
+        :param is_add: Whether the audio is an ad creative.
+    Returns:
+        dict: Status message.
+    """
+    with single_flight(audio_id, is_add):
+        return correct_loudness(audio_id, is_add=is_add)
+
+
+async def process_loudness_job(job, audio_id: str, is_add: bool):
+    # Runs in the bulk lane and leaves the transcode status alone: the
+    # unnormalized folder stays playable until it is replaced
+    try:
+        scratch_bytes = await asyncio.to_thread(estimate_scratch_bytes, audio_id, is_add)
+        async with get_scheduler().admit(transcode_lane(is_add, False), scratch_bytes):
+            result = await asyncio.to_thread(loudness_correction, audio_id, is_add)
+    except Exception as e:
+        result = {"status": "error", "message": str(e)}
+
+    if result.get("status") == "success":
+        logging.info(f"[Job {job.id}] Loudness of {audio_id}: {result.get('message')}")
+    else:
+        logging.error(f"[Job {job.id}] Error correcting loudness of {audio_id}: {result.get('message')}")
+    return result
+
+
+def failure_reason(audio_id: str, is_add: bool, result: dict) -> str:
+    """
+    Classify a failed transcode, so requests stop queueing ones that would fail again.
+    Args:
+        :param audio_id: The ID of the audio file.
+        :param is_add: Whether the audio is an ad creative.
+        :param result: The failed result of generate_hls.
+    :return: SOURCE_MISSING, UNDECODABLE or TRANSIENT.
+    """
+    # ffmpeg reading a presigned URL fails the same way whether the source
+    # is missing or broken, so ask S3
+    try:
+        get_client().head_object(Bucket=SOURCE_BUCKET, Key=f"{'add' if is_add else 'music'}/{audio_id}")
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return SOURCE_MISSING
+        return TRANSIENT
+    except Exception:
+        return TRANSIENT
+
+    # A non-zero exit on a present source is a file ffmpeg cannot decode; a
+    # negative one is a signal (e.g. the OOM killer) and worth retrying
+    if result.get("ffmpeg_exit_code", 0) > 0:
+        return UNDECODABLE
+    return TRANSIENT
+
+
+async def process_transcode_job(job, token):
+    """
+    Processes a job to transcode a track into HLS and upload it.
+
+    Parameters:
+        job (dict): The job object containing job data (audioId, isAdd).
+        token (str): The token used for authentication or authorization. (Currently unused)
+
+    Returns:
+        dict: A status dictionary indicating the result of the operation.
+    """
+
+    audio_id = job.data.get("audioId")
+    is_add = bool(job.data.get("isAdd", False))
+
+    if not audio_id:
+        logging.error(f"[Job {job.id}] No audio ID found")
+        return {"status": "no audio ID"}
+
+    if job.data.get("loudnessCorrection"):
+        return await process_loudness_job(job, audio_id, is_add)
+
+    # Upload-time jobs are bulk unless a listener asked for the track since
+    interactive = bool(job.data.get("interactive")) or await is_interactive_async(audio_id, is_add)
+    lane = transcode_lane(is_add, interactive)
+
+    try:
+        scratch_bytes = await asyncio.to_thread(estimate_scratch_bytes, audio_id, is_add)
+
+        # Stays QUEUED until a CPU slot and scratch space are free
+        async with get_scheduler().admit(lane, scratch_bytes):
+            await set_transcode_status_async(audio_id, is_add, PROCESSING)
+            # ffmpeg and the S3 uploads block, so keep them off the event loop
+            result = await asyncio.to_thread(transcode, audio_id, is_add, interactive)
+    except Exception as e:
+        result = {"status": "error", "message": str(e)}
+
+    TRANSCODES.labels(status=result.get("status", "error")).inc()
+
+    if result.get("status") == "success":
+        await set_transcode_status_async(audio_id, is_add, READY)
+        logging.info(f"[Job {job.id}] HLS generated for {audio_id}")
+        if result.get("loudness_pending"):
+            await enqueue_loudness_correction(audio_id, is_add)
+    else:
+        reason = await asyncio.to_thread(failure_reason, audio_id, is_add, result)
+        await set_transcode_status_async(audio_id, is_add, FAILED, result.get("message", ""), reason)
+        logging.error(f"[Job {job.id}] Error generating HLS for {audio_id} ({reason}): {result.get('message')}")
+
+    return result
+
+
+async def transcode_worker():
+    worker = Worker(
+        TRANSCODE_QUEUE_NAME,
+        process_transcode_job,
+        {
+            "connection": connection_url,
+            "concurrency": settings.transcode.transcode_worker_concurrency
+        },
+    )
+
+    # Worker event listeners
+    worker.on("error", lambda e: print("Worker error:", e))
+    worker.on("failed", lambda job, err: print(f"Job {job.id} failed: {err}"))
+    worker.on("completed", lambda job, return_value: print(f"Job {job.id} completed → {return_value}"))
+
+    print("HLS transcode worker started and listening for jobs...")
+
+    # Graceful shutdown mechanism
+    shutdown_event = asyncio.Event()
+    try:
+        await shutdown_event.wait()
+    finally:
+        print("Shutting down worker...")
+        await worker.close()
+        print("Worker shut down successfully.")
@@ -0,0 +1,202 @@
+"""
+Benchmark sampled sonic embeddings (SONIC_EMBEDDING_MODE=sampled) against
+full-track ones on real tracks of the audio bucket.
+
+Each track is embedded three ways with CLAP: sampled (a few range-read
+windows, mean-pooled), full pooled (all windows, SONIC_WINDOW_POOLING) and
+full cropped (the default, one window cropped by the processor). The
+report gives the cosine similarity of the sampled embedding to both full
+ones, the bytes the sampled read fetched and the time each way took,
+printed (or written) as JSON to diff between commits.
+
+Point the usual S3_* settings at the bucket, then run from the
+recommendation service directory:
+
+    python -m benchmarks.sonic_sampling_bench --prefix music/ --limit 50 --windows 4 6 8 --output sonic.json
+"""
+import argparse
+import datetime
+import functools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import numpy as np
+from libs.s3_client import get_client
+from config.config import settings
+from embeddings.audio_embedding import (
+    _embed_cropped,
+    _embed_pooled,
+    _file_windows,
+    decode_sampled_windows,
+    get_clap,
+)
+from utils.download_audio_from_s3 import download_audio_from_s3
+from utils.s3_range_reader import S3RangeReader
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def _summary(values: list[float]) -> dict:
+    # Rounded for readable diffs
+    if not values:
+        return {"mean": None, "min": None, "p10": None}
+    p10 = statistics.quantiles(values, n=10, method="inclusive")[0] if len(values) > 1 else values[0]
+    return {"mean": round(statistics.fmean(values), 4), "min": round(min(values), 4), "p10": round(p10, 4)}
+
+
+def list_tracks(prefix: str, limit: int) -> list[str]:
+    """
+    List the keys of the first audio objects under a prefix of the bucket.
+
+    Args:
+        prefix (str): Key prefix, e.g. "music/".
+        limit (int): Objects to return at most.
+
+    Returns:
+        list[str]: The object keys.
+    """
+    keys = []
+    paginator = get_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=settings.s3_storage.s3_bucket_name, Prefix=prefix):
+        for entry in page.get("Contents", []):
+            keys.append(entry["Key"])
+            if len(keys) >= limit:
+                return keys
+    return keys
+
+
+def bench_track(object_key: str, window_counts: list[int], sr: int = 48000) -> dict:
+    """
+    Embed one track fully and sampled with each window count.
+
+    Args:
+        object_key (str): Key of the audio object.
+        window_counts (list[int]): Sample window counts to compare.
+        sr (int): Sampling rate the audio is decoded to.
+
+    Returns:
+        dict: Per-way timings, cosine similarities and bytes fetched.
+    """
+    bucket_name = settings.s3_storage.s3_bucket_name
+
+    started = time.perf_counter()
+    data = download_audio_from_s3(bucket_name, object_key).getvalue()
+    download_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    [pooled] = _embed_pooled([functools.partial(_file_windows, data, sr)], sr)
+    pooled_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    [cropped] = _embed_cropped([data], sr)
+    cropped_seconds = time.perf_counter() - started
+
+    for outcome in (pooled, cropped):
+        if isinstance(outcome, Exception):
+            raise outcome
+
+    result = {
+        "key": object_key,
+        "bytes": len(data),
+        "duration_seconds": round(pooled[0], 2),
+        "download_seconds": round(download_seconds, 3),
+        "full_pooled_seconds": round(pooled_seconds, 3),
+        "full_cropped_seconds": round(cropped_seconds, 3),
+        "sampled": {},
+    }
+
+    for count in window_counts:
+        reader = S3RangeReader(bucket_name, object_key, block_size=settings.embedding.sonic_range_block_bytes)
+        started = time.perf_counter()
+        [sampled] = _embed_pooled([functools.partial(decode_sampled_windows, reader, sr, count)], sr)
+        sampled_seconds = time.perf_counter() - started
+        if isinstance(sampled, Exception):
+            raise sampled
+
+        result["sampled"][count] = {
+            "seconds": round(sampled_seconds, 3),
+            "bytes_fetched": reader.bytes_fetched,
+            "fetched_ratio": round(reader.bytes_fetched / max(1, reader.size), 3),
+            "requests": reader.requests,
+            "duration_error_seconds": round(abs(sampled[0] - pooled[0]), 3),
+            "cosine_full_pooled": round(_cosine(sampled[1], pooled[1]), 4),
+            "cosine_full_cropped": round(_cosine(sampled[1], cropped[1]), 4),
+        }
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sampled against full-track sonic embeddings.")
+    parser.add_argument("--keys", nargs="+", help="Audio object keys to embed")
+    parser.add_argument("--prefix", default="music/", help="Otherwise, list the objects under this prefix")
+    parser.add_argument("--limit", type=int, default=20, help="Objects listed at most")
+    parser.add_argument("--windows", type=int, nargs="+", default=[settings.embedding.sonic_sample_windows],
+                        help="Sample window counts to compare")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    keys = args.keys or list_tracks(args.prefix, args.limit)
+    # Loaded before timing, so the first track does not pay for it
+    get_clap()
+
+    tracks, errors = [], []
+    for object_key in keys:
+        try:
+            tracks.append(bench_track(object_key, args.windows))
+            print(f"Benchmarked {object_key}")
+        except Exception as e:
+            print(f"Error benchmarking {object_key}: {e}")
+            errors.append({"key": object_key, "error": str(e)})
+
+    summary = {}
+    for count in args.windows:
+        sampled = [track["sampled"][count] for track in tracks]
+        summary[count] = {
+            "cosine_full_pooled": _summary([entry["cosine_full_pooled"] for entry in sampled]),
+            "cosine_full_cropped": _summary([entry["cosine_full_cropped"] for entry in sampled]),
+            "fetched_ratio": _summary([entry["fetched_ratio"] for entry in sampled]),
+            "seconds": _summary([entry["seconds"] for entry in sampled]),
+        }
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "s3_endpoint": settings.s3_storage.s3_endpoint,
+        "settings": {
+            "sonic_range_block_bytes": settings.embedding.sonic_range_block_bytes,
+            "sonic_min_tail_seconds": settings.embedding.sonic_min_tail_seconds,
+            "sonic_window_batch_size": settings.embedding.sonic_window_batch_size,
+        },
+        "summary": summary,
+        "tracks": tracks,
+        "errors": errors,
+    }
+
+    content = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(content + "\n")
+        print(f"Benchmark report written to {args.output}")
+    else:
+        print(content)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ This module centralizes all configuration values for:
 - Redis caching server
 - Cloudinary media services
 - S3-based object storage
+- Liveness/readiness probes
+- Embedding worker batching
 
 All configuration classes extend `BaseSettingClass`, which uses Pydantic
 Settings to load environment variables from a `.env` file automatically.
@@ -102,6 +104,77 @@ class S3StorageConfig(BaseSettingClass):
     s3_bucket_name: str = "addis-music"
 
 
+class HealthConfig(BaseSettingClass):
+    """
+    Settings for the liveness and readiness probe server.
+
+    Attributes:
+        health_port (int): Port serving /livez and /readyz (0 disables the server).
+        readiness_cache_seconds (float): How long a /readyz dependency check
+            is reused, so frequent probes do not ping Redis each time.
+    """
+    health_port: int = 8081
+    readiness_cache_seconds: float = 2.0
+
+
+class EmbeddingConfig(BaseSettingClass):
+    """
+    Settings for the embedding workers.
+
+    Attributes:
+        metadata_worker_concurrency (int): Metadata jobs in flight at once; at
+            least metadata_batch_size, or batches can never fill up.
+        metadata_batch_size (int): Texts that close a metadata embedding batch.
+        metadata_batch_wait_ms (int): Milliseconds a batch stays open after its
+            first text, bounding the latency a quiet queue adds.
+        sonic_worker_concurrency (int): Sonic jobs in flight at once. Each holds
+            its downloaded (compressed) file while it waits for its batch.
+        sonic_batch_size (int): Tracks that close a sonic batch.
+        sonic_batch_wait_ms (int): Milliseconds a sonic batch stays open after
+            its first track; download times vary, so it is longer than for text.
+        sonic_window_pooling (bool): Embed a track as the mean over all its
+            10 s windows instead of from the one window CLAP's processor crops
+            (only that window is kept while decoding). Pooled
+            embeddings are not comparable with cropped ones, so every track must
+            be re-embedded (its sonic-embedding job queued again) when this, or
+            sonic_embedding_mode, is changed on a populated database.
+        sonic_window_batch_size (int): 10 s windows per CLAP forward pass; with
+            the decode block, it bounds an inference process's memory when pooling.
+        sonic_min_tail_seconds (float): Shortest last window of a track that is
+            still embedded when pooling.
+        sonic_embedding_mode (str): "full" downloads each track; "sampled"
+            range-reads and embeds (pooled) only sonic_sample_windows evenly
+            spaced windows. On 20 min tracks, 6 windows fetch 9% (MP3) to 17%
+            (FLAC) of the object; tracks under about 90 s are read whole. Its
+            CLAP cosine similarity to full-track embeddings is reported by
+            benchmarks.sonic_sampling_bench; measure it on the catalogue
+            before switching.
+        sonic_sample_windows (int): Windows embedded per track in sampled mode.
+        sonic_range_block_bytes (int): Bytes per range GET in sampled mode.
+        embedding_report_interval (float): Seconds between tracks/sec reports.
+        metadata_processes (int): Inference processes running the text model.
+        sonic_processes (int): Inference processes decoding audio and running CLAP.
+        inference_threads_per_process (int): Torch threads per inference process;
+            0 divides the cores between all of them.
+    """
+    metadata_worker_concurrency: int = 64
+    metadata_batch_size: int = 32
+    metadata_batch_wait_ms: int = 50
+    sonic_worker_concurrency: int = 8
+    sonic_batch_size: int = 8
+    sonic_batch_wait_ms: int = 1000
+    sonic_window_pooling: bool = False
+    sonic_window_batch_size: int = 8
+    sonic_min_tail_seconds: float = 3.0
+    sonic_embedding_mode: str = "full"
+    sonic_sample_windows: int = 6
+    sonic_range_block_bytes: int = 256 * 1024
+    embedding_report_interval: float = 60.0
+    metadata_processes: int = 1
+    sonic_processes: int = 2
+    inference_threads_per_process: int = 0
+
+
 class Settings:
     """
     Container for all configuration groups.
@@ -114,11 +187,15 @@ class Settings:
         redis (RedisConfig): Redis settings instance.
         cloudinary (CloudinaryConfig): Cloudinary credentials.
         s3_storage (S3StorageConfig): S3 storage configuration.
+        health (HealthConfig): Liveness/readiness probe settings.
+        embedding (EmbeddingConfig): Embedding worker batching and process settings.
     """
     database: DatabaseConfig = DatabaseConfig()
     redis: RedisConfig = RedisConfig()
     cloudinary: CloudinaryConfig = CloudinaryConfig()
     s3_storage: S3StorageConfig = S3StorageConfig()
+    health: HealthConfig = HealthConfig()
+    embedding: EmbeddingConfig = EmbeddingConfig()
 
 
 # Global settings instance used across the application
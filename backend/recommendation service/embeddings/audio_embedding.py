@@ -1,9 +1,30 @@
+import functools
+import math
 import os
+import threading
 from io import BytesIO
+from typing import Callable, Iterator
+import numpy as np
 import torch
 import librosa
+import soundfile
+import soxr
 from transformers import ClapProcessor, ClapModel
-from utils.download_audio_from_s3 import download_audio_from_s3
+from config.config import settings
+from utils.download_audio_from_s3 import get_audio_duration
+from utils.s3_range_reader import S3RangeReader
+
+# CLAP's input length: the processor crops longer clips to 10 s
+WINDOW_SECONDS = 10
+# Frames decoded per read, at the file's native rate
+DECODE_BLOCK_FRAMES = 64 * 1024
+# MPEG audio layer III bitrates (kbit/s) by header index
+MP3_BITRATES_MPEG1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MP3_BITRATES_MPEG2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+# Decoded before a sampled MP3 window and dropped
+MP3_LEAD_IN_SECONDS = 1
+# Extra bytes read for a sampled MP3 window, as VBR bitrates vary along the track
+MP3_RANGE_MARGIN = 1.25
 
 
 def load_clap_model_and_processor(model_path: str) -> (ClapProcessor, ClapModel):
@@ -42,31 +63,513 @@ def load_clap_model_and_processor(model_path: str) -> (ClapProcessor, ClapModel)
 # Define the local paths where you want to store the model and processor
 model_path = "./models/clap-htsat-unfused"
 
-# Load the model and processor
-processor, model = load_clap_model_and_processor(model_path)
-print("Model and processor loaded successfully.")
+# Loaded by get_clap() on first use (or by warm_up() at start-up), not at import
+_clap: tuple[ClapProcessor, ClapModel] | None = None
+_clap_lock = threading.Lock()
 
 
-def extract_audio_features(audio_stream: BytesIO, sr: int = 48000) -> torch.Tensor:
+def get_clap() -> tuple[ClapProcessor, ClapModel]:
     """
-    Extracts audio features using the CLAP model.
+    Return the shared CLAP processor and model, loading them on first use.
+
+    Returns:
+        Tuple[ClapProcessor, ClapModel]: The loaded processor and model.
+    """
+    global _clap
+
+    if _clap is not None:
+        return _clap
+
+    with _clap_lock:
+        if _clap is None:
+            # Load the model and processor
+            _clap = load_clap_model_and_processor(model_path)
+            print("Model and processor loaded successfully.")
+    return _clap
+
+
+def is_loaded() -> bool:
+    """
+    Check whether the CLAP model has been loaded.
+
+    Returns:
+        bool: True once get_clap() has loaded the processor and model.
+    """
+    return _clap is not None
+
+
+def warm_up(sr: int = 48000) -> None:
+    """
+    Load the CLAP model and run one second of silence through it, so the
+    first job does not pay for loading the weights or for the first forward pass.
+
+    Args:
+        sr (int): Sampling rate the model is fed with.
+    """
+    processor, model = get_clap()
+    inputs = processor(audios=np.zeros(sr, dtype=np.float32), sampling_rate=sr, return_tensors="pt")
+    with torch.no_grad():
+        model.get_audio_features(**inputs)
+
+
+def decode_audio(audio_stream: BytesIO, sr: int = 48000) -> np.ndarray:
+    """
+    Decode an audio file to mono samples at the model's sampling rate.
 
     Args:
         audio_stream (BytesIO): Byte stream of the audio file.
         sr (int): Sampling rate for the audio.
 
     Returns:
-        numpy.ndarray: Extracted audio features as a numpy array.
+        numpy.ndarray: The decoded samples.
     """
-
     # Load audio data using librosa from BytesIO
     audio, _ = librosa.load(audio_stream, sr=sr)
+    return audio
+
+
+def extract_audio_features_batch(clips: list[np.ndarray], sr: int = 48000) -> list[np.ndarray]:
+    """
+    Extracts audio features of several decoded clips in one forward pass.
+
+    The processor turns every clip into a fixed-size log-mel input (clips
+    longer than the model's 10 s window are cropped, shorter ones repeat-padded),
+    so the clips stack into one batch tensor whatever their lengths.
+
+    Args:
+        clips (list[numpy.ndarray]): Decoded mono clips (see `decode_audio`).
+        sr (int): Sampling rate of the clips.
+
+    Returns:
+        list[numpy.ndarray]: One feature vector per clip, in input order.
+    """
+    processor, model = get_clap()
 
     # Process the audio
-    inputs = processor(audios=audio, sampling_rate=sr, return_tensors="pt")
+    inputs = processor(audios=clips, sampling_rate=sr, return_tensors="pt")
 
     # Extract features without calculating gradients
     with torch.no_grad():
-        emb = model.get_audio_features(**inputs).squeeze().numpy()
+        emb = model.get_audio_features(**inputs).numpy()
+
+    return list(emb)
+
+
+def extract_audio_features(audio_stream: BytesIO, sr: int = 48000) -> np.ndarray:
+    """
+    Extracts audio features using the CLAP model.
+
+    Args:
+        audio_stream (BytesIO): Byte stream of the audio file.
+        sr (int): Sampling rate for the audio.
+
+    Returns:
+        numpy.ndarray: Extracted audio features as a numpy array.
+    """
+    return extract_audio_features_batch([decode_audio(audio_stream, sr)], sr)[0]
+
+
+def _mono_chunks(audio_file: soundfile.SoundFile, sr: int) -> Iterator[np.ndarray]:
+    """
+    Decode an open audio file block by block into mono samples at `sr`,
+    downmixed and resampled like `decode_audio` (channel mean, then soxr HQ,
+    librosa's default), which a streaming resample matches sample for sample.
+
+    Args:
+        audio_file (soundfile.SoundFile): The open audio file.
+        sr (int): Sampling rate of the samples.
+
+    Yields:
+        numpy.ndarray: Consecutive chunks of samples.
+    """
+    resampler = None
+    if audio_file.samplerate != sr:
+        resampler = soxr.ResampleStream(audio_file.samplerate, sr, 1, dtype="float32", quality="HQ")
+
+    for block in audio_file.blocks(blocksize=DECODE_BLOCK_FRAMES, dtype="float32", always_2d=True):
+        mono = block.mean(axis=1, dtype=np.float32)
+        yield resampler.resample_chunk(mono) if resampler else mono
+    if resampler:
+        # Flush the resampler's delay line
+        yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+def decode_cropped(audio_stream: BytesIO, sr: int = 48000, max_length: int = WINDOW_SECONDS * 48000) -> np.ndarray:
+    """
+    Decode the part of an audio file CLAP's processor keeps of the whole
+    decoded track (`decode_audio`): all of it up to `max_length` samples,
+    otherwise a window at a random offset ("rand_trunc" truncation).
+
+    The offset is drawn from numpy's global generator exactly as the
+    processor draws it, and the file is streamed (see `_mono_chunks`) with
+    only the window kept, so the model gets the same input as it does from
+    the whole decoded track while memory holds one block and the window.
+
+    Args:
+        audio_stream (BytesIO): Byte stream of the audio file.
+        sr (int): Sampling rate of the clip.
+        max_length (int): Samples the processor keeps (its `nb_max_samples`).
+
+    Returns:
+        numpy.ndarray: The clip, at most `max_length` samples long (the whole
+            track if the header has no frame count).
+    """
+    with soundfile.SoundFile(audio_stream) as audio_file:
+        native_sr, frames = audio_file.samplerate, audio_file.frames
+
+    if frames <= 0:
+        # No frame count in the header: decode it whole, the processor crops
+        audio_stream.seek(0)
+        return decode_audio(audio_stream, sr)
+
+    audio_stream.seek(0)
+    with soundfile.SoundFile(audio_stream) as audio_file:
+        # Length of the whole decode; librosa pads or trims its resample to it
+        total = frames if native_sr == sr else math.ceil(frames * sr / native_sr)
+        start = 0
+        if total > max_length:
+            start = np.random.randint(0, total - max_length + 1)
+        end = min(total, start + max_length)
+
+        # Zeros past a stream shorter than the header says, as librosa pads
+        clip = np.zeros(end - start, dtype=np.float32)
+        position = 0
+        for chunk in _mono_chunks(audio_file, sr):
+            low, high = max(start, position), min(end, position + len(chunk))
+            if low < high:
+                clip[low - start:high - start] = chunk[low - position:high - position]
+            position += len(chunk)
+            if position >= end:
+                break
+
+    return clip
+
+
+def decode_windows(audio_stream: BytesIO, sr: int = 48000, min_tail_seconds: float = 3.0) -> Iterator[np.ndarray]:
+    """
+    Decode an audio file block by block into consecutive mono windows of the
+    model's input length (`WINDOW_SECONDS`) at the model's sampling rate.
+
+    The file is decoded once, at its native rate, and resampled as it
+    streams, so memory holds one decoded block plus the windows not yet
+    consumed, whatever the track length. Downmixing and resampling match
+    `decode_audio` (channel mean, then soxr HQ, librosa's default).
+
+    Args:
+        audio_stream (BytesIO): Byte stream of the audio file.
+        sr (int): Sampling rate of the windows.
+        min_tail_seconds (float): A shorter last window is dropped, unless it
+            is the only one (the processor repeat-pads short clips).
+
+    Yields:
+        numpy.ndarray: The windows, `WINDOW_SECONDS` long except maybe the last.
+    """
+    window = int(WINDOW_SECONDS * sr)
+    buffer = np.empty(window, dtype=np.float32)
+    filled = 0
+    emitted = False
+
+    with soundfile.SoundFile(audio_stream) as audio_file:
+        for chunk in _mono_chunks(audio_file, sr):
+            while len(chunk):
+                taken = min(window - filled, len(chunk))
+                buffer[filled:filled + taken] = chunk[:taken]
+                filled += taken
+                chunk = chunk[taken:]
+                if filled == window:
+                    yield buffer
+                    buffer = np.empty(window, dtype=np.float32)
+                    filled = 0
+                    emitted = True
+
+    if filled and (not emitted or filled >= min_tail_seconds * sr):
+        yield buffer[:filled]
+
+
+def _id3_size(header: bytes) -> int:
+    # Bytes taken by a leading ID3v2 tag (cover art can make it large)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def _mp3_frame_length(data: bytes, position: int) -> int:
+    # Length of the MPEG audio layer III frame whose header starts at position, 0 if none does
+    if position + 4 > len(data):
+        return 0
+    header = int.from_bytes(data[position:position + 4], "big")
+    version = (header >> 19) & 3
+    layer = (header >> 17) & 3
+    bitrate_index = (header >> 12) & 15
+    rate_index = (header >> 10) & 3
+    if header >> 21 != 0x7FF or version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0
+
+    mpeg1 = version == 3
+    bitrate = (MP3_BITRATES_MPEG1 if mpeg1 else MP3_BITRATES_MPEG2)[bitrate_index] * 1000
+    rate = (44100, 48000, 32000)[rate_index] >> (0 if mpeg1 else 1 if version == 2 else 2)
+    return (144 if mpeg1 else 72) * bitrate // rate + ((header >> 9) & 1)
+
+
+def _mp3_sync(data: bytes) -> int:
+    """
+    Find the first MP3 frame boundary in a chunk cut out of the middle of a
+    file: a frame header followed by another one where its length says.
+
+    Args:
+        data (bytes): The chunk.
+
+    Returns:
+        int: Offset of the frame in the chunk.
+
+    Raises:
+        ValueError: If the chunk holds no two consecutive frames.
+    """
+    position = data.find(b"\xff")
+    while position != -1:
+        length = _mp3_frame_length(data, position)
+        if length and _mp3_frame_length(data, position + length):
+            return position
+        position = data.find(b"\xff", position + 1)
+    raise ValueError("No MP3 frame found")
+
+
+def _read_mp3_window(reader: S3RangeReader, audio_start: int, fraction: float, duration: float) -> tuple[np.ndarray, int]:
+    # libsndfile seeks MP3 by decoding from the start, so jump to the
+    # proportional byte offset instead (exact for CBR, close for VBR), resync
+    # on a frame and decode the chunk on its own. A lead-in second covers the
+    # bit reservoir of the first frames and is dropped.
+    bytes_per_second = (reader.size - audio_start) / duration
+    start = audio_start + int(max(0.0, fraction * duration - MP3_LEAD_IN_SECONDS) * bytes_per_second)
+    chunk = reader.read_range(start, int((WINDOW_SECONDS + 2 * MP3_LEAD_IN_SECONDS) * bytes_per_second * MP3_RANGE_MARGIN))
+    samples, native_sr = soundfile.read(BytesIO(chunk[_mp3_sync(chunk):]), dtype="float32", always_2d=True)
+    lead_in = int(MP3_LEAD_IN_SECONDS * native_sr) if start > audio_start else 0
+    return samples[lead_in:lead_in + WINDOW_SECONDS * native_sr], native_sr
+
+
+def decode_sampled_windows(reader: S3RangeReader, sr: int = 48000, count: int = 6) -> tuple[float, Iterator[np.ndarray]]:
+    """
+    Decode `count` evenly spaced windows of a track read through byte-range
+    GETs, fetching only the container header and the bytes around each window.
+
+    Formats with seek tables (FLAC, WAV, OGG...) are seeked by libsndfile;
+    MP3 is seeked by byte offset (see `_read_mp3_window`). A track whose
+    windows would be read whole anyway (with the MP3 lead-in and margin) is
+    decoded whole (see `decode_windows`), in one pass over the object.
+
+    Args:
+        reader (S3RangeReader): The audio object.
+        sr (int): Sampling rate of the windows.
+        count (int): Windows to sample.
+
+    Returns:
+        tuple: The duration in seconds (from the container header) and an
+            iterator over the windows. A window that cannot be decoded is skipped.
+    """
+    with soundfile.SoundFile(reader) as audio_file:
+        native_sr, frames, audio_format = audio_file.samplerate, audio_file.frames, audio_file.format
+    duration = frames / native_sr
+    window = WINDOW_SECONDS * native_sr
+
+    if count * (WINDOW_SECONDS + 2 * MP3_LEAD_IN_SECONDS) * MP3_RANGE_MARGIN >= duration:
+        reader.seek(0)
+        return duration, decode_windows(reader, sr, settings.embedding.sonic_min_tail_seconds)
+
+    # Centered in equal slices of the track
+    fractions = [(i + 0.5) / count - WINDOW_SECONDS / duration / 2 for i in range(count)]
+
+    def windows():
+        if audio_format == "MP3":
+            reader.seek(0)
+            audio_start = _id3_size(reader.read(10))
+            for fraction in fractions:
+                try:
+                    samples, rate = _read_mp3_window(reader, audio_start, fraction, duration)
+                except Exception as e:
+                    print(f"Skipping an undecodable window of {reader.object_key}: {e}")
+                    continue
+                yield soxr.resample(samples.mean(axis=1, dtype=np.float32), rate, sr, quality="HQ")
+            return
+
+        reader.seek(0)
+        with soundfile.SoundFile(reader) as audio_file:
+            for fraction in fractions:
+                audio_file.seek(int(fraction * frames))
+                samples = audio_file.read(window, dtype="float32", always_2d=True)
+                yield soxr.resample(samples.mean(axis=1, dtype=np.float32), native_sr, sr, quality="HQ")
+
+    return duration, windows()
+
+
+def _embed_pooled(sources: list[Callable[[], tuple[float, Iterator[np.ndarray]]]], sr: int) -> list:
+    """
+    Embed several tracks, each as the mean of the CLAP embeddings of its windows.
+
+    Windows of all the tracks go through the model in batches of
+    `sonic_window_batch_size`, and only a running sum is kept per track, so
+    memory stays bounded however long the tracks are.
+
+    Args:
+        sources (list[Callable]): Per track, a function returning its duration
+            and an iterator over its windows.
+        sr (int): Sampling rate of the windows.
+
+    Returns:
+        list: Per track, a (duration in seconds, numpy.ndarray features) tuple,
+            or the exception that track raised (or that a forward pass with one
+            of its windows raised), so one corrupt file fails only its job.
+    """
+    outcomes: list = [None] * len(sources)
+    durations = [0.0] * len(sources)
+    sums: list = [None] * len(sources)
+    counts = [0] * len(sources)
+    pending: list[tuple[int, np.ndarray]] = []
+
+    def embed_pending():
+        # A failed forward pass (e.g. out of memory) fails every track with a window in it
+        try:
+            features = extract_audio_features_batch([window for _, window in pending], sr)
+            for (index, _), feature in zip(pending, features):
+                sums[index] = feature if sums[index] is None else sums[index] + feature
+                counts[index] += 1
+        except Exception as e:
+            for index, _ in pending:
+                if outcomes[index] is None:
+                    outcomes[index] = e
+        finally:
+            pending.clear()
+
+    for index, source in enumerate(sources):
+        try:
+            durations[index], windows = source()
+            for window in windows:
+                pending.append((index, window))
+                if len(pending) >= settings.embedding.sonic_window_batch_size:
+                    embed_pending()
+        except Exception as e:
+            outcomes[index] = e
+            # Its windows still waiting for a batch are not embedded
+            pending[:] = [entry for entry in pending if entry[0] != index]
+
+    if pending:
+        embed_pending()
+
+    for index in range(len(sources)):
+        if outcomes[index] is not None:
+            # Windows embedded before the track failed are discarded
+            continue
+        if not counts[index]:
+            outcomes[index] = ValueError("No audio decoded")
+            continue
+        outcomes[index] = (durations[index], sums[index] / counts[index])
+
+    return outcomes
+
+
+def _file_windows(data: bytes, sr: int) -> tuple[float, Iterator[np.ndarray]]:
+    audio_stream = BytesIO(data)
+    return get_audio_duration(audio_stream), decode_windows(audio_stream, sr, settings.embedding.sonic_min_tail_seconds)
+
+
+def _embed_cropped(files: list[bytes], sr: int) -> list:
+    """
+    Embed several encoded audio files in one forward pass, each from the one
+    window CLAP's processor crops (see `decode_cropped`). Only a processor
+    that fuses the whole track into its input ("fusion" truncation) gets
+    the tracks decoded whole.
+
+    Args:
+        files (list[bytes]): The encoded audio files.
+        sr (int): Sampling rate the clips are decoded to.
+
+    Returns:
+        list: Per file, a (duration in seconds, numpy.ndarray features) tuple,
+            or the exception that file raised.
+    """
+    processor, _ = get_clap()
+    feature_extractor = processor.feature_extractor
+    crop = feature_extractor.truncation == "rand_trunc"
+
+    outcomes: list = [None] * len(files)
+    clips = []
+    decoded = []
+
+    for index, data in enumerate(files):
+        try:
+            duration = get_audio_duration(BytesIO(data))
+            if crop:
+                clips.append(decode_cropped(BytesIO(data), sr, feature_extractor.nb_max_samples))
+            else:
+                clips.append(decode_audio(BytesIO(data), sr))
+            decoded.append((index, duration))
+        except Exception as e:
+            outcomes[index] = e
+
+    if clips:
+        features = extract_audio_features_batch(clips, sr)
+        for (index, duration), feature in zip(decoded, features):
+            outcomes[index] = (duration, feature)
+
+    return outcomes
+
+
+def embed_audio_files(files: list[bytes], sr: int = 48000) -> list:
+    """
+    Embed several encoded audio files. By default each is embedded from the
+    one window the processor crops, as the stored embeddings were, decoding
+    only that window's worth of samples (see `decode_cropped`); with
+    `sonic_window_pooling` each is embedded as the mean of the CLAP
+    embeddings of its consecutive windows (see `decode_windows`). Memory is
+    bounded either way.
+    Meant to run in an inference process (see utils.executor): the decoding
+    happens there too, and only the compressed files and the results cross
+    the process boundary.
+
+    Args:
+        files (list[bytes]): The encoded audio files (e.g. MP3) as downloaded.
+        sr (int): Sampling rate the audio is decoded to.
+
+    Returns:
+        list: Per file, a (duration in seconds, numpy.ndarray features) tuple,
+            or the exception that file raised, so one corrupt file fails only its job.
+    """
+    if not settings.embedding.sonic_window_pooling:
+        return _embed_cropped(files, sr)
+    return _embed_pooled([functools.partial(_file_windows, data, sr) for data in files], sr)
+
+
+def embed_audio_objects(object_keys: list[str], sr: int = 48000) -> list:
+    """
+    Embed several audio objects of the S3 bucket as the mean of a few
+    sampled windows each (see `decode_sampled_windows`), read with
+    byte-range GETs instead of downloading the whole files. Always pooled,
+    whatever `sonic_window_pooling`. Meant to run in an inference process.
+
+    Args:
+        object_keys (list[str]): Keys of the audio objects.
+        sr (int): Sampling rate the windows are decoded to.
+
+    Returns:
+        list: Per object, a (duration in seconds, numpy.ndarray features) tuple,
+            or the exception that object raised.
+    """
+    readers: list[S3RangeReader] = []
+
+    def sampled_windows(object_key: str) -> tuple[float, Iterator[np.ndarray]]:
+        reader = S3RangeReader(
+            settings.s3_storage.s3_bucket_name,
+            object_key,
+            block_size=settings.embedding.sonic_range_block_bytes,
+        )
+        readers.append(reader)
+        return decode_sampled_windows(reader, sr, settings.embedding.sonic_sample_windows)
+
+    outcomes = _embed_pooled([functools.partial(sampled_windows, key) for key in object_keys], sr)
 
-    return emb
+    for reader in readers:
+        print(f"Sampled {reader.object_key}: fetched {reader.bytes_fetched} of {reader.size} bytes "
+              f"({reader.bytes_fetched / max(1, reader.size):.0%}) in {reader.requests} range requests")
+    return outcomes
@@ -1,4 +1,5 @@
 import os
+import threading
 import torch
 from sentence_transformers import SentenceTransformer
 
@@ -29,9 +30,48 @@ def load_model(model_path: str) -> SentenceTransformer:
 # Define the model path
 model_path = './models/all-MiniLM-L6-v2'
 
-# Load the model (either from local path or download)
-model = load_model(model_path)
-print(f"Model Loaded successfully")
+# Loaded by get_model() on first use (or by warm_up() at start-up), not at import
+_model: SentenceTransformer | None = None
+_model_lock = threading.Lock()
+
+
+def get_model() -> SentenceTransformer:
+    """
+    Return the shared SentenceTransformer model, loading it on first use.
+
+    Returns:
+        SentenceTransformer: The loaded model.
+    """
+    global _model
+
+    if _model is not None:
+        return _model
+
+    with _model_lock:
+        if _model is None:
+            # Load the model (either from local path or download)
+            _model = load_model(model_path)
+            print(f"Model Loaded successfully")
+    return _model
+
+
+def is_loaded() -> bool:
+    """
+    Check whether the model has been loaded.
+
+    Returns:
+        bool: True once get_model() has loaded the model.
+    """
+    return _model is not None
+
+
+def warm_up() -> None:
+    """
+    Load the model and run one encode, so the first job does not pay for
+    loading the weights or for the first forward pass.
+    """
+    get_model().encode(["warm-up"], convert_to_tensor=True)
+
 
 def embed_text(text: str) -> torch.Tensor:
     """
@@ -43,5 +83,33 @@ def embed_text(text: str) -> torch.Tensor:
     Returns:
         torch.Tensor: Tensor containing the embedding.
     """
-    embedding = model.encode([text], convert_to_tensor=True)[0]
+    embedding = get_model().encode([text], convert_to_tensor=True)[0]
     return embedding
+
+
+def embed_texts(texts: list[str]) -> torch.Tensor:
+    """
+    Embed many texts in one forward pass per `len(texts)` batch, which uses
+    the model far better than encoding them one at a time.
+
+    Args:
+        texts (list[str]): Texts to be embedded.
+
+    Returns:
+        torch.Tensor: Tensor of shape (len(texts), dimensions), in input order.
+    """
+    return get_model().encode(texts, convert_to_tensor=True, batch_size=len(texts))
+
+
+def embed_text_vectors(texts: list[str]) -> list[list[float]]:
+    """
+    Embed many texts into plain lists, the form returned from an inference
+    process (see utils.executor) and stored in the database.
+
+    Args:
+        texts (list[str]): Texts to be embedded.
+
+    Returns:
+        list[list[float]]: One embedding per text, in input order.
+    """
+    return embed_texts(texts).tolist()
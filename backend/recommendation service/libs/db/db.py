@@ -1,14 +1,15 @@
 """
 Database connection using psycopg2 and pgvector.
 
-This script connects to the PostgreSQL database using parameters from
-the application settings and registers the pgvector extension to handle
-vector columns.
+`get_connection` connects to the PostgreSQL database using parameters from
+the application settings on first use, registers the pgvector extension to
+handle vector columns, and reconnects if the connection was closed.
 
-It prints the connected database name if successful and handles
-connection failures gracefully.
+It prints the connected database name if successful; connection failures
+are printed and raised to the caller.
 """
 
+import threading
 import psycopg2
 from psycopg2.extensions import connection as Psycopg2Connection
 from config.config import settings
@@ -23,13 +24,48 @@ db_params: dict[str, str | int] = {
     "dbname": settings.database.db_name,
 }
 
-try:
-    # Attempt to connect to the database
-    conn: Psycopg2Connection = psycopg2.connect(**db_params)
-    register_vector(conn)  # Register pgvector support
-    cursor = conn.cursor()  # type: ignore
-    # Print the database name to confirm connection
-    print(f"Connected to the database: {conn.get_dsn_parameters()['dbname']}")
-except Exception as e:
-    # Print an error if connection fails
-    print(f"I am unable to connect to the database: {e}")
+_conn: Psycopg2Connection | None = None
+_conn_lock = threading.Lock()
+
+
+def get_connection() -> Psycopg2Connection:
+    """
+    Return the shared database connection, connecting on first use or after
+    the previous connection was closed.
+
+    Returns:
+        Psycopg2Connection: An open connection with pgvector registered.
+
+    Raises:
+        psycopg2.OperationalError: If the database is unreachable.
+    """
+    global _conn
+
+    if _conn is not None and not _conn.closed:
+        return _conn
+
+    with _conn_lock:
+        if _conn is None or _conn.closed:
+            try:
+                # Attempt to connect to the database
+                conn = psycopg2.connect(**db_params)
+                register_vector(conn)  # Register pgvector support
+            except Exception as e:
+                # Print an error if connection fails
+                print(f"I am unable to connect to the database: {e}")
+                raise
+            # Print the database name to confirm connection
+            print(f"Connected to the database: {conn.get_dsn_parameters()['dbname']}")
+            _conn = conn
+    return _conn
+
+
+def is_connected() -> bool:
+    """
+    Check whether the shared connection is open, without a round trip (the
+    connection is shared with the workers, so no query is run on it).
+
+    Returns:
+        bool: True if a connection was made and has not been closed.
+    """
+    return _conn is not None and not _conn.closed
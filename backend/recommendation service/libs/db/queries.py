@@ -1,14 +1,13 @@
 """
 Minimal DB helpers for the recommendation service.
 
-Uses a psycopg2 connection `conn` from .db for simple Track/Artist/Album/Genre queries/updates.
+Uses the psycopg2 connection from .db.get_connection for simple Track/Artist/Album/Genre queries/updates.
 """
 
 import psycopg2
-from .db import conn
+from .db import get_connection
 from psycopg2.extras import RealDictCursor
 import datetime
-from libs.db.queries import get_full_track_details, update_track_metadata_embedding
 
 def get_full_track_details(track_id: str):
     """
@@ -52,6 +51,7 @@ def get_full_track_details(track_id: str):
 
 
     try:
+        conn = get_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query, (track_id,))
             row = cur.fetchone()
@@ -107,6 +107,7 @@ def update_track_metadata_embedding(track_id: str, embedding_vector):
     """
 
     try:
+        conn = get_connection()
         with conn.cursor() as cur:
             cur.execute(query, (embedding_vector, track_id))
             conn.commit()
@@ -125,6 +126,7 @@ def get_track(track_id: str):
     """
 
     try:
+        conn = get_connection()
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query, (track_id,))
             row = cur.fetchone()
@@ -153,6 +155,7 @@ def update_track_embedding_and_duration(track_id: str, embedding_vector, track_d
     """
 
     try:
+        conn = get_connection()
         with conn.cursor() as cur:
             cur.execute(query, (embedding_vector, track_duration, track_id))
             conn.commit()
@@ -1,18 +1,15 @@
 """
 Redis connection setup using the `redis-py` library.
 
-This script establishes a connection to a Redis server using parameters
-from the application settings, and prints out the connection details.
-It also constructs a connection URL for Redis using the settings.
+This script creates a Redis client using parameters from the application
+settings and constructs a connection URL for Redis. redis-py opens its
+first connection on the first command, so importing this module does not
+touch the network; `connect_redis` connects (and reports it) at start-up.
 """
 
 from redis import Redis
 from config.config import settings
 
-# Print Redis connection details
-print("Connecting to Redis at "
-      f"{settings.redis.host}:{settings.redis.port}, DB: {settings.redis.db}")
-
 # Establish a Redis connection
 redis_connection: Redis = Redis(
     settings.redis.host,
@@ -26,3 +23,15 @@ connection_url: str = (
     f"redis://:{settings.redis.password}@"
     f"{settings.redis.host}:{settings.redis.port}/{settings.redis.db}"
 )
+
+
+def connect_redis() -> None:
+    """
+    Open the first Redis connection and print its details.
+
+    Raises:
+        redis.exceptions.ConnectionError: If Redis is unreachable.
+    """
+    print("Connecting to Redis at "
+          f"{settings.redis.host}:{settings.redis.port}, DB: {settings.redis.db}")
+    redis_connection.ping()
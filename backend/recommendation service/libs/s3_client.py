@@ -1,26 +1,45 @@
 """
 S3 client connection setup using the `boto3` library.
 
-This script attempts to create an S3 client using the configuration from
-the application settings. If successful, it will allow interaction with
-S3-compatible services. If an error occurs, it gracefully handles it and
-sets the client to `None`.
+The S3 client is created on first use by `get_client`, using the
+configuration from the application settings, rather than at import:
+building a boto3 client loads the botocore service model, which slows
+down start-up. If an error occurs, it is printed and `None` is returned.
 """
 
+import threading
 import boto3
 from boto3.client import S3Client  # type: ignore
 from config.config import settings
 
-try:
-    # Initialize the S3 client
-    client: S3Client = boto3.client(
-        's3',
-        endpoint_url=settings.s3_storage.s3_endpoint,
-        aws_access_key_id=settings.s3_storage.s3_access_key_id,
-        aws_secret_access_key=settings.s3_storage.s3_secret_access_key,
-        region_name=settings.s3_storage.s3_region
-    )
-except Exception as error:
-    # If initialization fails, print error and set client to None
-    print("Failed to create S3 client: ", error)
-    client: S3Client | None = None
+_client: S3Client | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> S3Client | None:
+    """
+    Return the shared S3 client, creating it on first use.
+
+    Returns:
+        S3Client | None: The S3 client, or None if it could not be created.
+    """
+    global _client
+
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            try:
+                # Initialize the S3 client
+                _client = boto3.client(
+                    's3',
+                    endpoint_url=settings.s3_storage.s3_endpoint,
+                    aws_access_key_id=settings.s3_storage.s3_access_key_id,
+                    aws_secret_access_key=settings.s3_storage.s3_secret_access_key,
+                    region_name=settings.s3_storage.s3_region
+                )
+            except Exception as error:
+                # If initialization fails, print error and leave the client unset
+                print("Failed to create S3 client: ", error)
+    return _client
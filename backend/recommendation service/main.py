@@ -1,12 +1,42 @@
+import time
+
+# Taken before the heavy imports, so start-up timings cover them
+_import_started = time.perf_counter()
+
 import asyncio
+from libs.db.db import get_connection
+from libs.redis import connect_redis
+from libs.s3_client import get_client
+from utils.executor import metadata_pool, sonic_pool
+from utils.health_server import mark_imported, mark_started, start_health_server
 from workers.metadata_worker import metadata_embedding_worker
 from workers.sonic_worker import sonic_embedding_worker
 
+mark_imported(_import_started)
+
+
+def warm_up():
+    """
+    Connect the clients and start the inference processes, each loading and
+    warming up its model, before any job is taken. A failure here stops
+    start-up, since the workers cannot run without them.
+    """
+    connect_redis()
+    get_connection()
+    get_client()
+    metadata_pool.warm_up()
+    sonic_pool.warm_up()
+
+
 async def main():
     """
     Main function that coordinates the execution of embedding tasks.
 
-    This function gathers and runs multiple asynchronous tasks concurrently, 
+    The health probes start first, so /livez answers while the models load;
+    the workers only subscribe to their queues once warm_up() finished, so
+    no job is taken (and /readyz does not pass) before the models are loaded.
+
+    This function then gathers and runs multiple asynchronous tasks concurrently, 
     including the metadata embedding worker and the sonic embedding worker.
     It waits for all tasks to complete before exiting.
 
@@ -19,6 +49,12 @@ async def main():
     Returns:
         None
     """
+    start_health_server()
+
+    # Model loading blocks for seconds; keep the event loop free meanwhile
+    await asyncio.to_thread(warm_up)
+    mark_started(_import_started)
+
     # Define the tasks to be executed concurrently
     tasks = [
         metadata_embedding_worker(),
@@ -26,7 +62,11 @@ async def main():
     ]
 
     # Wait for all tasks to complete and handle them concurrently
-    await asyncio.gather(*tasks)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        metadata_pool.shutdown()
+        sonic_pool.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The service imports its packages (config, libs, utils, embeddings) from its own directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,184 @@
+"""
+The default sonic path streams each track and keeps only the window CLAP's
+processor crops (decode_cropped), instead of decoding the whole track
+first. Its embeddings must match the decode-whole path the stored
+embeddings came from. These tests run both paths through the real CLAP
+feature extractor and a stand-in for the model (a fixed projection of the
+log-mel input), seeded identically, on generated short and long tracks.
+
+Run from the recommendation service directory:
+
+    python -m pytest tests
+"""
+import io
+import tracemalloc
+import numpy as np
+import pytest
+import soundfile
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("librosa")
+
+from embeddings import audio_embedding
+from embeddings.audio_embedding import _embed_pooled, decode_audio, decode_cropped, embed_audio_files, extract_audio_features_batch
+from config.config import settings
+
+SR = 48000
+# Cosine similarity the default path must reach against the decode-whole path
+COSINE_TOLERANCE = 0.9999
+
+
+class _Processor:
+    # ClapProcessor's audio half, without the tokenizer (which needs a download)
+    def __init__(self):
+        self.feature_extractor = transformers.ClapFeatureExtractor(truncation="rand_trunc")
+
+    def __call__(self, audios, sampling_rate, return_tensors):
+        return self.feature_extractor(audios, sampling_rate=sampling_rate, return_tensors=return_tensors)
+
+
+class _Model:
+    # Deterministic stand-in for get_audio_features: a fixed projection of the
+    # mean log-mel frame, sensitive to which part of the track was cropped
+    def __init__(self):
+        generator = torch.Generator().manual_seed(0)
+        self.projection = torch.randn(64, 512, generator=generator)
+
+    def get_audio_features(self, input_features, **kwargs):
+        return input_features.mean(dim=(1, 2)) @ self.projection
+
+
+@pytest.fixture(autouse=True)
+def clap(monkeypatch):
+    monkeypatch.setattr(audio_embedding, "_clap", (_Processor(), _Model()))
+    monkeypatch.setattr(settings.embedding, "sonic_window_pooling", False)
+
+
+def _track(seconds: float, sample_rate: int = 44100, channels: int = 2, format: str = "MP3") -> bytes:
+    # Tones that change every second plus noise, so each crop offset differs
+    rng = np.random.default_rng(int(seconds))
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 220 * 2 ** (np.floor(t) % 12 / 12)
+    mono = 0.3 * np.sin(2 * np.pi * pitch * t) + 0.05 * rng.standard_normal(len(t))
+    samples = np.stack([mono * (1 - 0.3 * c) for c in range(channels)], axis=1).astype(np.float32)
+    data = io.BytesIO()
+    soundfile.write(data, samples, sample_rate, format=format)
+    return data.getvalue()
+
+
+def _embed_whole(files: list[bytes]) -> list[np.ndarray]:
+    # The path the stored embeddings came from: whole decode, the processor crops
+    return extract_audio_features_batch([decode_audio(io.BytesIO(data), SR) for data in files], SR)
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+@pytest.mark.parametrize("seconds", [4, 35])
+@pytest.mark.parametrize("format", ["MP3", "FLAC"])
+def test_cropped_clip_matches_whole_decode(seconds, format):
+    data = _track(seconds, format=format)
+    max_length = _Processor().feature_extractor.nb_max_samples
+
+    whole = decode_audio(io.BytesIO(data), SR)
+    np.random.seed(7)
+    clip = decode_cropped(io.BytesIO(data), SR, max_length)
+
+    if len(whole) <= max_length:
+        expected = whole
+    else:
+        # The processor's own "rand_trunc" draw
+        np.random.seed(7)
+        start = np.random.randint(0, len(whole) - max_length + 1)
+        expected = whole[start:start + max_length]
+
+    assert len(clip) == len(expected)
+    np.testing.assert_allclose(clip, expected, atol=1e-5)
+
+
+def test_embeddings_match_decode_whole_path():
+    files = [_track(4), _track(35), _track(62.5, sample_rate=48000, channels=1, format="FLAC")]
+
+    np.random.seed(0)
+    expected = _embed_whole(files)
+    np.random.seed(0)
+    outcomes = embed_audio_files(files, SR)
+
+    for data, feature, (duration, embedding) in zip(files, expected, outcomes):
+        assert duration == pytest.approx(soundfile.info(io.BytesIO(data)).duration, abs=0.05)
+        assert _cosine(embedding, feature) >= COSINE_TOLERANCE
+        np.testing.assert_allclose(embedding, feature, rtol=1e-4, atol=1e-4)
+
+
+def test_corrupt_file_fails_only_its_track():
+    outcomes = embed_audio_files([b"not audio", _track(4)], SR)
+
+    assert isinstance(outcomes[0], Exception)
+    assert outcomes[1][1].shape == (512,)
+
+
+def test_cropped_decode_memory_is_bounded():
+    data = _track(180, format="FLAC")
+    whole_bytes = 180 * SR * 4
+
+    tracemalloc.start()
+    decode_cropped(io.BytesIO(data), SR, _Processor().feature_extractor.nb_max_samples)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # One window (1.9 MB) and a decode block, not the 35 MB track
+    assert peak < whole_bytes / 4
+
+
+def _windows(count: int, fail_after: int | None = None):
+    # A track source yielding `count` constant windows (values 1, 2, ...)
+    def windows():
+        for index in range(count):
+            if index == fail_after:
+                raise ValueError("undecodable frame")
+            yield np.full(8, index + 1, dtype=np.float32)
+    return lambda: (count * 10.0, windows())
+
+
+def _failing_model(monkeypatch, failing_calls: set) -> list:
+    calls = []
+
+    def extract(clips, sr):
+        calls.append(len(clips))
+        if len(calls) in failing_calls:
+            raise MemoryError("out of memory")
+        return [clip[:1].copy() for clip in clips]
+
+    monkeypatch.setattr(audio_embedding, "extract_audio_features_batch", extract)
+    monkeypatch.setattr(settings.embedding, "sonic_window_batch_size", 2)
+    return calls
+
+
+def test_failed_batch_fails_every_track_in_it(monkeypatch):
+    # Batches: [a1 a2] [a3 b1] [c1 c2] [c3]; the second one fails
+    calls = _failing_model(monkeypatch, {2})
+    a, b, c = _embed_pooled([_windows(3), _windows(1), _windows(3)], SR)
+
+    assert calls == [2, 2, 2, 1]
+    assert isinstance(a, MemoryError) and isinstance(b, MemoryError)
+    assert c[0] == 30.0 and c[1][0] == pytest.approx(2.0)
+
+
+def test_failed_last_batch_does_not_raise(monkeypatch):
+    _failing_model(monkeypatch, {2})
+    a, b = _embed_pooled([_windows(2), _windows(1)], SR)
+
+    assert a[1][0] == pytest.approx(1.5)
+    assert isinstance(b, MemoryError)
+
+
+def test_undecodable_track_windows_are_dropped(monkeypatch):
+    # b fails on its second window; its first, still pending, must not reach a batch
+    calls = _failing_model(monkeypatch, set())
+    b, c = _embed_pooled([_windows(3, fail_after=1), _windows(1)], SR)
+
+    assert calls == [1]
+    assert isinstance(b, ValueError)
+    assert c[1][0] == pytest.approx(1.0)
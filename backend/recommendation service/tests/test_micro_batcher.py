@@ -0,0 +1,160 @@
+"""
+utils.micro_batcher collects the items of concurrent jobs into batches for
+one inference call. These tests check when a batch closes (on size, on
+timeout), that results go back to the job that submitted them, and that one
+bad item fails only its own job.
+
+Run from the recommendation service directory:
+
+    python -m pytest tests
+"""
+import asyncio
+import time
+import pytest
+from utils.micro_batcher import MicroBatcher
+
+
+class _Recorder:
+    # process_batch stand-in: doubles each item, fails on the ones marked bad
+    def __init__(self, bad=(), seconds: float = 0.0):
+        self.bad = set(bad)
+        self.seconds = seconds
+        self.batches = []
+
+    def __call__(self, items: list) -> list:
+        self.batches.append(list(items))
+        time.sleep(self.seconds)
+        for item in items:
+            if item in self.bad:
+                raise ValueError(f"bad item {item}")
+        return [item * 2 for item in items]
+
+
+async def _submit_all(batcher: MicroBatcher, items: list) -> list:
+    return await asyncio.gather(*(batcher.submit(item) for item in items), return_exceptions=True)
+
+
+def test_full_batch_closes_without_waiting():
+    recorder = _Recorder()
+
+    async def run():
+        batcher = MicroBatcher("test", recorder, max_size=4, max_wait=30, report_interval=0)
+        # The batch opens with one item and fills while it waits for more
+        first = asyncio.create_task(batcher.submit(1))
+        await asyncio.sleep(0.05)
+        rest = _submit_all(batcher, [2, 3, 4])
+        return await asyncio.wait_for(asyncio.gather(first, rest), timeout=5)
+
+    first, rest = asyncio.run(run())
+
+    assert [first, *rest] == [2, 4, 6, 8]
+    assert recorder.batches == [[1, 2, 3, 4]]
+
+
+def test_partial_batch_closes_after_max_wait():
+    recorder = _Recorder()
+    max_wait = 0.2
+
+    async def run():
+        batcher = MicroBatcher("test", recorder, max_size=100, max_wait=max_wait, report_interval=0)
+        return await _submit_all(batcher, [1, 2, 3])
+
+    started = time.monotonic()
+    results = asyncio.run(run())
+
+    assert results == [2, 4, 6]
+    assert recorder.batches == [[1, 2, 3]]
+    assert time.monotonic() - started >= max_wait * 0.9
+
+
+def test_late_item_joins_the_open_batch():
+    recorder = _Recorder()
+
+    async def run():
+        batcher = MicroBatcher("test", recorder, max_size=100, max_wait=0.3, report_interval=0)
+        first = asyncio.create_task(batcher.submit(1))
+        await asyncio.sleep(0.1)
+        return await asyncio.gather(first, batcher.submit(2))
+
+    assert asyncio.run(run()) == [2, 4]
+    assert recorder.batches == [[1, 2]]
+
+
+def test_backlog_splits_into_batches_of_max_size():
+    # While the only slot is busy, waiting items make up the next batches
+    recorder = _Recorder(seconds=0.05)
+
+    async def run():
+        batcher = MicroBatcher("test", recorder, max_size=4, max_wait=0.01, report_interval=0)
+        return await _submit_all(batcher, list(range(10)))
+
+    assert asyncio.run(run()) == [item * 2 for item in range(10)]
+    assert recorder.batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_bad_item_fails_only_its_own_job():
+    recorder = _Recorder(bad={3})
+
+    async def run():
+        batcher = MicroBatcher("test", recorder, max_size=4, max_wait=30, report_interval=0)
+        return await _submit_all(batcher, [1, 2, 3, 4])
+
+    results = asyncio.run(run())
+
+    assert results[:2] == [2, 4] and results[3] == 8
+    assert isinstance(results[2], ValueError) and str(results[2]) == "bad item 3"
+    # The failed batch call, then one call per item
+    assert recorder.batches == [[1, 2, 3, 4], [1], [2], [3], [4]]
+
+
+def test_wrong_result_count_is_retried_item_by_item():
+    calls = []
+
+    def drops_last(items):
+        calls.append(list(items))
+        return [item * 2 for item in items][:max(1, len(items) - 1)]
+
+    async def run():
+        batcher = MicroBatcher("test", drops_last, max_size=3, max_wait=30, report_interval=0)
+        return await _submit_all(batcher, [1, 2, 3])
+
+    assert asyncio.run(run()) == [2, 4, 6]
+    assert calls == [[1, 2, 3], [1], [2], [3]]
+
+
+def test_cancelled_job_does_not_break_its_batch():
+    recorder = _Recorder(seconds=0.1)
+
+    async def run():
+        batcher = MicroBatcher("test", recorder, max_size=3, max_wait=30, report_interval=0)
+        tasks = [asyncio.create_task(batcher.submit(item)) for item in (1, 2, 3)]
+        await asyncio.sleep(0.02)
+        tasks[1].cancel()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    assert results[0] == 2 and results[2] == 6
+    assert isinstance(results[1], asyncio.CancelledError)
+
+
+@pytest.mark.parametrize("max_concurrent", [1, 2])
+def test_batches_run_at_most_max_concurrent_at_once(max_concurrent):
+    running = []
+    peak = []
+
+    def process(items):
+        running.append(1)
+        peak.append(len(running))
+        time.sleep(0.05)
+        running.pop()
+        return items
+
+    async def run():
+        batcher = MicroBatcher(
+            "test", process, max_size=1, max_wait=30, report_interval=0, max_concurrent=max_concurrent
+        )
+        return await _submit_all(batcher, list(range(6)))
+
+    assert asyncio.run(run()) == list(range(6))
+    assert max(peak) == max_concurrent
@@ -0,0 +1,116 @@
+"""
+The sampled sonic mode seeks MP3 by byte offset: it fetches a range cut
+out of the middle of the file, resyncs on a frame header (_mp3_sync) and
+decodes from there. These tests cut a generated MP3, with an ID3 tag in
+front, at arbitrary offsets and check that the resync lands on the next
+real frame and that a sampled window decodes the audio at its position.
+
+Run from the recommendation service directory:
+
+    python -m pytest tests
+"""
+import io
+import numpy as np
+import pytest
+import soundfile
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("librosa")
+
+from embeddings.audio_embedding import _id3_size, _mp3_frame_length, _mp3_sync, _read_mp3_window
+
+RATE = 44100
+SECONDS = 40
+# Largest error of a sampled window's position, in seconds
+POSITION_TOLERANCE = 0.15
+
+
+def _id3_tag(payload_size: int) -> bytes:
+    # ID3v2.4 header with a syncsafe size, and frame header lookalikes as payload
+    size = bytes((payload_size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + size + b"\xff\xfb\x90\x00" * (payload_size // 4)
+
+
+@pytest.fixture(scope="module")
+def track() -> tuple[bytes, int, np.ndarray]:
+    # A pitch that changes every half second plus noise, so positions are unambiguous
+    rng = np.random.default_rng(0)
+    t = np.arange(SECONDS * RATE) / RATE
+    pitch = 220 * 2 ** (rng.integers(0, 24, SECONDS * 2)[(t * 2).astype(int)] / 12)
+    mono = 0.3 * np.sin(2 * np.pi * np.cumsum(pitch) / RATE) + 0.02 * rng.standard_normal(len(t))
+    encoded = io.BytesIO()
+    soundfile.write(encoded, np.stack([mono, mono], axis=1).astype(np.float32), RATE, format="MP3")
+
+    tag = _id3_tag(4096)
+    reference, _ = soundfile.read(io.BytesIO(encoded.getvalue()), dtype="float32")
+    return tag + encoded.getvalue(), len(tag), reference.mean(axis=1)
+
+
+def _frame_offsets(data: bytes, audio_start: int) -> list[int]:
+    offsets = []
+    position = audio_start
+    while length := _mp3_frame_length(data, position):
+        offsets.append(position)
+        position += length
+    return offsets
+
+
+class _Reader:
+    # The part of S3RangeReader that _read_mp3_window uses
+    def __init__(self, data: bytes):
+        self.data = data
+        self.size = len(data)
+
+    def read_range(self, start: int, length: int) -> bytes:
+        return self.data[start:start + length]
+
+
+def test_id3_size_skips_the_tag(track):
+    data, tag_size, _ = track
+
+    assert _id3_size(data[:10]) == tag_size
+    # A footer adds 10 bytes; no tag takes none
+    assert _id3_size(data[:5] + bytes([data[5] | 0x10]) + data[6:10]) == tag_size + 10
+    assert _id3_size(data[tag_size:tag_size + 10]) == 0
+
+
+def test_frames_tile_the_audio(track):
+    data, tag_size, _ = track
+    offsets = _frame_offsets(data, tag_size)
+
+    # Walking frame lengths from the first frame ends exactly at the end of the file
+    assert offsets[-1] + _mp3_frame_length(data, offsets[-1]) == len(data)
+
+
+def test_sync_finds_the_next_frame_at_any_offset(track):
+    data, tag_size, _ = track
+    offsets = np.array(_frame_offsets(data, tag_size))
+    cuts = np.random.default_rng(1).integers(tag_size, offsets[-3], 300)
+
+    for cut in cuts:
+        expected = offsets[np.searchsorted(offsets, cut)]
+        assert cut + _mp3_sync(data[cut:]) == expected, f"cut at byte {cut}"
+
+
+def test_sync_rejects_data_without_frames():
+    with pytest.raises(ValueError):
+        _mp3_sync(np.random.default_rng(2).integers(0, 255, 5000, dtype=np.uint8).tobytes())
+
+
+@pytest.mark.parametrize("fraction", [0.0, 0.13, 0.5, 0.71])
+def test_sampled_window_decodes_its_position(track, fraction):
+    data, tag_size, reference = track
+    duration = len(reference) / RATE
+
+    samples, rate = _read_mp3_window(_Reader(data), tag_size, fraction, duration)
+    window = samples.mean(axis=1)
+    assert rate == RATE and len(window) > 9 * RATE
+
+    # Find where the start of the window sits in the whole-file decode
+    target = int(fraction * duration * RATE)
+    probe = window[:RATE // 2]
+    search = reference[max(0, target - RATE):target + 2 * RATE]
+    lag = int(np.argmax(np.correlate(search, probe, mode="valid"))) + max(0, target - RATE)
+
+    assert abs(lag - target) / RATE < POSITION_TOLERANCE
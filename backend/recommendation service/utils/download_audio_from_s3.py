@@ -1,6 +1,7 @@
 from io import BytesIO
 import librosa
-from libs.s3_client import client
+import soundfile
+from libs.s3_client import get_client
 
 
 def download_audio_from_s3(bucket_name: str, object_key: str,) -> BytesIO:
@@ -15,7 +16,7 @@ def download_audio_from_s3(bucket_name: str, object_key: str,) -> BytesIO:
     """
     try:
         # Fetch the object from S3
-        response = client.get_object(Bucket=bucket_name, Key=object_key)
+        response = get_client().get_object(Bucket=bucket_name, Key=object_key)
         
         # Convert the response to a BytesIO object
         audio_data = BytesIO(response['Body'].read())
@@ -28,7 +29,9 @@ def download_audio_from_s3(bucket_name: str, object_key: str,) -> BytesIO:
 
 def get_audio_duration(audio_stream: BytesIO) -> float:
     """
-    Get the duration of an audio stream using librosa.
+    Get the duration of an audio stream, from its container header when it
+    has one; otherwise the audio is decoded with librosa to measure it.
+    The stream is left at its start.
     
     Args:
         audio_stream (io.BytesIO): The audio stream (in-memory file).
@@ -36,10 +39,20 @@ def get_audio_duration(audio_stream: BytesIO) -> float:
     Returns:
         float: The duration of the audio in seconds.
     """
+    try:
+        info = soundfile.info(audio_stream)
+        if info.frames > 0:
+            return info.frames / info.samplerate
+    except Exception as e:
+        print(f"Error reading the audio header, decoding to measure the duration: {e}")
+    finally:
+        audio_stream.seek(0)
+
     # Load the audio from the stream using librosa
     audio_data, sr = librosa.load(audio_stream, sr=None)  # 'sr=None' to preserve original sample rate
     
     # Calculate the duration in seconds
     duration = librosa.get_duration(y=audio_data, sr=sr)
+    audio_stream.seek(0)
     
     return duration
@@ -0,0 +1,164 @@
+"""
+Executors that keep blocking work off the workers' asyncio event loop.
+
+- `run_db` runs psycopg2 calls on one dedicated thread. The connection is
+  shared, so calls are serialized there instead of blocking the loop.
+- `InferencePool` runs decoding and model inference in long-lived worker
+  processes, each loading its model once when it starts. They run in
+  parallel across cores, free of the GIL, while the event loop only does
+  I/O and job bookkeeping (including BullMQ lock renewal).
+"""
+
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+from config.config import settings
+
+# One thread: the psycopg2 connection is shared by every job
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recommendation-db")
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking database call on the database thread.
+
+    Args:
+        func (Callable): The function to call.
+        *args: Positional arguments for func.
+        **kwargs: Keyword arguments for func.
+
+    Returns:
+        Any: The function's return value.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(func, *args, **kwargs))
+
+
+def _init_inference_process(warm_up: Callable, threads: int):
+    # Runs once in each new worker process, before any task
+    import torch
+
+    # Processes split the cores between them instead of each using all of them
+    torch.set_num_threads(threads)
+    warm_up()
+    print(f"Inference process {os.getpid()} ready ({threads} torch threads)")
+
+
+def _process_ready() -> int:
+    return os.getpid()
+
+
+class InferencePool:
+    """
+    A pool of long-lived worker processes with a model preloaded in each.
+
+    Attributes:
+        name (str): Label used in log messages.
+        processes (int): Number of worker processes.
+    """
+
+    def __init__(self, name: str, processes: int, warm_up: Callable):
+        """
+        Args:
+            name (str): Label used in log messages.
+            processes (int): Number of worker processes.
+            warm_up (Callable): Module-level function loading (and warming up)
+                the model; it runs once in each worker process.
+        """
+        self.name = name
+        self.processes = max(1, processes)
+        self._warm_up = warm_up
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    # spawn: torch and forked threads do not mix
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_inference_process,
+                    initargs=(self._warm_up, inference_threads_per_process()),
+                )
+            return self._executor
+
+    def run(self, func: Callable, *args) -> Any:
+        """
+        Run a function in a worker process and wait for its result (blocking).
+
+        Args:
+            func (Callable): Module-level function to call.
+            *args: Picklable arguments for func.
+
+        Returns:
+            Any: The function's return value.
+
+        Raises:
+            BrokenProcessPool: If a worker process died (e.g. killed for memory);
+                the pool is replaced, so the next call starts fresh processes.
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(func, *args).result()
+        except BrokenProcessPool:
+            print(f"[{self.name}] An inference process died; restarting the pool")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def warm_up(self) -> None:
+        """
+        Start every worker process and wait until each has loaded its model.
+        """
+        executor = self._get_executor()
+        # New processes are only spawned while none is idle, and the slow
+        # initializer keeps them busy, so these land on distinct processes
+        pids = {future.result() for future in [executor.submit(_process_ready) for _ in range(self.processes)]}
+        print(f"[{self.name}] {len(pids)} inference processes ready")
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def inference_threads_per_process() -> int:
+    """
+    Torch threads per inference process: the configured value, or the cores
+    divided between all inference processes.
+
+    Returns:
+        int: The thread count.
+    """
+    if settings.embedding.inference_threads_per_process:
+        return settings.embedding.inference_threads_per_process
+
+    processes = settings.embedding.metadata_processes + settings.embedding.sonic_processes
+    return max(1, (os.cpu_count() or 1) // max(1, processes))
+
+
+# Each pool preloads only the model it serves
+def _warm_up_text_model():
+    from embeddings import data_embedder
+    data_embedder.warm_up()
+
+
+def _warm_up_audio_model():
+    from embeddings import audio_embedding
+    audio_embedding.warm_up()
+
+
+metadata_pool = InferencePool("metadata-embedding", settings.embedding.metadata_processes, _warm_up_text_model)
+sonic_pool = InferencePool("sonic-embedding", settings.embedding.sonic_processes, _warm_up_audio_model)
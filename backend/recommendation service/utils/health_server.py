@@ -0,0 +1,125 @@
+"""
+Liveness and readiness probes for the embedding workers.
+
+The workers have no HTTP app, so a small standard-library HTTP server runs
+in a daemon thread. It starts before the models are loaded:
+
+- /livez answers 200 as soon as the process is up.
+- /readyz answers 200 only once start-up finished (models loaded and
+  warmed up) and Redis and the database are reachable, 503 otherwise.
+
+Both report the import and time-to-ready timings.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config.config import settings
+from libs.db.db import is_connected
+from libs.redis import redis_connection
+
+_state: dict = {
+    "started": False,
+    "import_seconds": None,
+    "ready_seconds": None,
+}
+_last_check: dict = {"at": 0.0, "checks": None}
+_check_lock = threading.Lock()
+
+
+def mark_imported(started_at: float) -> None:
+    """
+    Record how long importing the service took.
+
+    Args:
+        started_at (float): perf_counter() value taken before the service's imports.
+    """
+    _state["import_seconds"] = round(time.perf_counter() - started_at, 3)
+
+
+def mark_started(started_at: float) -> None:
+    """
+    Record that start-up (model loading and warm-up) finished.
+
+    Args:
+        started_at (float): perf_counter() value taken before the service's imports.
+    """
+    _state["started"] = True
+    _state["ready_seconds"] = round(time.perf_counter() - started_at, 3)
+    print(f"Recommendation service ready: imported in {_state['import_seconds']}s, "
+          f"ready after {_state['ready_seconds']}s")
+
+
+def _check_dependencies() -> dict:
+    checks = {}
+
+    try:
+        redis_connection.ping()
+        checks["redis"] = "ok"
+    except Exception as e:
+        checks["redis"] = f"error: {e}"
+
+    # The connection is shared with the workers, so only its state is checked
+    checks["database"] = "ok" if is_connected() else "error: not connected"
+
+    return checks
+
+
+def readiness() -> tuple[bool, dict]:
+    """
+    Check whether the workers can take jobs. Dependency checks are cached
+    for readiness_cache_seconds.
+
+    Returns:
+        tuple[bool, dict]: Whether the service is ready, and the report served by /readyz.
+    """
+    report = {**_state, "checks": None}
+    if not _state["started"]:
+        return False, report
+
+    with _check_lock:
+        if _last_check["checks"] is None or time.monotonic() - _last_check["at"] >= settings.health.readiness_cache_seconds:
+            _last_check["checks"] = _check_dependencies()
+            _last_check["at"] = time.monotonic()
+
+    report["checks"] = _last_check["checks"]
+    return all(status == "ok" for status in report["checks"].values()), report
+
+
+class _ProbeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/livez":
+            status, body = 200, {"status": "alive"}
+        elif self.path == "/readyz":
+            ready, report = readiness()
+            status, body = (200 if ready else 503), {"status": "ready" if ready else "not ready", **report}
+        else:
+            status, body = 404, {"status": "not found"}
+
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Probes hit every few seconds; keep them out of the worker output
+        pass
+
+
+def start_health_server() -> ThreadingHTTPServer | None:
+    """
+    Serve /livez and /readyz on health_port from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer | None: The running server, or None if disabled.
+    """
+    if not settings.health.health_port:
+        return None
+
+    server = ThreadingHTTPServer(("0.0.0.0", settings.health.health_port), _ProbeHandler)
+    threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+    print(f"Health probes available on port {settings.health.health_port}")
+    return server
@@ -0,0 +1,168 @@
+"""
+Micro-batching of per-job work for the BullMQ workers.
+
+Concurrent jobs submit one item each; items are collected into a batch that
+closes at `max_size` items or `max_wait` seconds after its first item,
+whichever comes first. The batch is processed by one call on a worker
+thread and each result is handed back to the job that submitted it.
+At most `max_concurrent` batches run at once (one per inference process),
+so items arriving while they are busy make the next batch larger instead
+of competing with them for the CPU.
+"""
+
+import asyncio
+import time
+from typing import Any, Callable, Sequence
+
+
+class MicroBatcher:
+    """
+    Collect items submitted by concurrent coroutines into batches.
+
+    Attributes:
+        name (str): Label used in the throughput reports.
+        unit (str): What an item is, in the throughput reports.
+        max_size (int): Items that close a batch immediately.
+        max_wait (float): Seconds a batch stays open after its first item.
+        max_concurrent (int): Batches processed at the same time.
+        report_interval (float): Seconds between throughput reports (0 disables them).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[list], Sequence[Any]],
+        max_size: int,
+        max_wait: float,
+        report_interval: float = 60.0,
+        unit: str = "items",
+        max_concurrent: int = 1,
+    ):
+        """
+        Args:
+            name (str): Label used in the throughput reports.
+            process_batch (Callable): Blocking function mapping a list of items
+                to one result per item, in order. It runs on a worker thread.
+            max_size (int): Items that close a batch immediately.
+            max_wait (float): Seconds a batch stays open after its first item.
+            report_interval (float): Seconds between throughput reports.
+            unit (str): What an item is, in the throughput reports.
+            max_concurrent (int): Batches processed at the same time.
+        """
+        self.name = name
+        self.unit = unit
+        self.max_size = max(1, max_size)
+        self.max_wait = max_wait
+        self.report_interval = report_interval
+        self._process_batch = process_batch
+        self._pending: list[tuple[Any, asyncio.Future, float]] = []
+        self._full = asyncio.Event()
+        self._consumer: asyncio.Task | None = None
+        self.max_concurrent = max(1, max_concurrent)
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        # Throughput since the last report
+        self._items = 0
+        self._batches = 0
+        self._busy_seconds = 0.0
+        self._window_started = time.monotonic()
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Add an item to the open batch and wait for its result.
+
+        Args:
+            item (Any): The item to process.
+
+        Returns:
+            Any: The result for this item.
+
+        Raises:
+            Exception: Whatever processing this item (alone) raised.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future, time.monotonic()))
+
+        if len(self._pending) >= self.max_size:
+            self._full.set()
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.create_task(self._consume())
+
+        return await future
+
+    async def _consume(self):
+        while self._pending:
+            # Close the batch when it is full or its oldest item waited max_wait
+            remaining = self._pending[0][2] + self.max_wait - time.monotonic()
+            if len(self._pending) < self.max_size and remaining > 0:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            # Wait for a free slot; the batch keeps filling meanwhile
+            await self._slots.acquire()
+            batch, self._pending = self._pending[:self.max_size], self._pending[self.max_size:]
+            asyncio.create_task(self._run(batch))
+
+    def _process_isolated(self, items: list) -> list:
+        # One bad item must not fail the others: if the batch call raises,
+        # process the items one at a time and keep each outcome
+        try:
+            results = list(self._process_batch(items))
+            if len(results) != len(items):
+                raise ValueError(f"{len(results)} results for {len(items)} items")
+            return results
+        except Exception as e:
+            if len(items) == 1:
+                return [e]
+            print(f"[{self.name}] Batch of {len(items)} failed ({e}); retrying items one by one")
+
+        outcomes = []
+        for item in items:
+            try:
+                outcomes.append(self._process_batch([item])[0])
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    async def _run(self, batch: list[tuple[Any, asyncio.Future, float]]):
+        items = [item for item, _, _ in batch]
+
+        started = time.monotonic()
+        try:
+            outcomes = await asyncio.to_thread(self._process_isolated, items)
+        except Exception as e:
+            outcomes = [e] * len(items)
+        finally:
+            self._slots.release()
+        self._record(len(items), time.monotonic() - started)
+
+        for (_, future, _), outcome in zip(batch, outcomes):
+            if future.done():
+                # The submitting job was cancelled
+                continue
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def _record(self, items: int, seconds: float):
+        self._items += items
+        self._batches += 1
+        self._busy_seconds += seconds
+
+        elapsed = time.monotonic() - self._window_started
+        if not self.report_interval or elapsed < self.report_interval:
+            return
+
+        print(
+            f"[{self.name}] {self._items} {self.unit} in {self._batches} batches over {elapsed:.1f}s: "
+            f"{self._items / elapsed:.1f} {self.unit}/s overall, "
+            f"{self._items / self._busy_seconds if self._busy_seconds else 0:.1f} {self.unit}/s per busy batch slot, "
+            f"mean batch {self._items / self._batches:.1f}"
+        )
+        self._items = 0
+        self._batches = 0
+        self._busy_seconds = 0.0
+        self._window_started = time.monotonic()
@@ -2,9 +2,23 @@ import asyncio
 import logging
 from bullmq import Worker
 from libs.redis import connection_url
+from config.config import settings
 from libs.db.queries import update_track_metadata_embedding, get_full_track_details
 from utils.metadata_to_embedding_text import metadata_to_embedding_text
-from embeddings.data_embedder import embed_text
+from utils.micro_batcher import MicroBatcher
+from utils.executor import metadata_pool, run_db
+from embeddings.data_embedder import embed_text_vectors
+
+# Concurrent jobs share one encode call per micro-batch, run in an inference process
+embedding_batcher = MicroBatcher(
+    "metadata-embedding",
+    lambda texts: metadata_pool.run(embed_text_vectors, texts),
+    max_size=settings.embedding.metadata_batch_size,
+    max_wait=settings.embedding.metadata_batch_wait_ms / 1000,
+    report_interval=settings.embedding.embedding_report_interval,
+    unit="tracks",
+    max_concurrent=metadata_pool.processes,
+)
 
 
 async def process_audio_metadata_embedding_job(job, token):
@@ -12,7 +26,8 @@ async def process_audio_metadata_embedding_job(job, token):
     Processes a job to create and store a metadata embedding for a track.
 
     This function retrieves track details using a track ID, generates an embedding from the track metadata,
-    and updates the track with the generated metadata embedding.
+    and updates the track with the generated metadata embedding. The text is encoded together with those
+    of other concurrent jobs (see `embedding_batcher`); a text that fails only fails its own job.
 
     Parameters:
         job (dict): The job object containing job data (e.g., trackId).
@@ -32,14 +47,14 @@ async def process_audio_metadata_embedding_job(job, token):
         return {"status": "no track ID"}
 
     try:
-        track_details = get_full_track_details(track_id)
+        track_details = await run_db(get_full_track_details, track_id)
 
         embedding_text = metadata_to_embedding_text(track_details)
 
-        # Generate the embedding vector by embedding the text
-        embedding_vector = embed_text(embedding_text).tolist()
+        # Generate the embedding vector by embedding the text in the next micro-batch
+        embedding_vector = await embedding_batcher.submit(embedding_text)
 
-        update_track_metadata_embedding(track_id, embedding_vector)
+        await run_db(update_track_metadata_embedding, track_id, embedding_vector)
 
         logging.info(f"[Job {job.id}] Metadata embedding updated for track {track_id}")
         return {"status": "done"}
@@ -56,7 +71,8 @@ async def metadata_embedding_worker():
         process_audio_metadata_embedding_job,
         {
             "connection": connection_url,
-            "concurrency": 5
+            # Enough jobs in flight to fill a micro-batch
+            "concurrency": settings.embedding.metadata_worker_concurrency
         },
     )
 
@@ -1,17 +1,34 @@
 import asyncio
-from io import BytesIO
 import logging
 from bullmq import Worker
 from libs.redis import connection_url
 from config.config import settings
-from utils.download_audio_from_s3 import download_audio_from_s3, get_audio_duration
-from embeddings.audio_embedding import extract_audio_features
+from utils.download_audio_from_s3 import download_audio_from_s3
+from embeddings.audio_embedding import embed_audio_files, embed_audio_objects
 from libs.db.queries import get_track, update_track_embedding_and_duration
+from utils.micro_batcher import MicroBatcher
+from utils.executor import run_db, sonic_pool
+
+# Tracks of concurrent jobs are decoded and share CLAP forward passes in an inference process:
+# downloaded files in "full" mode, object keys (range-read there) in "sampled" mode
+SAMPLED = settings.embedding.sonic_embedding_mode == "sampled"
+clap_batcher = MicroBatcher(
+    "sonic-embedding",
+    lambda tracks: sonic_pool.run(embed_audio_objects if SAMPLED else embed_audio_files, tracks),
+    max_size=settings.embedding.sonic_batch_size,
+    max_wait=settings.embedding.sonic_batch_wait_ms / 1000,
+    report_interval=settings.embedding.embedding_report_interval,
+    unit="tracks",
+    max_concurrent=sonic_pool.processes,
+)
 
 async def process_audio_embedding_job(job, token):
     """
     Processes an audio embedding job by fetching track information, downloading the audio file, 
     extracting features, and updating the track embedding and duration.
+    The download runs on a worker thread per job; the downloaded file then joins the next batch
+    (see `clap_batcher`), which is decoded and embedded in an inference process. In sampled mode
+    nothing is downloaded here: the inference process range-reads a few windows of the object.
 
     Parameters:
         job (dict): The job object containing job data (e.g., trackId).
@@ -31,25 +48,22 @@ async def process_audio_embedding_job(job, token):
         return {"status": "no track ID"}
 
     try:
-        track = get_track(track_id)
+        track = await run_db(get_track, track_id)
 
         # Extract object ID from the audio URL in the track data
         _, object_id = track.get("audioUrl", "").split(f"{settings.s3_storage.s3_bucket_name}/", 1)
 
-        audio_stream = download_audio_from_s3(settings.s3_storage.s3_bucket_name, object_id)
+        if SAMPLED:
+            audio_duration, features = await clap_batcher.submit(object_id)
+        else:
+            # Blocking I/O, kept off the event loop so other jobs can fill the batch
+            audio_stream = await asyncio.to_thread(download_audio_from_s3, settings.s3_storage.s3_bucket_name, object_id)
 
-        # Make a copy of the audio stream to avoid modifying the original stream
-        stream_copy = BytesIO(audio_stream.getvalue())
-        
-        # Get the audio duration using the stream copy
-        audio_duration = get_audio_duration(stream_copy)
-        del stream_copy  # Free the memory used by the copy
+            # Only the compressed file crosses to the inference process, which decodes it
+            audio_duration, features = await clap_batcher.submit(audio_stream.getvalue())
+            del audio_stream
 
-  
-        features = extract_audio_features(audio_stream)
-        del audio_stream
-
-        update_track_embedding_and_duration(track_id, features, audio_duration)
+        await run_db(update_track_embedding_and_duration, track_id, features, audio_duration)
 
         # Log successful completion
         logging.info(f"[Job {job.id}] Sonic embedding updated for track {track_id}")
@@ -67,7 +81,8 @@ async def sonic_embedding_worker():
         process_audio_embedding_job,
         {
             "connection": connection_url,
-            "concurrency": 5
+            # Enough jobs decoding to fill a CLAP batch
+            "concurrency": settings.embedding.sonic_worker_concurrency
         },
     )
 